@@ -5,6 +5,7 @@
 #include "../util/nvidia-gpu-utils.h"
 #include "../util/gpu-utils.h"
 #include "../util/imc-utils.h"
+#include "../util/trace-utils.h"
 #include "../util/util.h"
 
 #define TIME_IMC 1000000L // 1 millisecond
@@ -14,6 +15,7 @@
 static int rept_index = 0;
 static int gpu_trace = 0;
 static int imc_trace = 0;
+static int binary_trace = 0;
 volatile static int attacker_core_ID;
 
 // Runs the given cpu_command
@@ -28,6 +30,51 @@ struct args_t
 	int selector;
 };
 
+// Column layouts of the binary traces
+static const struct trace_column imc_rw_columns[] = {{"read", 'f'}, {"write", 'f'}, {"time", 'i'}};
+static const struct trace_column imc_total_columns[] = {{"read_write", 'f'}, {"time", 'i'}};
+static const struct trace_column mem_columns[] = {{"rss", 'i'}, {"peak_rss", 'i'}, {"vm", 'i'}, {"peak_vm", 'i'}};
+static const struct trace_column gpu_intel_columns[] = {{"freq", 'i'}, {"busy", 'i'}, {"time", 'i'}};
+static const struct trace_column gpu_amd_columns[] = {{"freq", 'i'}, {"time", 'i'}};
+static const struct trace_column gpu_nvidia_columns[] = {{"freq", 'i'}, {"util", 'i'}, {"time", 'i'}};
+
+// Extension of the output traces: text (.out) or binary fixed records (.bin)
+static const char *trace_ext(void)
+{
+	return binary_trace ? "bin" : "out";
+}
+
+// Fill the record of one Intel IMC sample (separate or combined read/write), return its number of columns
+static inline uint32_t imc_record(union trace_value *record, double *rw, uint64_t time)
+{
+	if (imc_trace == 1)
+	{
+		record[0].f = rw[0];
+		record[1].f = rw[1];
+		record[2].i = (int64_t)time;
+		return 3;
+	}
+	record[0].f = rw[0] + rw[1];
+	record[1].i = (int64_t)time;
+	return 2;
+}
+
+// Append one Intel IMC sample to a binary trace
+static inline void write_imc_record(FILE *imc_file, double *rw, uint64_t time)
+{
+	union trace_value record[3];
+	uint32_t n_columns = imc_record(record, rw, time);
+	trace_write_record(imc_file, record, n_columns);
+}
+
+// Send one Intel IMC sample to the streaming sink
+static inline void send_imc_record(int imc_stream, double *rw, uint64_t time)
+{
+	union trace_value record[3];
+	uint32_t n_columns = imc_record(record, rw, time);
+	trace_sink_record(imc_stream, record, n_columns);
+}
+
 // Collects the amount of data passes through the memory controller during each sampling interval TIME_IMC.
 // Sample the memory usage of the target program "texture" every 1 second.
 // On intel (i7-8700 and i7-12700), we rely on the IMC perf events.
@@ -52,24 +99,48 @@ static __attribute__((noinline)) int monitor_imc(void *in)
 	// Read the memory utilization of the texture program every 1 second
 	FILE *mem_file;
 	char mem_filename[200];
-	sprintf(mem_filename, "./out/mem_%d_%06d.out", arg->selector, rept_index);
+	sprintf(mem_filename, "./out/mem_%d_%06d.%s", arg->selector, rept_index, trace_ext());
 	mem_file = fopen((char *)mem_filename, "w");
 	if (mem_file == NULL)
 	{
 		perror("Memory output file open fail");
 		return 0;
 	}
+	if (binary_trace)
+	{
+		trace_write_header(mem_file, TRACE_MEM, 4, mem_columns);
+	}
+	int mem_stream = trace_sink_stream(TRACE_MEM, 4, mem_columns, rept_index, arg->selector);
 
 	FILE *imc_file;
 	double rw[5];
 	char imc_filename[200];
-	sprintf(imc_filename, "./out/imc_%d_%06d.out", arg->selector, rept_index);
+	sprintf(imc_filename, "./out/imc_%d_%06d.%s", arg->selector, rept_index, trace_ext());
 	imc_file = fopen((char *)imc_filename, "w");
 	if (imc_file == NULL)
 	{
 		perror("IMC output file open fail");
 		return 0;
 	}
+#if ALDER
+	uint32_t imc_backend = TRACE_IMC_ALDER;
+#elif AMD
+	uint32_t imc_backend = TRACE_IMC_AMD;
+#else
+	uint32_t imc_backend = TRACE_IMC_LEGACY;
+#endif
+	if (binary_trace)
+	{
+		if (imc_trace == 1)
+			trace_write_header(imc_file, imc_backend, 3, imc_rw_columns);
+		else
+			trace_write_header(imc_file, imc_backend, 2, imc_total_columns);
+	}
+	int imc_stream;
+	if (imc_trace == 1)
+		imc_stream = trace_sink_stream(imc_backend, 3, imc_rw_columns, rept_index, arg->selector);
+	else
+		imc_stream = trace_sink_stream(imc_backend, 2, imc_total_columns, rept_index, arg->selector);
 
 // Get initial sample for IMC PMU
 #if ALDER
@@ -90,7 +161,11 @@ static __attribute__((noinline)) int monitor_imc(void *in)
 		time = get_time();
 #if ALDER
 		imc_alder_sample(rw);
-		if (imc_trace == 1)
+		if (binary_trace)
+		{
+			write_imc_record(imc_file, rw, time);
+		}
+		else if (imc_trace == 1)
 		{ // IMC read, IMC write
 			fprintf(imc_file, "%.15f, %.15f, %" PRIu64 "\n", rw[0], rw[1], time);
 		}
@@ -98,16 +173,30 @@ static __attribute__((noinline)) int monitor_imc(void *in)
 		{ // IMC read + IMC write
 			fprintf(imc_file, "%.15f, %" PRIu64 "\n", rw[0] + rw[1], time);
 		}
+		send_imc_record(imc_stream, rw, time);
 #elif AMD
 		if (imc_trace == 2)
 		{
 			amd_imc_data = amd_imc_read(attacker_core_ID);
 			double amd_imc_mib = (double)amd_imc_data / 1024.0 / 1024.0; // To MiB
-			fprintf(imc_file, "%.15f, %" PRIu64 " \n", amd_imc_mib, time);
+			union trace_value record[2] = {{.f = amd_imc_mib}, {.i = (int64_t)time}};
+			if (binary_trace)
+			{
+				trace_write_record(imc_file, record, 2);
+			}
+			else
+			{
+				fprintf(imc_file, "%.15f, %" PRIu64 " \n", amd_imc_mib, time);
+			}
+			trace_sink_record(imc_stream, record, 2);
 		}
 #else
 		imc_sample(rw);
-		if (imc_trace == 1)
+		if (binary_trace)
+		{
+			write_imc_record(imc_file, rw, time);
+		}
+		else if (imc_trace == 1)
 		{ // IMC read, IMC write
 			fprintf(imc_file, "%.15f, %.15f, %" PRIu64 "\n", rw[0], rw[1], time);
 		}
@@ -115,16 +204,28 @@ static __attribute__((noinline)) int monitor_imc(void *in)
 		{ // IMC read + IMC write
 			fprintf(imc_file, "%.15f, %" PRIu64 "\n", rw[0] + rw[1], time);
 		}
+		send_imc_record(imc_stream, rw, time);
 #endif
 
 		if ((i % 1000) == 0)
 		{
 			int rm, prm, vm, pvm;
 			getMemory(&rm, &prm, &vm, &pvm, atoi(pid));
-			fprintf(mem_file, "%d, %d, %d, %d\n", rm, prm, vm, pvm);
+			union trace_value record[4] = {{.i = rm}, {.i = prm}, {.i = vm}, {.i = pvm}};
+			if (binary_trace)
+			{
+				trace_write_record(mem_file, record, 4);
+			}
+			else
+			{
+				fprintf(mem_file, "%d, %d, %d, %d\n", rm, prm, vm, pvm);
+			}
+			trace_sink_record(mem_stream, record, 4);
 		}
 	}
 
+	trace_sink_close(imc_stream);
+	trace_sink_close(mem_stream);
 	fclose(imc_file);
 	fflush(mem_file);
 	fclose(mem_file);
@@ -145,13 +246,26 @@ static __attribute__((noinline)) int monitor_gpu(void *in)
 	FILE *gpu_file;
 	int freq_info[2];
 	char gpu_filename[200];
-	sprintf(gpu_filename, "./out/gpu_%d_%06d.out", arg->selector, rept_index);
+	sprintf(gpu_filename, "./out/gpu_%d_%06d.%s", arg->selector, rept_index, trace_ext());
 	gpu_file = fopen((char *)gpu_filename, "w");
 	if (gpu_file == NULL)
 	{
 		perror("GPU output file open fail");
 		return 0;
 	}
+#if AMD
+	if (binary_trace)
+	{
+		trace_write_header(gpu_file, TRACE_GPU_AMD, 2, gpu_amd_columns);
+	}
+	int gpu_stream = trace_sink_stream(TRACE_GPU_AMD, 2, gpu_amd_columns, rept_index, arg->selector);
+#else
+	if (binary_trace)
+	{
+		trace_write_header(gpu_file, TRACE_GPU_INTEL, 3, gpu_intel_columns);
+	}
+	int gpu_stream = trace_sink_stream(TRACE_GPU_INTEL, 3, gpu_intel_columns, rept_index, arg->selector);
+#endif
 
 // Get initial sample for iGPU PMUs
 #if AMD
@@ -174,15 +288,34 @@ static __attribute__((noinline)) int monitor_gpu(void *in)
 		// Sample AMD GPU frequency
 		freq = amd_gpu_freq();
 		int freq_int = freq / 1000000;
-		fprintf(gpu_file, "%d, %" PRIu64 " \n", freq_int, time);
+		union trace_value record[2] = {{.i = freq_int}, {.i = (int64_t)time}};
+		if (binary_trace)
+		{
+			trace_write_record(gpu_file, record, 2);
+		}
+		else
+		{
+			fprintf(gpu_file, "%d, %" PRIu64 " \n", freq_int, time);
+		}
+		trace_sink_record(gpu_stream, record, 2);
 #else
 		// Sample GPU frequency and rcs0-busy
 		int freq = read_gpu_freq(freq_info);
 		// Actual frequency, rcs0-busy, current CPU cycle
-		fprintf(gpu_file, "%d, %d, %" PRIu64 " \n", freq_info[0], freq_info[1], time);
+		union trace_value record[3] = {{.i = freq_info[0]}, {.i = freq_info[1]}, {.i = (int64_t)time}};
+		if (binary_trace)
+		{
+			trace_write_record(gpu_file, record, 3);
+		}
+		else
+		{
+			fprintf(gpu_file, "%d, %d, %" PRIu64 " \n", freq_info[0], freq_info[1], time);
+		}
+		trace_sink_record(gpu_stream, record, 3);
 #endif
 	}
 
+	trace_sink_close(gpu_stream);
 	fclose(gpu_file);
 
 	return 0;
@@ -199,13 +332,18 @@ static __attribute__((noinline)) int monitor_nvidia_gpu(void *in)
 	// Create the output file for NVIDIA GPU trace
 	FILE *gpu_file;
 	char gpu_filename[200];
-	sprintf(gpu_filename, "./out/nvidia_gpu_%d_%06d.out", arg->selector, rept_index);
+	sprintf(gpu_filename, "./out/nvidia_gpu_%d_%06d.%s", arg->selector, rept_index, trace_ext());
 	gpu_file = fopen((char *)gpu_filename, "w");
 	if (gpu_file == NULL)
 	{
 		perror("NVIDIA GPU output file open fail");
 		return 0;
 	}
+	if (binary_trace)
+	{
+		trace_write_header(gpu_file, TRACE_GPU_NVIDIA, 3, gpu_nvidia_columns);
+	}
+	int gpu_stream = trace_sink_stream(TRACE_GPU_NVIDIA, 3, gpu_nvidia_columns, rept_index, arg->selector);
 
 	uint64_t total_run = arg->iters * TIME_IMC / TIME_GPU;
 	uint64_t time;
@@ -223,14 +361,71 @@ static __attribute__((noinline)) int monitor_nvidia_gpu(void *in)
 		int util = nvidia_gpu_utilization(0);
 		
 		// Frequency (MHz), Utilization (%), timestamp
-		fprintf(gpu_file, "%d, %d, %" PRIu64 " \n", freq, util, time);
+		union trace_value record[3] = {{.i = freq}, {.i = util}, {.i = (int64_t)time}};
+		if (binary_trace)
+		{
+			trace_write_record(gpu_file, record, 3);
+		}
+		else
+		{
+			fprintf(gpu_file, "%d, %d, %" PRIu64 " \n", freq, util, time);
+		}
+		trace_sink_record(gpu_stream, record, 3);
 	}
 
+	trace_sink_close(gpu_stream);
 	fclose(gpu_file);
 
 	return 0;
 }
 
+// Write a JSON string, escaping quotes and backslashes
+static void write_json_string(FILE *file, const char *s)
+{
+	fputc('"', file);
+	for (; *s; s++)
+	{
+		if (*s == '"' || *s == '\\')
+			fputc('\\', file);
+		fputc(*s, file);
+	}
+	fputc('"', file);
+}
+
+/*
+ * Write ./out/metadata.json: the measured TSC frequency and the sampling parameters
+ * of the experiment. util/metadata_utils.py adds the CPU, GPU and kernel of the machine,
+ * and the analysis scripts convert the timestamps with this TSC frequency.
+ */
+static void write_metadata(uint64_t iters, int outer, char **selectors, int num_selectors)
+{
+	FILE *file = fopen("./out/metadata.json", "w");
+	if (file == NULL)
+	{
+		perror("metadata fopen error");
+		return;
+	}
+#if ALDER
+	const char *imc_backend = "imc_alder";
+#elif AMD
+	const char *imc_backend = "imc_amd";
+#else
+	const char *imc_backend = "imc_legacy";
+#endif
+	fprintf(file, "{\n\t\"tsc_hz\": %.0f,\n\t\"tsc_source\": \"measured\",\n", tsc_frequency());
+	fprintf(file, "\t\"sampling\": {\"gpu\": %d, \"imc\": %d, \"imc_backend\": \"%s\", \"samples\": %" PRIu64 ", \"outer\": %d, \"binary\": %d, ",
+			gpu_trace, imc_trace, imc_backend, iters, outer, binary_trace);
+	fprintf(file, "\"imc_period_ns\": %ld, \"gpu_period_ns\": %ld},\n", TIME_IMC, TIME_GPU);
+	fprintf(file, "\t\"selectors\": [");
+	for (int i = 0; i < num_selectors; i++)
+	{
+		fprintf(file, i ? ", " : "");
+		write_json_string(file, selectors[i]);
+	}
+	fprintf(file, "]\n}\n");
+	fclose(file);
+}
+
 void read_selectors(char *filename, char **selectors, int *num_selectors)
 {
 	// Open the selector file
@@ -256,9 +451,9 @@ void read_selectors(char *filename, char **selectors, int *num_selectors)
 int main(int argc, char *argv[])
 {
 	// Check arguments
-	if (argc != 5)
+	if (argc < 5 || argc > 7)
 	{
-		fprintf(stderr, "Wrong Input! Enter: %s  <gpu> <imc> <samples> <outer>\n", argv[0]);
+		fprintf(stderr, "Wrong Input! Enter: %s  <gpu> <imc> <samples> <outer> [binary] [sink]\n", argv[0]);
 		exit(EXIT_FAILURE);
 	}
 
@@ -284,9 +479,22 @@ int main(int argc, char *argv[])
 		exit(1);
 	}
 
+	// 1 if write binary fixed-record traces (.bin) instead of text (.out)
+	if (argc >= 6)
+	{
+		sscanf(argv[5], "%d", &binary_trace);
+	}
+
+	// Also stream every sample to a Unix domain socket or FIFO (see util/trace_consumer.py)
+	if (argc == 7 && trace_sink_open(argv[6]) != 0)
+	{
+		exit(EXIT_FAILURE);
+	}
+
 	int num_selectors = 0;
 	char *selectors[1000];
 	read_selectors("input.txt", selectors, &num_selectors);
+	write_metadata(arg.iters, outer, selectors, num_selectors);
 
 	// Set the scheduling priority to high to avoid interruptions
 	// (lower priorities cause more favorable scheduling, and -20 is the max)
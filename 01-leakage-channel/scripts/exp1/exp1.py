@@ -3,153 +3,231 @@ warnings.simplefilter(action='ignore', category=FutureWarning)
 
 import numpy as np
 import os
-import glob
 import argparse
-import cpuinfo
+import datetime
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "../../../util"))
+import adjust_utils
+import align_utils
+import bootstrap_utils
+import cache_utils
+import catalog_utils
+import filter_utils
+import follow_utils
+import frame_utils
+import metadata_utils
+import pool_utils
+import profile_utils
+import report_utils
+import roc_utils
+import segment_utils
+import stats_utils
+import trace_utils
+
+# Bump when parse_arrays changes its output (invalidates cached results)
+PARSER_VERSION = 3
+
+# Texture selector -> texture name
+PATTERN_NAMES = {0: "Black", 1: "Random", 100: "Gradient", 101: "Skew"}
 
 # Parse a pair of IMC and time trace. 
-# Identify the block of IMC data that belongs to the same frame
+# Identify the block of IMC data that belongs to the same frame,
+# and the GPU frequency and RSS readings of the frame (see align_utils.py)
+def parse_arrays(imc, mem, time, gpu, CPUFreq):
+    begin, end = trace_utils.load_time(time)
+    imc_time, imc_values = trace_utils.load_imc(imc)
+    imc_total, time_total, _, _ = frame_utils.aggregate_frames(imc_time, imc_values[:, 0], begin, end, CPUFreq)
+
+    mem = trace_utils.load_mem(mem)
+    gpu = trace_utils.load_gpu(gpu)
+    n_frames = len(time_total)
+    frames = align_utils.frame_table(begin[:n_frames], end[:n_frames], {'render_time': time_total, 'traffic': imc_total},
+                                     gpu, mem, align_utils.mem_times(imc_time))
+
+    # We only parse the Peak resident set size, and the GPU frequency
+    return frames, mem['peak_rss'], gpu['freq']
+
+
 def parse_files(imc, mem, time, gpu, CPUFreq):
-    intervals = []
-    with open(time) as f:
-        for line in f:
-            begin = int(line)
-            end = 0
-            try:
-                end = next(f)
-            except StopIteration:    
-                break
-            if(len(end) > 1):
-                intervals.append((begin, int(end)))
-
-    counter = 0
-    imc_sum = 0
-    time_total = []
-    imc_total = []
-    with open(imc) as f:
-        for line in f:
-            curr_imc = float(line.strip().split(",")[0])
-            curr_time = int(line.strip().split(",")[1])
-            if(counter>=len(intervals)):
-                break
-            # A new frame
-            if(curr_time>=intervals[counter][1]):
-                imc_total.append(imc_sum*1.04858) # MiB to MB
-                time_total.append(float(intervals[counter][1]-intervals[counter][0])/(1000000*CPUFreq))
-                counter = counter + 1
-                imc_sum = 0
-            elif(curr_time>=intervals[counter][0]):
-                imc_sum = imc_sum + curr_imc
-
-    mem_total = []
-    # We only parse the Peak resident set size
-    with open(mem) as f:
-        for line in f:
-            curr_peakRSS = int(line.strip().split(", ")[1])
-            mem_total.append(curr_peakRSS)
-
-    # Parse GPU frequency
-    gpu_total = []
-    with open(gpu) as f:
-        for line in f:
-            curr_gpu = int(line.strip().split(", ")[0])
-            gpu_total.append(curr_gpu)
-
-    return time_total, imc_total, mem_total, gpu_total
-
-
-
-def parse_result(all_imc, all_mem, all_time, all_gpu):
+    return cache_utils.cached("exp1", PARSER_VERSION, [imc, mem, time, gpu], [CPUFreq], parse_arrays, imc, mem, time, gpu, CPUFreq)
+
+
+# Parse a run in the worker, and keep its steady-state frames, then those at a stable GPU frequency.
+# Also returns the segments of the run, and a QuantileSketch of the rendering times
+# of the frames kept: merged over the runs of a texture, it gives the bounds of
+# the time filter before all the frames are gathered
+def parse_run(imc, mem, time, gpu, CPUFreq, args):
+    frames, mem_peak, gpu_freq = parse_files(imc, mem, time, gpu, CPUFreq)
+    steady, segments = segment_utils.steady_mask((frames['render_time'], frames['traffic'], frames['gpu_freq']), args)
+    frames = align_utils.select_frames(frames[steady], args)
+    sketch = stats_utils.QuantileSketch(args.quantile_error, args.exact_quantiles).update(frames['render_time'])
+    return frames, mem_peak, gpu_freq, segments, sketch
+
+
+# all_time holds the rendering times of each label within the bounds of the leading
+# percentile stage of the time filter (see filter_utils.split_chain), time_filter is the
+# rest of that chain and value_filter the filter chain of the mem/gpu samples.
+# frame_mem and frame_gpu optionally hold the readings of every frame (--frame-readings),
+# and time_gpu the GPU frequency of the frames in all_time.
+# Returns the filtered per-frame samples of each texture, for bootstrap_utils.compare_cells
+@profile_utils.profiled
+def parse_result(all_imc, all_mem, all_time, all_gpu, time_filter, value_filter, frame_mem=None, frame_gpu=None, time_gpu=None):
 
     # Setting up texture selector -> texture name
-    selector={}
-    selector[0] = "Black"
-    selector[1] = "Random"
-    selector[100] = "Gradient"
-    selector[101] = "Skew"
+    selector = PATTERN_NAMES
+    frames = {}
 
     # Parse data
     for label, trace in all_imc.items():
         
-        # Filter time outliers (for the plot)
-        time_filtered = []
-        imc_filtered = []
-        
-        time_low = np.percentile(all_time[label], 5)
-        time_high = np.percentile(all_time[label], 95)
-
-        for curr_time_counter in range(len(all_time[label])):
-            curr_time = all_time[label][curr_time_counter]
-            if ( (curr_time>=time_low) and (curr_time<=time_high)):
-                time_filtered.append(curr_time)
-                imc_filtered.append(trace[curr_time_counter])
-        
-        # Filter mem outliers 
-        mem_filtered = []
-        mem_mean = np.mean(all_mem[label])
-        mem_std = np.std(all_mem[label])
-        for curr_mem in all_mem[label]:
-            if ( abs(curr_mem-mem_mean) <= 4*mem_std):
-                mem_filtered.append(curr_mem)
-
-        # Filter gpu outliers 
-        gpu_filtered = []
-        gpu_mean = np.mean(all_gpu[label])
-        gpu_std = np.std(all_gpu[label])
-        for curr_gpu in all_gpu[label]:
-            if ( abs(curr_gpu-gpu_mean) <= 4*gpu_std):
-                gpu_filtered.append(curr_gpu)
+        with profile_utils.stage("filter", selector[label]):
+            # Filter time outliers (for the plot), and the traffic of the same frames
+            time_filtered, imc_filtered = filter_utils.apply_chain(time_filter, all_time[label], trace)
+
+            # Filter mem and gpu outliers
+            mem_filtered = filter_utils.apply_chain(value_filter, all_mem[label])
+            gpu_filtered = filter_utils.apply_chain(value_filter, all_gpu[label])
+
+        frames[selector[label]] = {"DRAM traffic per frame (MB)": imc_filtered, "Rendering time per frame (ms)": time_filtered}
+        with profile_utils.stage("stats", selector[label]):
+            stats = {
+                "dram_traffic_mb": report_utils.mean_std(imc_filtered),
+                "rendering_time_ms": report_utils.mean_std(time_filtered),
+                "peak_rss_kib": report_utils.mean_std(mem_filtered),
+                "gpu_freq_mhz": report_utils.mean_std(gpu_filtered),
+                "frames": len(time_filtered),
+            }
+            if frame_gpu is not None:
+                # The readings of the frames the time filter keeps, and of the frames without mem/gpu outliers
+                _, gpu_frames = filter_utils.apply_chain(time_filter, all_time[label], time_gpu[label])
+                gpu_corr = np.corrcoef(time_filtered, gpu_frames)[0, 1] if np.std(time_filtered) > 0 and np.std(gpu_frames) > 0 else np.nan
+                frame_mem_filtered = filter_utils.apply_chain(value_filter, frame_mem[label])
+                frame_gpu_filtered = filter_utils.apply_chain(value_filter, frame_gpu[label])
+                stats.update({
+                    "frame_peak_rss_kib": report_utils.mean_std(frame_mem_filtered),
+                    "frame_gpu_freq_mhz": report_utils.mean_std(frame_gpu_filtered),
+                    "rendering_time_gpu_freq_corr": gpu_corr,
+                })
+            report_utils.record(selector[label], stats)
+        if report_utils.stats_only():
+            continue
 
         print("%s: \n\tDRAM traffic per frame (MB): %2f +- %5f \n\tRendering time per frame (ms): %2f +- %5f \n\tPeak RSS (KiB): %2f +- %5f \n\tGPU frequency (MHz): %2f +- %5f" % (selector[label], np.mean(imc_filtered), np.std(imc_filtered), np.mean(time_filtered), np.std(time_filtered), np.mean(mem_filtered), np.std(mem_filtered), np.mean(gpu_filtered), np.std(gpu_filtered) ))
+        if frame_gpu is not None:
+            print("\tPeak RSS per frame (KiB): %2f +- %5f \n\tGPU frequency per frame (MHz): %2f +- %5f \n\tRendering time vs GPU frequency correlation: %f" % (np.mean(frame_mem_filtered), np.std(frame_mem_filtered), np.mean(frame_gpu_filtered), np.std(frame_gpu_filtered), gpu_corr))
+
+    return frames
+
+
+# Print the statistics of the frames completed so far (--follow mode)
+def report_follow(frames, time_filter):
+    print("\n[%s]" % datetime.datetime.now().strftime("%H:%M:%S"))
+    for label, (imc_frames, time_frames) in sorted(frames.items()):
+        time_filtered, imc_filtered = filter_utils.apply_chain(time_filter, time_frames, imc_frames[:, 0])
+        print("%s (%d frames): \n\tDRAM traffic per frame (MB): %2f +- %5f \n\tRendering time per frame (ms): %2f +- %5f" % (PATTERN_NAMES.get(label, label), len(time_frames), np.mean(imc_filtered), np.std(imc_filtered), np.mean(time_filtered), np.std(time_filtered)))
 
 
 def main():
-    info = cpuinfo.get_cpu_info()
-    
     # Parse arguments
     parser = argparse.ArgumentParser()
     parser.add_argument('folder')
     parser.add_argument('time')
+    cache_utils.add_arguments(parser)
+    pool_utils.add_arguments(parser)
+    stats_utils.add_arguments(parser)
+    catalog_utils.add_arguments(parser)
+    follow_utils.add_arguments(parser)
+    metadata_utils.add_arguments(parser)
+    profile_utils.add_arguments(parser)
+    report_utils.add_arguments(parser)
+    bootstrap_utils.add_arguments(parser)
+    roc_utils.add_arguments(parser)
+    align_utils.add_arguments(parser)
+    adjust_utils.add_arguments(parser, adjust_utils.FRAME_COVARIATES, 'gpu_freq')
+    segment_utils.add_arguments(parser)
+    parser.add_argument('--time-filter', type=filter_utils.parse_chain, default='percentile:5:95',
+                        help='Filter chain of the rendering times, also applied to the traffic (default: %(default)s)')
+    parser.add_argument('--filter', type=filter_utils.parse_chain, default='sigma:4',
+                        help='Filter chain of the peak RSS and GPU frequency samples (default: %(default)s)')
     args = parser.parse_args()
+    cache_utils.configure(args)
+    profile_utils.configure(args, ".")
+    report_utils.configure(args)
     in_dir = args.folder
     time_dir = args.time
-    CPUFreq = float(info["hz_advertised"][0]/1000000000)
-
-    # Read IMC data
-    imc_files = sorted(glob.glob(in_dir + "/imc*"), reverse=True)
-    imc_files.sort(key=lambda x: os.path.getmtime(x))
-    # Read TIME data
-    time_files = sorted(glob.glob(time_dir + "/time*"), reverse=True)
-    time_files.sort(key=lambda x: os.path.getmtime(x))
-    # Read MEM data
-    mem_files = sorted(glob.glob(in_dir + "/mem*"), reverse=True)
-    mem_files.sort(key=lambda x: os.path.getmtime(x))
-    # Read GPU data
-    gpu_files = sorted(glob.glob(in_dir + "/gpu*"), reverse=True)
-    gpu_files.sort(key=lambda x: os.path.getmtime(x))
-
-    total = len(imc_files)
+    # TSC frequency of the machine that recorded the traces
+    CPUFreq = metadata_utils.resolve(args, in_dir, time_dir)['tsc_hz'] / 1e9
+
+    # Analyse the runs while the driver is still sampling
+    if args.follow:
+        follow_utils.follow(in_dir, time_dir, args.where, CPUFreq, lambda run: int(run['pattern']),
+                            lambda frames: report_follow(frames, args.time_filter), args.interval, args.refreshes)
+        return
+
+    # Look up the IMC, TIME, MEM and GPU traces of every run
+    with profile_utils.stage("catalog"):
+        runs = catalog_utils.query(in_dir, time_dir, args.where, args.rebuild_catalog)
+
+    total = len(runs)
 
     time_all = {}
     imc_all = {}
     mem_all = {}
     gpu_all = {}
-    for counter in range(total):
-        curr_imc_file = imc_files[counter]
-        curr_mem_file = mem_files[counter]
-        curr_time_file = time_files[counter]
-        curr_gpu_file = gpu_files[counter]
-
-        curr_time, curr_imc, curr_mem, curr_gpu = parse_files(curr_imc_file, curr_mem_file, curr_time_file, curr_gpu_file, CPUFreq)
-
-        label = curr_time_file.split("/")[-1].split(".txt")[0]
-        selector = int(float(label.split("_")[3]))
-        time_all.setdefault(selector, []).extend(curr_time)
-        imc_all.setdefault(selector, []).extend(curr_imc)
-        mem_all.setdefault(selector, []).extend(curr_mem)
-        gpu_all.setdefault(selector, []).extend(curr_gpu)
-
-    parse_result(imc_all, mem_all, time_all, gpu_all)
+    frame_mem_all = {}
+    frame_gpu_all = {}
+    covariates_all = {}
+    segments = {}
+    groups = [(run['imc'], run['mem'], run['time'], run['gpu'] or run['nvidia_gpu'], CPUFreq, args) for run in runs]
+    with profile_utils.stage("parse"):
+        results = profile_utils.map_files("parse_run", parse_run, groups, args.jobs)
+
+    with profile_utils.stage("group"):
+        # Bounds of the leading percentile stage of the time filter, from the sketches of the runs of each texture
+        percentile_stage, time_filter = filter_utils.split_chain(args.time_filter)
+        bounds = filter_utils.merged_bounds(percentile_stage, [int(run['pattern']) for run in runs], [result[-1] for result in results])
+
+        for counter in range(total):
+            curr_frames, curr_mem, curr_gpu, segments[os.path.relpath(runs[counter]['time'], time_dir)], _ = results[counter]
+            results[counter] = None
+            selector = int(runs[counter]['pattern'])
+
+            mem_all.setdefault(selector, []).extend(curr_mem.tolist())
+            gpu_all.setdefault(selector, []).extend(curr_gpu.tolist())
+            if args.frame_readings:
+                frame_mem_all.setdefault(selector, []).extend(curr_frames['peak_rss'].tolist())
+                frame_gpu_all.setdefault(selector, []).extend(curr_frames['gpu_freq'].tolist())
+
+            # Keep only the frames within the bounds (and their traffic and covariates)
+            covariates = adjust_utils.frame_covariates(curr_frames, curr_frames['traffic'], CPUFreq)
+            kept = filter_utils.bounds_mask(curr_frames['render_time'], bounds[selector])
+            curr_frames = curr_frames[kept]
+            time_all.setdefault(selector, []).extend(curr_frames['render_time'].tolist())
+            imc_all.setdefault(selector, []).extend(curr_frames['traffic'].tolist())
+            for name, values in covariates.items():
+                covariates_all.setdefault(selector, {}).setdefault(name, []).extend(values[kept].tolist())
+
+    segment_utils.report("exp1", segments)
+    frames = parse_result(imc_all, mem_all, time_all, gpu_all, time_filter, args.filter,
+                          *((frame_mem_all, frame_gpu_all, {label: covariates['gpu_freq'] for label, covariates in covariates_all.items()})
+                            if args.frame_readings else ()))
+
+    # Rendering time with the GPU frequency (or other covariates) regressed out,
+    # over the frames the time filter keeps
+    cells = {"all": {}}
+    # apply_chain returns a single array without covariates
+    for label, times in time_all.items() if args.adjust else ():
+        time_filtered, *covariates = filter_utils.apply_chain(time_filter, times, *(covariates_all[label][name] for name in args.adjust))
+        cells["all"][PATTERN_NAMES[label]] = (time_filtered, dict(zip(args.adjust, covariates)))
+    adjusted = adjust_utils.adjust_cells(cells, args, "exp1", key_name="runs")
+
+    # Significance of the differences between textures (all runs of a texture pooled), and how well single frames tell them apart
+    cells = adjust_utils.merge({"all": frames}, adjusted)
+    bootstrap_utils.compare_cells(cells, args, "exp1", key_name="runs")
+    roc_utils.compare_cells(cells, args, "exp1", key_name="runs")
+    if args.stats_only:
+        report_utils.dump(tsc_ghz=CPUFreq, runs=total)
 
     
 if __name__ == "__main__":
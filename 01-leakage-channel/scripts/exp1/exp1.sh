@@ -3,6 +3,8 @@
 # Load MSR module
 sudo modprobe msr
 
+# Resumable alternative: sudo python3 ../../../util/trace_campaign.py exp1.json ../../data/exp1-campaign
+
 # Setup
 samples=400000 # 400 seconds
 date=`date +"%m%d-%H%M"`
@@ -21,8 +23,20 @@ echo ../../../poc/gpu-create/bin/texture 1.0   20 3000 2 10000000 >> input.txt #
 echo ../../../poc/gpu-create/bin/texture 100.0 20 3000 2 10000000 >> input.txt # gradient
 echo ../../../poc/gpu-create/bin/texture 101.0 20 3000 2 10000000 >> input.txt # skew
 
+# ./exp1.sh --sequential: stop every configuration once its pattern differences
+# are resolved, ${samples} samples at most (see util/trace_sequential.py)
+if [ "$1" == "--sequential" ]; then
+    sudo mv input.txt sweep.txt
+    sudo python3 ../../../util/trace_sequential.py sweep.txt ../../data/exp1-seq-${date} --driver ../../bin/driver --gpu 1 --imc 2 --max-samples ${samples}
+    sudo modprobe -r msr
+    exit
+fi
+
 sudo ../../bin/driver 1 2 ${samples} 1
 
+# Add the CPU, GPU and kernel to the metadata.json written by the driver
+sudo python3 ../../../util/metadata_utils.py ./out
+
 sudo mkdir time-exp1-${date}
 sudo mv time_* ./time-exp1-${date}
 
@@ -1,77 +1,132 @@
 import warnings
 warnings.simplefilter(action='ignore', category=FutureWarning)
-import cpuinfo
 import numpy as np
-import matplotlib.pyplot as plt
-import matplotlib.ticker as ticker
 import os
-import numpy as np
-import glob
 import argparse
-from distutils.dir_util import remove_tree
+import datetime
+import shutil
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "../../../util"))
+import adjust_utils
+import align_utils
+import bootstrap_utils
+import cache_utils
+import catalog_utils
+import filter_utils
+import follow_utils
+import frame_utils
+import metadata_utils
+import mi_utils
+import pool_utils
+import profile_utils
+import report_utils
+import roc_utils
+import segment_utils
+import stats_utils
+import trace_utils
+
+
+# Bump when parse_arrays changes its output (invalidates cached results)
+PARSER_VERSION = 3
+
+# Texture selector -> texture name
+PATTERN_NAMES = {0: "Black", 1: "Random", 100: "Gradient", 101: "Skew"}
+
+
+# Per-frame table of a run (DRAM read and write, rendering time and the aligned
+# GPU frequency and RSS, see align_utils.py), the bandwidth of every IMC sample,
+# and the GPU frequency and peak RSS samples
+def parse_arrays(imc, time, gpu, mem, CPUFreq):
+    begin, end = trace_utils.load_time(time)
+    imc_time, imc_values = trace_utils.load_imc(imc)
+    imc_frames, time_total, first, stop = frame_utils.aggregate_frames(imc_time, imc_values, begin, end, CPUFreq)
+    total_band = frame_utils.sample_bandwidth(imc_time, imc_values, begin, first, stop, CPUFreq)
+
+    gpu = trace_utils.load_gpu(gpu)
+    mem = trace_utils.load_mem(mem)
+    n_frames = len(time_total)
+    frames = align_utils.frame_table(begin[:n_frames], end[:n_frames],
+                                     {'read': imc_frames[:, 0], 'write': imc_frames[:, 1], 'render_time': time_total},
+                                     gpu, mem, align_utils.mem_times(imc_time))
+    return frames, total_band, gpu['freq'], mem['peak_rss']
 
 
 def parse_files(imc, time, gpu, mem, CPUFreq):
-    intervals = []
-    with open(time) as f:
-        for line in f:
-            begin = int(line)
-            end = 0
-            try:
-                end = next(f)
-            except StopIteration:    
-                break
-            if(len(end) > 1):
-                intervals.append((begin, int(end)))
-
-    counter = 0
-    read_sum = 0
-    write_sum = 0
-    read_total = []
-    write_total = []
-    total_band = []
-    time_total = []
-    prev_time = 0
-    with open(imc) as f:
-        for line in f:
-            read = float(line.strip().split(",")[0])
-            write = float(line.strip().split(",")[1])
-            curr_time = int(line.strip().split(",")[2])
-            if(counter>=len(intervals)):
-                break
-            # A new frame
-            if(curr_time>=intervals[counter][1]):
-                read_total.append(read_sum*1.04858)   # MiB to MB
-                write_total.append(write_sum*1.04858) # MiB to MB
-                time_total.append(float(intervals[counter][1]-intervals[counter][0])/(1000000*CPUFreq))
-                counter = counter + 1
-                read_sum = 0
-                write_sum = 0
-            elif(curr_time>=intervals[counter][0]):
-                read_sum = read_sum + read
-                write_sum = write_sum + write
-                total_band.append((read+write)*1.04858/(1000*(float(curr_time-prev_time)/(1000000000*CPUFreq))))
-                prev_time = curr_time
-
-    mem_total = []
-    # We only parse the Peak resident set size
-    with open(mem) as f:
-        for line in f:
-            curr_peakRSS = int(line.strip().split(", ")[1])
-            mem_total.append(curr_peakRSS)
-
-    # Parse GPU frequency
-    gpu_total = []
-    with open(gpu) as f:
-        for line in f:
-            curr_gpu = int(line.strip().split(", ")[0])
-            gpu_total.append(curr_gpu)
-
-    return read_total, write_total, total_band, time_total, gpu_total, mem_total
-
-
-def plot_single(all_read, all_write, all_time, plot_name):
-
+    return cache_utils.cached("exp2", PARSER_VERSION, [imc, time, gpu, mem], [CPUFreq], parse_arrays, imc, time, gpu, mem, CPUFreq)
+
+
+def parse_files_stream(imc, time, gpu, mem, CPUFreq, chunk_size):
+    # Same as parse_files, but the IMC trace is read in chunks and only the
+    # running statistics of the per-sample bandwidth are kept
+    begin, end = trace_utils.load_time(time)
+    stream = frame_utils.FrameStream(begin, end, CPUFreq)
+    imc_frames = []
+    time_frames = []
+    band_stats = stats_utils.RunningStats()
+    # Timestamps of the IMC samples the mem_* samples were taken with
+    mem_time = []
+    offset = 0
+    for imc_time, imc_values in trace_utils.iter_imc(imc, chunk_size):
+        curr_imc, curr_time, curr_band = stream.feed(imc_time, imc_values)
+        imc_frames.append(curr_imc)
+        time_frames.append(curr_time)
+        band_stats.update(curr_band)
+        mem_time.append(align_utils.mem_times(imc_time, offset))
+        offset += len(imc_time)
+    imc_frames = np.concatenate(imc_frames) if imc_frames else np.zeros((0, 2))
+    time_total = np.concatenate(time_frames) if time_frames else np.zeros(0)
+    mem_time = np.concatenate(mem_time) if mem_time else np.zeros(0, dtype=np.int64)
+
+    gpu = trace_utils.load_gpu(gpu)
+    mem = trace_utils.load_mem(mem)
+    n_frames = len(time_total)
+    frames = align_utils.frame_table(begin[:n_frames], end[:n_frames],
+                                     {'read': imc_frames[:, 0], 'write': imc_frames[:, 1], 'render_time': time_total},
+                                     gpu, mem, mem_time)
+    return frames, band_stats, gpu['freq'], mem['peak_rss']
+
+
+# Parse a run in the worker (streaming the IMC trace with --stream), and keep its steady-state frames,
+# then those at a stable GPU frequency. Also returns the segments of the run, and a QuantileSketch
+# of the rendering times of the frames kept: merged over the runs of a label, it gives the bounds
+# of the time filter before all the frames are gathered
+def parse_run(imc, time, gpu, mem, CPUFreq, args):
+    if args.stream:
+        frames, band, gpu_freq, peak_rss = parse_files_stream(imc, time, gpu, mem, CPUFreq, args.chunk_size)
+    else:
+        frames, band, gpu_freq, peak_rss = parse_files(imc, time, gpu, mem, CPUFreq)
+    steady, segments = segment_utils.steady_mask((frames['render_time'], frames['read'] + frames['write'], frames['gpu_freq']), args)
+    frames = align_utils.select_frames(frames[steady], args)
+    sketch = stats_utils.QuantileSketch(args.quantile_error, args.exact_quantiles).update(frames['render_time'])
+    return frames, band, gpu_freq, peak_rss, segments, sketch
+
+
+def band_stats_stream(imc, time, CPUFreq, chunk_size, k, band_mean, band_std):
+    # Second streaming pass: statistics of the bandwidth samples within k std of the label mean
+    begin, end = trace_utils.load_time(time)
+    stream = frame_utils.FrameStream(begin, end, CPUFreq)
+    band_stats = stats_utils.RunningStats()
+    for imc_time, imc_values in trace_utils.iter_imc(imc, chunk_size):
+        _, _, curr_band = stream.feed(imc_time, imc_values)
+        band_stats.update(curr_band[abs(curr_band-band_mean) <= k*band_std])
+    return band_stats
+
+
+def band_stats(trace, band_filter):
+    # Mean and std of the bandwidth samples after filtering outliers
+    samples_filtered = filter_utils.apply_chain(band_filter, trace)
+    return np.mean(samples_filtered), np.std(samples_filtered)
+
+
+# all_time holds the rendering times of each label within the bounds of the leading percentile
+# stage of the time filter (see filter_utils.split_chain), time_filter is the rest of that
+# chain, also applied to the traffic.
+# Returns the filtered per-frame samples of each layer and texture, for bootstrap_utils.compare_cells
+@profile_utils.profiled
+def plot_single(all_read, all_write, all_time, time_filter, plot_name):
+
+    frames = {}
     read = {}
     read_std = {}
     write = {}
@@ -80,101 +135,106 @@ def plot_single(all_read, all_write, all_time, plot_name):
     minimum = 100000
     maximum = 0
 
-    # Parse data: data read 
-    for label, trace in all_read.items():
+    with profile_utils.stage("filter_read"):
+        # Parse data: data read 
+        for label, trace in all_read.items():
         
-        # Filter time outliers (for the plot)
-        samples_filtered = []
-        time_low = np.percentile(all_time[label], 5)
-        time_high = np.percentile(all_time[label], 95)
-        for curr_time_counter in range(len(all_time[label])):
-            curr_time = all_time[label][curr_time_counter]
-            if ( (curr_time>=time_low) and (curr_time<=time_high)):
-                samples_filtered.append(trace[curr_time_counter])
-
-        minimum = min(min(samples_filtered), minimum)
-        maximum = max(max(samples_filtered), maximum)
-
-        # Store data for scatter
-        curr_layer = int(label.split("_")[4])
-        curr_size = int(label.split("_")[2])
-        curr_pattern = int(float(label.split("_")[3]))
-        c_nc = -1
-        if(curr_pattern==1):
-            c_nc = 1
-        elif((curr_pattern==0) or (curr_size%curr_pattern == 0)):
-            c_nc = 0
-        else:
-            c_nc = 1
+            # Filter time outliers (for the plot)
+            time_filtered, samples_filtered = filter_utils.apply_chain(time_filter, all_time[label], trace)
+
+            minimum = min(min(samples_filtered), minimum)
+            maximum = max(max(samples_filtered), maximum)
+
+            # Store data for scatter
+            curr_layer = int(label.split("_")[4])
+            curr_size = int(label.split("_")[2])
+            curr_pattern = int(float(label.split("_")[3]))
+            c_nc = -1
+            if(curr_pattern==1):
+                c_nc = 1
+            elif((curr_pattern==0) or (curr_size%curr_pattern == 0)):
+                c_nc = 0
+            else:
+                c_nc = 1
         
-        if(curr_layer not in read):
-            read[curr_layer]={}
-        read[curr_layer].setdefault(c_nc, []).append(np.mean(samples_filtered))
-        if(curr_layer not in read_std):
-            read_std[curr_layer]={}
-        read_std[curr_layer].setdefault(c_nc, []).append(np.std(samples_filtered))
-
-    # Parse data: data write
-    for label, trace in all_write.items():
+            pattern_frames = frames.setdefault(curr_layer, {}).setdefault(PATTERN_NAMES.get(curr_pattern, label.split("_")[3]), {})
+            pattern_frames["DRAM read per frame (MB)"] = samples_filtered
+            pattern_frames["Rendering time per frame (ms)"] = time_filtered
+
+            if(curr_layer not in read):
+                read[curr_layer]={}
+            read[curr_layer].setdefault(c_nc, []).append(np.mean(samples_filtered))
+            if(curr_layer not in read_std):
+                read_std[curr_layer]={}
+            read_std[curr_layer].setdefault(c_nc, []).append(np.std(samples_filtered))
+
+    with profile_utils.stage("filter_write"):
+        # Parse data: data write
+        for label, trace in all_write.items():
         
-        # Filter outliers (for the plot)
-        samples_filtered = []
-        time_low = np.percentile(all_time[label], 5)
-        time_high = np.percentile(all_time[label], 95)
-        for curr_time_counter in range(len(all_time[label])):
-            curr_time = all_time[label][curr_time_counter]
-            if ( (curr_time>=time_low) and (curr_time<=time_high)):
-                samples_filtered.append(trace[curr_time_counter])
-
-        minimum = min(min(samples_filtered), minimum)
-        maximum = max(max(samples_filtered), maximum)
-
-        # Store data for scatter
-        curr_layer = int(label.split("_")[4])
-        curr_size = int(label.split("_")[2])
-        curr_pattern = int(float(label.split("_")[3]))
-        c_nc = -1
-        if(curr_pattern==1):
-            c_nc = 1
-        elif((curr_pattern==0) or (curr_size%curr_pattern == 0)):
-            c_nc = 0
-        else:
-            c_nc = 1
-
-        if(curr_layer not in write):
-            write[curr_layer]={}
-        write[curr_layer].setdefault(c_nc, []).append(np.mean(samples_filtered))
-        if(curr_layer not in write_std):
-            write_std[curr_layer]={}
-        write_std[curr_layer].setdefault(c_nc, []).append(np.std(samples_filtered))
-
-    # Plot all data
-    plt_label = []
-    plt_nc = [] # non-compressible
-    plt_c = [] # compressible
-    plt_nc_std = []
-    plt_c_std = []
+            # Filter outliers (for the plot)
+            _, samples_filtered = filter_utils.apply_chain(time_filter, all_time[label], trace)
+
+            minimum = min(min(samples_filtered), minimum)
+            maximum = max(max(samples_filtered), maximum)
+
+            # Store data for scatter
+            curr_layer = int(label.split("_")[4])
+            curr_size = int(label.split("_")[2])
+            curr_pattern = int(float(label.split("_")[3]))
+            c_nc = -1
+            if(curr_pattern==1):
+                c_nc = 1
+            elif((curr_pattern==0) or (curr_size%curr_pattern == 0)):
+                c_nc = 0
+            else:
+                c_nc = 1
+
+            frames[curr_layer][PATTERN_NAMES.get(curr_pattern, label.split("_")[3])]["DRAM write per frame (MB)"] = samples_filtered
+
+            if(curr_layer not in write):
+                write[curr_layer]={}
+            write[curr_layer].setdefault(c_nc, []).append(np.mean(samples_filtered))
+            if(curr_layer not in write_std):
+                write_std[curr_layer]={}
+            write_std[curr_layer].setdefault(c_nc, []).append(np.std(samples_filtered))
+
+    with profile_utils.stage("stats"):
+        # Plot all data
+        plt_label = []
+        plt_nc = [] # non-compressible
+        plt_c = [] # compressible
+        plt_nc_std = []
+        plt_c_std = []
     
-    plt_write_label = []
-    plt_write_nc = []
-    plt_write_c = []
-    plt_write_nc_std = []
-    plt_write_c_std = []
+        plt_write_label = []
+        plt_write_nc = []
+        plt_write_c = []
+        plt_write_nc_std = []
+        plt_write_c_std = []
     
-    for layer in read:
-        plt_label.append(layer)
-        plt_nc.append(np.mean(read[layer][1]))
-        plt_c.append(np.mean(read[layer][0]))
-        plt_nc_std.append(np.mean(read_std[layer][1]))
-        plt_c_std.append(np.mean(read_std[layer][0]))
-
-    for layer in write:
-        plt_write_label.append(layer)
-        plt_write_nc.append(np.mean(write[layer][1]))
-        plt_write_c.append(np.mean(write[layer][0]))
-        plt_write_nc_std.append(np.mean(write_std[layer][1]))
-        plt_write_c_std.append(np.mean(write_std[layer][0]))
-
+        for layer in read:
+            plt_label.append(layer)
+            plt_nc.append(np.mean(read[layer][1]))
+            plt_c.append(np.mean(read[layer][0]))
+            plt_nc_std.append(np.mean(read_std[layer][1]))
+            plt_c_std.append(np.mean(read_std[layer][0]))
+
+        for layer in write:
+            plt_write_label.append(layer)
+            plt_write_nc.append(np.mean(write[layer][1]))
+            plt_write_c.append(np.mean(write[layer][0]))
+            plt_write_nc_std.append(np.mean(write_std[layer][1]))
+            plt_write_c_std.append(np.mean(write_std[layer][0]))
+
+        report_utils.record(plot_name, {
+            "dram_read_mb": report_utils.series(plt_label, plt_c, plt_c_std, plt_nc, plt_nc_std),
+            "dram_write_mb": report_utils.series(plt_write_label, plt_write_c, plt_write_c_std, plt_write_nc, plt_write_nc_std),
+        })
+    if report_utils.stats_only():
+        return frames
+
+    import matplotlib.pyplot as plt
     fig, (a1,a2) = plt.subplots(1, 2, figsize=(5.0, 2))
 
     a1.scatter(plt_label, plt_c, s=2, c = "navy", label="Compressible")
@@ -202,10 +262,14 @@ def plot_single(all_read, all_write, all_time, plot_name):
     handles, labels = a2.get_legend_handles_labels()
     fig.legend(handles, labels, bbox_to_anchor=(0.85, 1.0), ncol=2, markerscale=4, fontsize=10)
     plt.subplots_adjust(wspace=0.4,left=0.13,top=0.70,right=0.97,bottom=0.2)
-    plt.savefig("./plot/%s.pdf" % plot_name, dpi=300)
+    with profile_utils.stage("savefig", plot_name):
+        plt.savefig("./plot/%s.pdf" % plot_name, dpi=300)
 
+    return frames
 
-def plot_gpu_mem(all_gpu, all_mem, plot_name):
+
+@profile_utils.profiled
+def plot_gpu_mem(all_gpu, all_mem, value_filter, plot_name):
 
     gpu = {}
     gpu_stds = {}
@@ -215,21 +279,9 @@ def plot_gpu_mem(all_gpu, all_mem, plot_name):
     # Parse data: data read 
     for label, trace in all_gpu.items():
         
-        # Filter gpu outliers 
-        gpu_filtered = []
-        gpu_mean = np.mean(trace)
-        gpu_std = np.std(trace)
-        for curr_gpu in trace:
-            if ( abs(curr_gpu-gpu_mean) <= 4*gpu_std):
-                gpu_filtered.append(curr_gpu)
-
-        # Filter mem outliers 
-        mem_filtered = []
-        mem_mean = np.mean(all_mem[label])
-        mem_std = np.std(all_mem[label])
-        for curr_mem in all_mem[label]:
-            if ( abs(curr_mem-mem_mean) <= 4*mem_std):
-                mem_filtered.append(curr_mem)
+        # Filter gpu and mem outliers
+        gpu_filtered = filter_utils.apply_chain(value_filter, trace)
+        mem_filtered = filter_utils.apply_chain(value_filter, all_mem[label])
 
         # Store data for scatter
         curr_layer = int(label.split("_")[4])
@@ -258,33 +310,42 @@ def plot_gpu_mem(all_gpu, all_mem, plot_name):
         mem_stds[curr_layer].setdefault(c_nc, []).append(np.std(mem_filtered))
 
     
-    # Plot all data
-    plt_label = []
-    plt_gpu_nc = [] # non-compressible
-    plt_gpu_c = [] # compressible
-    plt_gpu_nc_std = []
-    plt_gpu_c_std = []
+    with profile_utils.stage("stats"):
+        # Plot all data
+        plt_label = []
+        plt_gpu_nc = [] # non-compressible
+        plt_gpu_c = [] # compressible
+        plt_gpu_nc_std = []
+        plt_gpu_c_std = []
     
-    plt_mem_label = []
-    plt_mem_nc = []
-    plt_mem_c = []
-    plt_mem_nc_std = []
-    plt_mem_c_std = []
+        plt_mem_label = []
+        plt_mem_nc = []
+        plt_mem_c = []
+        plt_mem_nc_std = []
+        plt_mem_c_std = []
     
-    for layer in gpu:
-        plt_label.append(layer)
-        plt_gpu_nc.append(np.mean(gpu[layer][1]))
-        plt_gpu_c.append(np.mean(gpu[layer][0]))
-        plt_gpu_nc_std.append(np.mean(gpu_stds[layer][1]))
-        plt_gpu_c_std.append(np.mean(gpu_stds[layer][0]))
-
-    for layer in mem:
-        plt_mem_label.append(layer)
-        plt_mem_nc.append(np.mean(mem[layer][1]))
-        plt_mem_c.append(np.mean(mem[layer][0]))
-        plt_mem_nc_std.append(np.mean(mem_stds[layer][1]))
-        plt_mem_c_std.append(np.mean(mem_stds[layer][0]))
-
+        for layer in gpu:
+            plt_label.append(layer)
+            plt_gpu_nc.append(np.mean(gpu[layer][1]))
+            plt_gpu_c.append(np.mean(gpu[layer][0]))
+            plt_gpu_nc_std.append(np.mean(gpu_stds[layer][1]))
+            plt_gpu_c_std.append(np.mean(gpu_stds[layer][0]))
+
+        for layer in mem:
+            plt_mem_label.append(layer)
+            plt_mem_nc.append(np.mean(mem[layer][1]))
+            plt_mem_c.append(np.mean(mem[layer][0]))
+            plt_mem_nc_std.append(np.mean(mem_stds[layer][1]))
+            plt_mem_c_std.append(np.mean(mem_stds[layer][0]))
+
+        report_utils.record(plot_name, {
+            "gpu_freq_mhz": report_utils.series(plt_label, plt_gpu_c, plt_gpu_c_std, plt_gpu_nc, plt_gpu_nc_std),
+            "peak_rss_kib": report_utils.series(plt_mem_label, plt_mem_c, plt_mem_c_std, plt_mem_nc, plt_mem_nc_std),
+        })
+    if report_utils.stats_only():
+        return
+
+    import matplotlib.pyplot as plt
     fig, (a1,a2) = plt.subplots(1, 2, figsize=(5.0, 2))
 
     a1.scatter(plt_label, plt_gpu_c, s=2, c = "navy", label="Compressible")
@@ -309,9 +370,13 @@ def plot_gpu_mem(all_gpu, all_mem, plot_name):
     handles, labels = a2.get_legend_handles_labels()
     fig.legend(handles, labels, bbox_to_anchor=(0.85, 1.0), ncol=2, markerscale=4, fontsize=10)
     plt.subplots_adjust(wspace=0.4,left=0.13,top=0.70,right=0.97,bottom=0.2)
-    plt.savefig("./plot/%s.pdf" % plot_name, dpi=300)
+    with profile_utils.stage("savefig", plot_name):
+        plt.savefig("./plot/%s.pdf" % plot_name, dpi=300)
 
 
+# all_read and all_write map each label to the (mean, std) of its filtered bandwidth samples (see band_stats),
+# all_time_read and all_time_write to that of its filtered rendering times
+@profile_utils.profiled
 def plot_bandwidth(all_read, all_write, all_time_read, all_time_write, plot_name):
 
     total_r = {}
@@ -324,118 +389,93 @@ def plot_bandwidth(all_read, all_write, all_time_read, all_time_write, plot_name
     times_w = {}
     times_w_std = {}
     
-    # Parse data for read-only workload
-    for label, trace in all_read.items():
-        
-        # Filter outliers (for the plot)
-        samples_filtered = []
-        samples_mean = np.mean(trace)
-        samples_std = np.std(trace)
-        for sample in trace:
-            if ( abs(sample-samples_mean) <= 4*samples_std):
-                samples_filtered.append(sample)
-
-        # Filter time outliers 
-        time_filtered = []
-        time_mean = np.mean(all_time_read[label])
-        time_std = np.std(all_time_read[label])
-        for curr_time in all_time_read[label]:
-            if ( abs(curr_time-time_mean) <= 4*time_std):
-                time_filtered.append(curr_time)
-
-    
-        # Store data for scatter
-        curr_layer = int(label.split("_")[4])
-        curr_size = int(label.split("_")[2])
-        curr_pattern = int(float(label.split("_")[3]))
-        c_nc = -1
-        if(curr_pattern==1):
-            c_nc = 1
-        elif((curr_pattern==0) or (curr_size%curr_pattern == 0)):
-            c_nc = 0
-        else:
-            c_nc = 1
-
-        if(curr_layer not in total_r):
-            total_r[curr_layer]={}
-            times_r[curr_layer]={}
-        total_r[curr_layer].setdefault(c_nc, []).append(np.mean(samples_filtered))
-        times_r[curr_layer].setdefault(c_nc, []).append(np.mean(time_filtered))
-
-        if(curr_layer not in total_r_std):
-            total_r_std[curr_layer]={}
-            times_r_std[curr_layer]={}
-        total_r_std[curr_layer].setdefault(c_nc, []).append(np.std(samples_filtered))
-        times_r_std[curr_layer].setdefault(c_nc, []).append(np.std(time_filtered))
-
-
-    # Parse data for write-only workload
-    for label, trace in all_write.items():
-        
-        # Filter outliers (for the plot)
-        samples_filtered = []
-        samples_mean = np.mean(trace)
-        samples_std = np.std(trace)
-        for sample in trace:
-            if ( abs(sample-samples_mean) <= 4*samples_std):
-                samples_filtered.append(sample)
-
-        # Filter time outliers 
-        time_filtered = []
-        time_mean = np.mean(all_time_write[label])
-        time_std = np.std(all_time_write[label])
-        for curr_time in all_time_write[label]:
-            if ( abs(curr_time-time_mean) <= 4*time_std):
-                time_filtered.append(curr_time)
-
-        # Store data for scatter
-        curr_layer = int(label.split("_")[4])
-        curr_size = int(label.split("_")[2])
-        curr_pattern = int(float(label.split("_")[3]))
-        c_nc = -1
-        if(curr_pattern==1):
-            c_nc = 1
-        elif((curr_pattern==0) or (curr_size%curr_pattern == 0)):
-            c_nc = 0
-        else:
-            c_nc = 1
-
-        if(curr_layer not in total_w):
-            total_w[curr_layer]={}
-            times_w[curr_layer]={}
-        total_w[curr_layer].setdefault(c_nc, []).append(np.mean(samples_filtered))
-        times_w[curr_layer].setdefault(c_nc, []).append(np.mean(time_filtered))
-
-        if(curr_layer not in total_w_std):
-            total_w_std[curr_layer]={}
-            times_w_std[curr_layer]={}
-        total_w_std[curr_layer].setdefault(c_nc, []).append(np.std(samples_filtered))
-        times_w_std[curr_layer].setdefault(c_nc, []).append(np.std(time_filtered))
-
-
-    # Plot all data
-    plt_label = []
-    plt_nc = []
-    plt_c = []
-    plt_nc_std = []
-    plt_c_std = []
-
-    plt_time_nc = []
-    plt_time_c = []
-    plt_time_nc_std = []
-    plt_time_c_std = []
-
-    for layer in total_r:
-        plt_label.append(layer)
-        plt_nc.append(np.mean(total_r[layer][1]))
-        plt_c.append(np.mean(total_r[layer][0]))
-        plt_nc_std.append(np.mean(total_r_std[layer][1]))
-        plt_c_std.append(np.mean(total_r_std[layer][0]))
-
-        plt_time_nc.append(np.mean(times_r[layer][1]))
-        plt_time_c.append(np.mean(times_r[layer][0]))
-        plt_time_nc_std.append(np.mean(times_r_std[layer][1]))
-        plt_time_c_std.append(np.mean(times_r_std[layer][0]))
+    with profile_utils.stage("stats"):
+        # Parse data for read-only workload
+        for label, (band_mean, band_std) in all_read.items():
+
+            time_mean, time_std = all_time_read[label]
+
+            # Store data for scatter
+            curr_layer = int(label.split("_")[4])
+            curr_size = int(label.split("_")[2])
+            curr_pattern = int(float(label.split("_")[3]))
+            c_nc = -1
+            if(curr_pattern==1):
+                c_nc = 1
+            elif((curr_pattern==0) or (curr_size%curr_pattern == 0)):
+                c_nc = 0
+            else:
+                c_nc = 1
+
+            if(curr_layer not in total_r):
+                total_r[curr_layer]={}
+                times_r[curr_layer]={}
+            total_r[curr_layer].setdefault(c_nc, []).append(band_mean)
+            times_r[curr_layer].setdefault(c_nc, []).append(time_mean)
+
+            if(curr_layer not in total_r_std):
+                total_r_std[curr_layer]={}
+                times_r_std[curr_layer]={}
+            total_r_std[curr_layer].setdefault(c_nc, []).append(band_std)
+            times_r_std[curr_layer].setdefault(c_nc, []).append(time_std)
+
+
+        # Parse data for write-only workload
+        for label, (band_mean, band_std) in all_write.items():
+
+            time_mean, time_std = all_time_write[label]
+
+            # Store data for scatter
+            curr_layer = int(label.split("_")[4])
+            curr_size = int(label.split("_")[2])
+            curr_pattern = int(float(label.split("_")[3]))
+            c_nc = -1
+            if(curr_pattern==1):
+                c_nc = 1
+            elif((curr_pattern==0) or (curr_size%curr_pattern == 0)):
+                c_nc = 0
+            else:
+                c_nc = 1
+
+            if(curr_layer not in total_w):
+                total_w[curr_layer]={}
+                times_w[curr_layer]={}
+            total_w[curr_layer].setdefault(c_nc, []).append(band_mean)
+            times_w[curr_layer].setdefault(c_nc, []).append(time_mean)
+
+            if(curr_layer not in total_w_std):
+                total_w_std[curr_layer]={}
+                times_w_std[curr_layer]={}
+            total_w_std[curr_layer].setdefault(c_nc, []).append(band_std)
+            times_w_std[curr_layer].setdefault(c_nc, []).append(time_std)
+
+
+        # Plot all data: per layer, the mean over labels of the bandwidth and time statistics
+        def layer_series(total, total_std, times, times_std):
+            rows = [[] for _ in range(9)]
+            for layer in total:
+                rows[0].append(layer)
+                for i, stat in enumerate((total, total_std, times, times_std)):
+                    rows[1 + 2*i].append(np.mean(stat[layer][0]))
+                    rows[2 + 2*i].append(np.mean(stat[layer][1]))
+            return rows
+
+        read_series = layer_series(total_r, total_r_std, times_r, times_r_std)
+        write_series = layer_series(total_w, total_w_std, times_w, times_w_std)
+
+        report = {}
+        for workload, (label, c, nc, c_std, nc_std, time_c, time_nc, time_c_std, time_nc_std) in (("read", read_series), ("write", write_series)):
+            report[workload] = {
+                "dram_bandwidth_gbs": report_utils.series(label, c, c_std, nc, nc_std),
+                "rendering_time_ms": report_utils.series(label, time_c, time_c_std, time_nc, time_nc_std),
+            }
+        report_utils.record(plot_name, report)
+    if report_utils.stats_only():
+        return
+
+    import matplotlib.pyplot as plt
+    import matplotlib.ticker as ticker
+    plt_label, plt_c, plt_nc, plt_c_std, plt_nc_std, plt_time_c, plt_time_nc, plt_time_c_std, plt_time_nc_std = read_series
 
     fig, (ax1,ax3) = plt.subplots(1, 2, figsize=(6.1, 3.0))
     ax1.set_title('Read workload', fontsize=10)
@@ -459,28 +499,7 @@ def plot_bandwidth(all_read, all_write, all_time_read, all_time_write, plot_name
     ax2.set_yticks(np.arange(0, 150, 20))
     
 
-    plt_label = []
-    plt_nc = []
-    plt_c = []
-    plt_nc_std = []
-    plt_c_std = []
-
-    plt_time_nc = []
-    plt_time_c = []
-    plt_time_nc_std = []
-    plt_time_c_std = []
-
-    for layer in total_w:
-        plt_label.append(layer)
-        plt_nc.append(np.mean(total_w[layer][1]))
-        plt_c.append(np.mean(total_w[layer][0]))
-        plt_nc_std.append(np.mean(total_w_std[layer][1]))
-        plt_c_std.append(np.mean(total_w_std[layer][0]))
-
-        plt_time_nc.append(np.mean(times_w[layer][1]))
-        plt_time_c.append(np.mean(times_w[layer][0]))
-        plt_time_nc_std.append(np.mean(times_w_std[layer][1]))
-        plt_time_c_std.append(np.mean(times_w_std[layer][0]))
+    plt_label, plt_c, plt_nc, plt_c_std, plt_nc_std, plt_time_c, plt_time_nc, plt_time_c_std, plt_time_nc_std = write_series
 
     ax4 = ax3.twinx()
     ax3.set_title('Write workload', fontsize=10)
@@ -509,107 +528,246 @@ def plot_bandwidth(all_read, all_write, all_time_read, all_time_write, plot_name
 
     fig.legend(handles, labels, bbox_to_anchor=(1.01, 1.0), ncol=2, markerscale=4, fontsize=10)
     plt.subplots_adjust(wspace=0.3,left=0.08,top=0.75,right=0.91,bottom=0.15)
-    plt.savefig("./plot/%s.pdf" % plot_name, dpi=300)
-
+    with profile_utils.stage("savefig", plot_name):
+        plt.savefig("./plot/%s.pdf" % plot_name, dpi=300)
+
+
+# The rendering times and covariates of each layer and texture, over the frames the time filter keeps
+# (those of plot_single), for adjust_utils.adjust_cells
+def covariate_cells(all_time, all_covariates, time_filter, covariates):
+    cells = {}
+    # apply_chain returns a single array without covariates, and adjust_cells has nothing to do
+    if not covariates:
+        return cells
+    for label, times in all_time.items():
+        time_filtered, *values = filter_utils.apply_chain(time_filter, times, *(all_covariates[label][name] for name in covariates))
+        curr_layer = int(label.split("_")[4])
+        curr_pattern = int(float(label.split("_")[3]))
+        cells.setdefault(curr_layer, {})[PATTERN_NAMES.get(curr_pattern, label.split("_")[3])] = (time_filtered, dict(zip(covariates, values)))
+    return cells
 
 
-def main():
+# Print the statistics of the frames completed so far (--follow mode)
+def report_follow(frames, time_filter):
+    print("\n[%s]" % datetime.datetime.now().strftime("%H:%M:%S"))
+    for label, (imc_frames, time_frames) in sorted(frames.items()):
+        time_filtered, read_filtered, write_filtered = filter_utils.apply_chain(time_filter, time_frames, imc_frames[:, 0], imc_frames[:, 1])
+        print("%s (%d frames): \n\tDRAM read per frame (MB): %2f +- %5f \n\tDRAM write per frame (MB): %2f +- %5f \n\tRendering time per frame (ms): %2f +- %5f" % (label, len(time_frames), np.mean(read_filtered), np.std(read_filtered), np.mean(write_filtered), np.std(write_filtered), np.mean(time_filtered), np.std(time_filtered)))
 
-    info = cpuinfo.get_cpu_info()
 
-    # Prepare output directory
-    try:
-        remove_tree('plot')
-    except:
-        pass
-    try:
-        os.makedirs('plot')
-    except:
-        pass
+def main():
 
     # Parse arguments
     parser = argparse.ArgumentParser()
     parser.add_argument('folder')
     parser.add_argument('time')
+    cache_utils.add_arguments(parser)
+    pool_utils.add_arguments(parser)
+    stats_utils.add_arguments(parser)
+    catalog_utils.add_arguments(parser)
+    follow_utils.add_arguments(parser)
+    metadata_utils.add_arguments(parser)
+    profile_utils.add_arguments(parser)
+    report_utils.add_arguments(parser)
+    bootstrap_utils.add_arguments(parser)
+    roc_utils.add_arguments(parser)
+    mi_utils.add_arguments(parser)
+    align_utils.add_arguments(parser)
+    adjust_utils.add_arguments(parser, adjust_utils.FRAME_COVARIATES, 'gpu_freq')
+    segment_utils.add_arguments(parser)
+    parser.add_argument('--stream', action='store_true',
+                        help='Read IMC traces in chunks and keep only running statistics of the per-sample bandwidth (bounded memory, no cache)')
+    parser.add_argument('--chunk-size', type=int, default=100000, help='Samples per chunk in --stream mode (default: %(default)s)')
+    parser.add_argument('--time-filter', type=filter_utils.parse_chain, default='percentile:5:95',
+                        help='Filter chain of the rendering times, also applied to the traffic (default: %(default)s)')
+    parser.add_argument('--filter', type=filter_utils.parse_chain, default='sigma:4',
+                        help='Filter chain of the bandwidth, GPU frequency, peak RSS and bandwidth-plot times (default: %(default)s)')
     args = parser.parse_args()
+    if args.stream and (len(args.filter) > 1 or any(name != 'sigma' for name, _ in args.filter)):
+        parser.error("--stream only supports a single sigma:K stage (or none) in --filter")
+    cache_utils.configure(args)
+    report_utils.configure(args)
+
+    # Prepare output directory
+    if not args.stats_only:
+        shutil.rmtree('plot', ignore_errors=True)
+        os.makedirs('plot', exist_ok=True)
+    profile_utils.configure(args, "plot")
     in_dir = args.folder
     time_dir = args.time
-    CPUFreq = float(info["hz_advertised"][0]/1000000000)
-
-    # Read data
-    imc_files = sorted(glob.glob(in_dir + "/imc*"), reverse=True)
-    imc_files.sort(key=lambda x: os.path.getmtime(x))
-    # Read rendering time data
-    time_files = sorted(glob.glob(time_dir + "/time*"), reverse=True)
-    time_files.sort(key=lambda x: os.path.getmtime(x))
-    # Read MEM data
-    mem_files = sorted(glob.glob(in_dir + "/mem*"), reverse=True)
-    mem_files.sort(key=lambda x: os.path.getmtime(x))
-    # Read GPU data
-    gpu_files = sorted(glob.glob(in_dir + "/gpu*"), reverse=True)
-    gpu_files.sort(key=lambda x: os.path.getmtime(x))
-
-    total = int(len(imc_files)/2)
+    # TSC frequency of the machine that recorded the traces
+    CPUFreq = metadata_utils.resolve(args, in_dir, time_dir)['tsc_hz'] / 1e9
+
+    # Analyse the runs while the driver is still sampling
+    if args.follow:
+        follow_utils.follow(in_dir, time_dir, args.where, CPUFreq, lambda run: os.path.basename(run['time']).split(".txt")[0],
+                            lambda frames: report_follow(frames, args.time_filter), args.interval, args.refreshes)
+        return
+
+    # Look up the traces of every run: read-only workload first, then write-only
+    with profile_utils.stage("catalog"):
+        runs = catalog_utils.query(in_dir, time_dir, args.where, args.rebuild_catalog)
+    runs = [run for run in runs if run['workload'] == 0] + [run for run in runs if run['workload'] == 1]
+    imc_files = [run['imc'] for run in runs]
+    time_files = [run['time'] for run in runs]
+    mem_files = [run['mem'] for run in runs]
+    gpu_files = [run['gpu'] or run['nvidia_gpu'] for run in runs]
+
+    total = sum(run['workload'] == 0 for run in runs)
+
+    # Parse both workloads at once, results stay in file order
+    groups = [(imc_files[counter], time_files[counter], gpu_files[counter], mem_files[counter], CPUFreq, args) for counter in range(len(runs))]
+    with profile_utils.stage("parse"):
+        results = profile_utils.map_files("parse_run", parse_run, groups, args.jobs)
+
+    # Bounds of the leading percentile stage of the time filter, from the sketches of the runs of each label
+    labels = [time_file.split("/")[-1].split(".txt")[0] for time_file in time_files]
+    percentile_stage, time_filter = filter_utils.split_chain(args.time_filter)
+    bounds = filter_utils.merged_bounds(percentile_stage, labels, [result[-1] for result in results])
 
     # read-only worload
     read_all = {}
     write_all = {}
     time_read_all = {}
+    time_read_stats = {}
     band_read = {}
     mem_all = {}
     gpu_all = {}
-    for counter in range(total):
-
-        curr_imc_file = imc_files[counter]
-        curr_time_file = time_files[counter]
-        curr_mem_file = mem_files[counter]
-        curr_gpu_file = gpu_files[counter]
-
-        curr_read, curr_write, curr_band, curr_time, curr_gpu, curr_mem = parse_files(curr_imc_file, curr_time_file, curr_gpu_file, curr_mem_file, CPUFreq)
-        label_time = curr_time_file.split("/")[-1].split(".txt")[0]
-
-        read_all.setdefault(label_time, []).extend(curr_read)
-        write_all.setdefault(label_time, []).extend(curr_write)
-        time_read_all.setdefault(label_time, []).extend(curr_time)
-        band_read.setdefault(label_time, []).extend(curr_band)
-        mem_all.setdefault(label_time, []).extend(curr_mem)
-        gpu_all.setdefault(label_time, []).extend(curr_gpu)
+    frame_mem_all = {}
+    frame_gpu_all = {}
+    covariates_all = {}
+    segments = {}
+    with profile_utils.stage("group_read"):
+        for counter in range(total):
+
+            curr_time_file = time_files[counter]
+
+            curr_frames, curr_band, curr_gpu, curr_mem, segments[os.path.relpath(curr_time_file, time_dir)], _ = results[counter]
+            results[counter] = None
+            label_time = labels[counter]
+
+            if args.stream:
+                band_read.setdefault(label_time, stats_utils.RunningStats()).merge(curr_band)
+            else:
+                band_read.setdefault(label_time, []).extend(curr_band.tolist())
+            mem_all.setdefault(label_time, []).extend(curr_mem.tolist())
+            gpu_all.setdefault(label_time, []).extend(curr_gpu.tolist())
+            # The bandwidth plot filters the rendering times on their own (reduced to their mean and std below)
+            time_read_stats.setdefault(label_time, []).append(curr_frames['render_time'].copy())
+            if args.frame_readings:
+                frame_mem_all.setdefault(label_time, []).extend(curr_frames['peak_rss'].tolist())
+                frame_gpu_all.setdefault(label_time, []).extend(curr_frames['gpu_freq'].tolist())
+
+            # Keep only the frames within the bounds (and their traffic and covariates)
+            covariates = adjust_utils.frame_covariates(curr_frames, curr_frames['read'] + curr_frames['write'], CPUFreq)
+            kept = filter_utils.bounds_mask(curr_frames['render_time'], bounds[label_time])
+            curr_frames = curr_frames[kept]
+            read_all.setdefault(label_time, []).extend(curr_frames['read'].tolist())
+            write_all.setdefault(label_time, []).extend(curr_frames['write'].tolist())
+            time_read_all.setdefault(label_time, []).extend(curr_frames['render_time'].tolist())
+            for name, values in covariates.items():
+                covariates_all.setdefault(label_time, {}).setdefault(name, []).extend(values[kept].tolist())
+        time_read_stats = {label: band_stats(np.concatenate(times), args.filter) for label, times in time_read_stats.items()}
                 
     # Plot the DRAM read and write data of read-only workload (compressible and non-compressible texture) as workload complexity increases 
-    plot_single(read_all, write_all, time_read_all, "GPUread")
+    segment_utils.report("GPUread", segments)
+    frames = plot_single(read_all, write_all, time_read_all, time_filter, "GPUread")
+    adjusted = adjust_utils.adjust_cells(covariate_cells(time_read_all, covariates_all, time_filter, args.adjust or ()), args, "GPUread")
+    frames = adjust_utils.merge(frames, adjusted)
+    bootstrap_utils.compare_cells(frames, args, "GPUread")
+    roc_utils.compare_cells(frames, args, "GPUread")
+    mi_utils.compare_cells(frames, args, "GPUread")
     # Plot GPU frequency and memory utilization  (peak RSS) for sanity check
-    plot_gpu_mem(gpu_all, mem_all,  "GPUread_gpu_mem")
+    plot_gpu_mem(gpu_all, mem_all, args.filter, "GPUread_gpu_mem")
+    if args.frame_readings:
+        plot_gpu_mem(frame_gpu_all, frame_mem_all, args.filter, "GPUread_frame_gpu_mem")
 
     # write-only worload
     read_all = {}
     write_all = {}
     time_write_all = {}
+    time_write_stats = {}
     band_write = {}
     mem_all = {}
     gpu_all = {}
-    for counter in range(total, total*2):
-
-        curr_imc_file = imc_files[counter]
-        curr_time_file = time_files[counter]
-        curr_mem_file = mem_files[counter]
-        curr_gpu_file = gpu_files[counter]
-
-        curr_read, curr_write, curr_band, curr_time, curr_gpu, curr_mem = parse_files(curr_imc_file, curr_time_file, curr_gpu_file, curr_mem_file, CPUFreq)
-        label_time = curr_time_file.split("/")[-1].split(".txt")[0]
-
-        read_all.setdefault(label_time, []).extend(curr_read)
-        write_all.setdefault(label_time, []).extend(curr_write)
-        time_write_all.setdefault(label_time, []).extend(curr_time)
-        band_write.setdefault(label_time, []).extend(curr_band)
-        mem_all.setdefault(label_time, []).extend(curr_mem)
-        gpu_all.setdefault(label_time, []).extend(curr_gpu)
+    frame_mem_all = {}
+    frame_gpu_all = {}
+    covariates_all = {}
+    segments = {}
+    with profile_utils.stage("group_write"):
+        for counter in range(total, len(runs)):
+
+            curr_time_file = time_files[counter]
+
+            curr_frames, curr_band, curr_gpu, curr_mem, segments[os.path.relpath(curr_time_file, time_dir)], _ = results[counter]
+            results[counter] = None
+            label_time = labels[counter]
+
+            if args.stream:
+                band_write.setdefault(label_time, stats_utils.RunningStats()).merge(curr_band)
+            else:
+                band_write.setdefault(label_time, []).extend(curr_band.tolist())
+            mem_all.setdefault(label_time, []).extend(curr_mem.tolist())
+            gpu_all.setdefault(label_time, []).extend(curr_gpu.tolist())
+            # The bandwidth plot filters the rendering times on their own (reduced to their mean and std below)
+            time_write_stats.setdefault(label_time, []).append(curr_frames['render_time'].copy())
+            if args.frame_readings:
+                frame_mem_all.setdefault(label_time, []).extend(curr_frames['peak_rss'].tolist())
+                frame_gpu_all.setdefault(label_time, []).extend(curr_frames['gpu_freq'].tolist())
+
+            # Keep only the frames within the bounds (and their traffic and covariates)
+            covariates = adjust_utils.frame_covariates(curr_frames, curr_frames['read'] + curr_frames['write'], CPUFreq)
+            kept = filter_utils.bounds_mask(curr_frames['render_time'], bounds[label_time])
+            curr_frames = curr_frames[kept]
+            read_all.setdefault(label_time, []).extend(curr_frames['read'].tolist())
+            write_all.setdefault(label_time, []).extend(curr_frames['write'].tolist())
+            time_write_all.setdefault(label_time, []).extend(curr_frames['render_time'].tolist())
+            for name, values in covariates.items():
+                covariates_all.setdefault(label_time, {}).setdefault(name, []).extend(values[kept].tolist())
+        time_write_stats = {label: band_stats(np.concatenate(times), args.filter) for label, times in time_write_stats.items()}
 
     # Plot the DRAM read and write data of write-only workload (compressible and non-compressible texture) as workload complexity increases       
-    plot_single(read_all, write_all, time_write_all, "GPUwrite")
+    segment_utils.report("GPUwrite", segments)
+    frames = plot_single(read_all, write_all, time_write_all, time_filter, "GPUwrite")
+    adjusted = adjust_utils.adjust_cells(covariate_cells(time_write_all, covariates_all, time_filter, args.adjust or ()), args, "GPUwrite")
+    frames = adjust_utils.merge(frames, adjusted)
+    bootstrap_utils.compare_cells(frames, args, "GPUwrite")
+    roc_utils.compare_cells(frames, args, "GPUwrite")
+    mi_utils.compare_cells(frames, args, "GPUwrite")
     # Plot GPU frequency and memory utilization  (peak RSS) for sanity check
-    plot_gpu_mem(gpu_all, mem_all,  "GPUwrite_gpu_mem")
+    plot_gpu_mem(gpu_all, mem_all, args.filter, "GPUwrite_gpu_mem")
+    if args.frame_readings:
+        plot_gpu_mem(frame_gpu_all, frame_mem_all, args.filter, "GPUwrite_frame_gpu_mem")
     
-    plot_bandwidth(band_read, band_write, time_read_all, time_write_all, "GPU-band-total")
+    with profile_utils.stage("band_stats"):
+        # Filtered bandwidth statistics of each label
+        if args.stream and not args.filter:
+            band_read = {label: stats.summary() for label, stats in band_read.items()}
+            band_write = {label: stats.summary() for label, stats in band_write.items()}
+        elif args.stream:
+            # Second pass over the traces, now that the mean and std of every label are known
+            k = args.filter[0][1][0] if args.filter[0][1] else 4
+            band_groups = []
+            for counter in range(len(runs)):
+                label_time = time_files[counter].split("/")[-1].split(".txt")[0]
+                label_stats = (band_read if counter < total else band_write)[label_time]
+                band_groups.append((imc_files[counter], time_files[counter], CPUFreq, args.chunk_size, k) + label_stats.summary())
+            band_results = profile_utils.map_files("band_stats_stream", band_stats_stream, band_groups, args.jobs)
+            band_read_filtered = {}
+            band_write_filtered = {}
+            for counter in range(len(runs)):
+                label_time = time_files[counter].split("/")[-1].split(".txt")[0]
+                band_filtered = band_read_filtered if counter < total else band_write_filtered
+                band_filtered.setdefault(label_time, stats_utils.RunningStats()).merge(band_results[counter])
+            band_read = {label: stats.summary() for label, stats in band_read_filtered.items()}
+            band_write = {label: stats.summary() for label, stats in band_write_filtered.items()}
+        else:
+            band_read = {label: band_stats(trace, args.filter) for label, trace in band_read.items()}
+            band_write = {label: band_stats(trace, args.filter) for label, trace in band_write.items()}
+
+    plot_bandwidth(band_read, band_write, time_read_stats, time_write_stats, "GPU-band-total")
+    if args.stats_only:
+        report_utils.dump(tsc_ghz=CPUFreq, runs=len(runs))
     
 if __name__ == "__main__":
     main()
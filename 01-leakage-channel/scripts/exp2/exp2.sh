@@ -4,6 +4,8 @@
 sudo modprobe msr
 
 
+# Resumable alternative: sudo python3 ../../../util/trace_campaign.py exp2.json ../../data/exp2-campaign
+
 # Setup
 samples=400000 # 400 seconds
 date=`date +"%m%d-%H%M"`
@@ -120,7 +122,20 @@ echo ../../../poc/gpu-create/bin/texture 1.0 44 3000 1 10000000 >> input.txt
 echo ../../../poc/gpu-create/bin/texture 100.0 44 3000 1 10000000 >> input.txt
 echo ../../../poc/gpu-create/bin/texture 101.0 44 3000 1 10000000 >> input.txt
 
+# ./exp2.sh --sequential: stop every configuration once its pattern differences
+# are resolved, ${samples} samples at most (see util/trace_sequential.py)
+if [ "$1" == "--sequential" ]; then
+    sudo mv input.txt sweep.txt
+    sudo python3 ../../../util/trace_sequential.py sweep.txt ../../data/exp2-seq-${date} --driver ../../bin/driver --gpu 1 --imc 1 --max-samples ${samples}
+    sudo modprobe -r msr
+    exit
+fi
+
 sudo ../../bin/driver 1 1 ${samples} 1
+
+# Add the CPU, GPU and kernel to the metadata.json written by the driver
+sudo python3 ../../../util/metadata_utils.py ./out
+
 sudo mkdir time-exp2-${date}
 sudo mv time_* ./time-exp2-${date}
 
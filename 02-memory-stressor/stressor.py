@@ -1,86 +1,108 @@
 from curses.ascii import isdigit
 import warnings
 warnings.simplefilter(action='ignore', category=FutureWarning)
-import cpuinfo
 import numpy as np
-import matplotlib.pyplot as plt
-import matplotlib.ticker as ticker
 import os
-import glob
 import argparse
-from distutils.dir_util import remove_tree
-import subprocess
-import platform
+import shutil
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "../util"))
+import adjust_utils
+import bootstrap_utils
+import cache_utils
+import catalog_utils
+import filter_utils
+import metadata_utils
+import mi_utils
+import pool_utils
+import profile_utils
+import report_utils
+import roc_utils
+import segment_utils
+import trace_utils
+
+# Bump when parse_arrays changes its output (invalidates cached results)
+PARSER_VERSION = 2
+
+def parse_arrays(time, CPUFreq):
+    begin, end = trace_utils.load_time(time)
+    return (end - begin) / (1000000*CPUFreq), adjust_utils.elapsed(begin, CPUFreq)
+
 
 def parse_files(time, CPUFreq):
 
-    time_total = []
-    with open(time) as f:
-        for line in f:
-            begin = int(line)
-            end = 0
-            try:
-                end = next(f)
-            except StopIteration:    
-                break
-            if(len(end) > 1):
-                time_total.append(float(int(end)-begin)/(1000000*CPUFreq))
+    time_total, elapsed = cache_utils.cached("stressor", PARSER_VERSION, [time], [CPUFreq], parse_arrays, time, CPUFreq)
+
+    return time_total, elapsed
+
 
-    return time_total
 
+# The rendering times and elapsed times of each number of stressors, over the frames the filter keeps
+# (those of plot_single), for adjust_utils.adjust_cells
+def covariate_cells(all_time_black, all_time_random, all_elapsed_black, all_elapsed_random, time_filter):
+    cells = {}
+    for label in all_time_black:
+        cells[int(label)] = {}
+        for pattern, all_time, all_elapsed in (("Black", all_time_black, all_elapsed_black), ("Random", all_time_random, all_elapsed_random)):
+            time_filtered, elapsed_filtered = filter_utils.apply_chain(time_filter, all_time[label], all_elapsed[label])
+            cells[int(label)][pattern] = (time_filtered, {'elapsed': elapsed_filtered})
+    return cells
 
 
-def plot_single(all_time_black, all_time_random, plot_name, name, unit):
+# Returns the filtered rendering times of each number of stressors, for bootstrap_utils.compare_cells
+@profile_utils.profiled
+def plot_single(all_time_black, all_time_random, time_filter, plot_name, name, unit):
 
+    frames = {}
     times_black = {}
     times_black_std = {}
     times_random = {}
     times_random_std = {}
 
-    # Parse data
-    for label, trace in all_time_black.items():
-        
-        # Filter time black outliers 
-        time_black_filtered = []
-        black_mean = np.mean(trace)
-        black_std = np.std(trace)
-        for curr_time in trace:
-            if ( abs(curr_time-black_mean) <= 4*black_std):
-                time_black_filtered.append(curr_time)
-
-        # Filter time random outliers 
-        time_random_filtered = []
-        random_mean = np.mean(all_time_random[label])
-        random_std = np.std(all_time_random[label])
-        for curr_time in all_time_random[label]:
-            if ( abs(curr_time-random_mean) <= 4*random_std):
-                time_random_filtered.append(curr_time)
-
-        # Store data for scatter
-        curr_label = int(label)
-        num_stressor = curr_label
-        
-        times_black[num_stressor] = np.mean(time_black_filtered)
-        times_random[num_stressor] = np.mean(time_random_filtered)
-        times_black_std[num_stressor] = np.std(time_black_filtered)
-        times_random_std[num_stressor] = np.std(time_random_filtered)
-
-    
-    # Plot all data
-    plt_label = []
-    plt_time_black = []
-    plt_time_black_std = []
-    plt_time_random = []
-    plt_time_random_std = []
-
-    for layer in times_black:
-        plt_label.append(layer)
-        plt_time_black.append(times_black[layer])
-        plt_time_black_std.append(times_black_std[layer])
-        plt_time_random.append(times_random[layer])
-        plt_time_random_std.append(times_random_std[layer])
-    
-    
+    key = '%s (%s)' % (name, unit)
+    with profile_utils.stage("filter"):
+        for label, trace in all_time_black.items():
+
+            # Filter time black and random outliers
+            time_black_filtered = filter_utils.apply_chain(time_filter, trace)
+            time_random_filtered = filter_utils.apply_chain(time_filter, all_time_random[label])
+
+            # Store data for scatter
+            curr_label = int(label)
+            num_stressor = curr_label
+            frames[num_stressor] = {"Black": {key: time_black_filtered}, "Random": {key: time_random_filtered}}
+
+    with profile_utils.stage("stats"):
+        for num_stressor, patterns in frames.items():
+            time_black_filtered, time_random_filtered = patterns["Black"][key], patterns["Random"][key]
+            times_black[num_stressor] = np.mean(time_black_filtered)
+            times_random[num_stressor] = np.mean(time_random_filtered)
+            times_black_std[num_stressor] = np.std(time_black_filtered)
+            times_random_std[num_stressor] = np.std(time_random_filtered)
+
+        # Plot all data
+        plt_label = []
+        plt_time_black = []
+        plt_time_black_std = []
+        plt_time_random = []
+        plt_time_random_std = []
+
+        for layer in times_black:
+            plt_label.append(layer)
+            plt_time_black.append(times_black[layer])
+            plt_time_black_std.append(times_black_std[layer])
+            plt_time_random.append(times_random[layer])
+            plt_time_random_std.append(times_random_std[layer])
+
+        report_utils.record(plot_name, {
+            "rendering_time_ms": report_utils.series(plt_label, plt_time_black, plt_time_black_std, plt_time_random, plt_time_random_std, "stressors"),
+        })
+    if report_utils.stats_only():
+        return frames
+
+    import matplotlib.pyplot as plt
+    import matplotlib.ticker as ticker
     fig, a1 = plt.subplots(1, 1, figsize=(3, 2))
 
     plt.scatter(plt_label, plt_time_black, s=2, c = "navy", label="Compressible")
@@ -100,110 +122,92 @@ def plot_single(all_time_black, all_time_random, plot_name, name, unit):
     plt.legend(loc='upper center', bbox_to_anchor=(0.42, 1.35), ncol=2, markerscale=4, fontsize=8)
     plt.subplots_adjust(left=0.16,top=0.80,right=0.98,bottom=0.2)
 
-    plt.savefig("./plot/%s.pdf" % plot_name, dpi=300)
+    with profile_utils.stage("savefig", plot_name):
+        plt.savefig("./plot/%s.pdf" % plot_name, dpi=300)
 
-    
+    return frames
 
-def get_cpu_frequency():
-    """Get CPU frequency in GHz, supporting both Intel and AMD processors"""
-    try:
-        info = cpuinfo.get_cpu_info()
-        # Try to get advertised frequency
-        if "hz_advertised" in info and info["hz_advertised"]:
-            freq_hz = info["hz_advertised"][0] if isinstance(info["hz_advertised"], list) else info["hz_advertised"]
-            return float(freq_hz / 1000000000)
-        elif "hz_actual" in info and info["hz_actual"]:
-            freq_hz = info["hz_actual"][0] if isinstance(info["hz_actual"], list) else info["hz_actual"]
-            return float(freq_hz / 1000000000)
-        else:
-            # Fallback: try to parse from brand string
-            brand = info.get("brand_raw", "")
-            import re
-            match = re.search(r'(\d+\.?\d*)\s*GHz', brand)
-            if match:
-                return float(match.group(1))
-    except Exception as e:
-        print(f"Warning: Could not determine CPU frequency automatically: {e}")
     
-    # Default fallback
-    print("Using default CPU frequency of 3.0 GHz")
-    return 3.0
-
-def detect_gpu_type():
-    """Detect GPU type (Intel iGPU, AMD Radeon, or NVIDIA)"""
-    try:
-        if platform.system() == "Linux":
-            result = subprocess.run(['lspci'], capture_output=True, text=True)
-            output = result.stdout.lower()
-            if 'nvidia' in output and ('vga' in output or '3d' in output):
-                return "NVIDIA dGPU"
-            elif 'amd' in output or 'radeon' in output:
-                if 'vga' in output:
-                    return "AMD Radeon iGPU"
-            elif 'intel' in output and 'vga' in output:
-                return "Intel iGPU"
-    except:
-        pass
-    return "Unknown GPU"
 
 def main():
-    # Prepare output directory
-    try:
-        remove_tree('plot')
-    except:
-        pass
-    try:
-        os.makedirs('plot')
-    except:
-        pass
-    
     # Parse arguments
     parser = argparse.ArgumentParser(description='Analyze GPU memory stressor results for Intel/AMD/NVIDIA GPUs')
     parser.add_argument('folder', help='Directory containing timing data')
-    parser.add_argument('--cpu-freq', type=float, default=None, 
-                       help='CPU frequency in GHz (auto-detected if not specified)')
+    cache_utils.add_arguments(parser)
+    pool_utils.add_arguments(parser)
+    catalog_utils.add_arguments(parser)
+    metadata_utils.add_arguments(parser)
+    profile_utils.add_arguments(parser)
+    report_utils.add_arguments(parser)
+    bootstrap_utils.add_arguments(parser)
+    roc_utils.add_arguments(parser)
+    mi_utils.add_arguments(parser)
+    # The stressor runs record no GPU traces, only the drift over a run can be regressed out
+    adjust_utils.add_arguments(parser, ('elapsed',), 'elapsed')
+    segment_utils.add_arguments(parser)
+    parser.add_argument('--filter', type=filter_utils.parse_chain, default='sigma:4',
+                        help='Filter chain of the rendering times (default: %(default)s)')
     args = parser.parse_args()
+    cache_utils.configure(args)
+    report_utils.configure(args)
+
+    # Prepare output directory
+    if not args.stats_only:
+        shutil.rmtree('plot', ignore_errors=True)
+        os.makedirs('plot', exist_ok=True)
+    profile_utils.configure(args, "plot")
     in_dir = args.folder
     
-    # Get CPU frequency
-    if args.cpu_freq:
-        CPUFreq = args.cpu_freq
-        print(f"Using specified CPU frequency: {CPUFreq} GHz")
-    else:
-        CPUFreq = get_cpu_frequency()
-        print(f"Auto-detected CPU frequency: {CPUFreq} GHz")
-    
-    # Detect GPU type
-    gpu_type = detect_gpu_type()
-    print(f"Detected GPU: {gpu_type}")
-    
-    info = cpuinfo.get_cpu_info()
-    cpu_brand = info.get("brand_raw", "Unknown CPU")
-    print(f"CPU: {cpu_brand}")
-
-    # Read data
-    time_files = sorted(glob.glob(in_dir + "/out*/time*"), reverse=True)
-    time_files.sort(key=lambda x: os.path.getmtime(x))
+    # CPU frequency, GPU and CPU of the machine that recorded the data
+    metadata = metadata_utils.resolve(args, in_dir)
+    CPUFreq = metadata['tsc_hz'] / 1e9
+    if not args.stats_only:
+        print(f"CPU frequency ({metadata['tsc_source']}): {CPUFreq} GHz")
+        print(f"GPU: {metadata.get('gpu') or 'Unknown GPU'}")
+        print(f"CPU: {metadata.get('cpu') or 'Unknown CPU'}")
+
+    # Look up the time files of every run (in out-<number of stressors> directories)
+    with profile_utils.stage("catalog"):
+        runs = [run for run in catalog_utils.query(None, in_dir, args.where, args.rebuild_catalog) if run['stressors'] is not None]
+    time_files = [run['time'] for run in runs]
 
     total = int(len(time_files))
     
     # parse data by num_stressor, and patter (black or random)
     time_all_black = {}
     time_all_random = {}
-    for counter in range(total):
-
-        curr_time_file = time_files[counter]
-        curr_time_file_bw = int(float(curr_time_file.split("_")[3]))
-        curr_time = parse_files(curr_time_file, CPUFreq)
-
-        label = curr_time_file.split("/")[-2]
-        selector = int(label.split("out-")[1])
-        if(curr_time_file_bw == 0):
-            time_all_black.setdefault(selector, []).extend(curr_time)
-        else:
-            time_all_random.setdefault(selector, []).extend(curr_time)
+    elapsed_all_black = {}
+    elapsed_all_random = {}
+    segments = {}
+    with profile_utils.stage("parse"):
+        results = profile_utils.map_files("parse_files", parse_files, [(time_file, CPUFreq) for time_file in time_files], args.jobs)
+    with profile_utils.stage("group"):
+        for counter in range(total):
+
+            curr_time_file_bw = int(runs[counter]['pattern'])
+            # Steady-state frames of the run (the stressor runs have no traffic or GPU traces)
+            curr_time, curr_elapsed = results[counter]
+            steady, segments[os.path.relpath(time_files[counter], in_dir)] = segment_utils.steady_mask((curr_time,), args)
+            curr_time, curr_elapsed = curr_time[steady], curr_elapsed[steady]
+
+            selector = runs[counter]['stressors']
+            if(curr_time_file_bw == 0):
+                time_all_black.setdefault(selector, []).extend(curr_time.tolist())
+                elapsed_all_black.setdefault(selector, []).extend(curr_elapsed.tolist())
+            else:
+                time_all_random.setdefault(selector, []).extend(curr_time.tolist())
+                elapsed_all_random.setdefault(selector, []).extend(curr_elapsed.tolist())
         
-    plot_single(time_all_black, time_all_random, "memory-stressor", "Rendering time", "ms")
+    segment_utils.report("memory-stressor", segments)
+    frames = plot_single(time_all_black, time_all_random, args.filter, "memory-stressor", "Rendering time", "ms")
+    adjusted = adjust_utils.adjust_cells(covariate_cells(time_all_black, time_all_random, elapsed_all_black, elapsed_all_random, args.filter),
+                                         args, "memory-stressor", key_name="stressors")
+    frames = adjust_utils.merge(frames, adjusted)
+    bootstrap_utils.compare_cells(frames, args, "memory-stressor", key_name="stressors")
+    roc_utils.compare_cells(frames, args, "memory-stressor", key_name="stressors")
+    mi_utils.compare_cells(frames, args, "memory-stressor", key_name="stressors")
+    if args.stats_only:
+        report_utils.dump(tsc_ghz=CPUFreq, tsc_source=metadata['tsc_source'], gpu=metadata.get('gpu'), cpu=metadata.get('cpu'), runs=total)
 
 if __name__ == "__main__":
     main()
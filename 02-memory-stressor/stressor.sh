@@ -1,6 +1,7 @@
 #!/usr/bin/env bash
 
 # Supports: Intel iGPU, AMD Radeon iGPU, NVIDIA GeForce dGPU
+# Resumable alternative: python3 ../util/trace_campaign.py stressor.json ./campaign
 
 # Detect GPU type
 detect_gpu() {
@@ -80,5 +81,8 @@ do
     echo "Completed test $i/$MAX_STRESSOR"
 done
 
+# Record the CPU, GPU, kernel and sampling parameters next to the results
+python3 ../util/metadata_utils.py ./time --set max_stressors=$MAX_STRESSOR --set samples=10000 --set layers=10 --set warmup_s=30
+
 echo "All tests completed. Results saved in ./time/"
 echo "Run: python stressor.py ./time/ to generate plots"
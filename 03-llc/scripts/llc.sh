@@ -1,4 +1,5 @@
 #!/usr/bin/env bash
+# Resumable alternative: python3 ../../util/trace_campaign.py llc.json ./campaign
 rm -r data
 mkdir data
 
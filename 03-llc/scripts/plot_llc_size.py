@@ -2,42 +2,66 @@ import warnings
 warnings.simplefilter(action='ignore', category=FutureWarning)
 
 import numpy as np
-import matplotlib.pyplot as plt
-import matplotlib.ticker as ticker
 import os
-import numpy as np
 import glob
 import argparse
-from distutils.dir_util import remove_tree
+import shutil
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "../../util"))
+import bootstrap_utils
+import cache_utils
+import filter_utils
+import mi_utils
+import pool_utils
+import profile_utils
+import report_utils
+import roc_utils
+import stats_utils
+import trace_utils
+
+
+# Bump when parse_stats changes its output (invalidates cached results)
+PARSER_VERSION = 1
+
 
+def parse_file(fn, sample_filter, quantile_error, exact_limit):
+    stats, = cache_utils.cached("llc", PARSER_VERSION, [fn], [sample_filter, quantile_error, exact_limit], parse_stats, fn, sample_filter, quantile_error, exact_limit)
+    return stats[0], stats[1]
 
-def parse_file(fn):
-    with open(fn, 'r') as in_file: 
-        in_data = in_file.read().splitlines()
 
-    readings = np.array([float(x)/1000 for x in in_data])
-    samples_filtered = []
-    samples_low = np.percentile(readings, 5)
-    samples_high = np.percentile(readings, 95)
-    for sample in readings:
-        if ((sample >= samples_low) and (sample <= samples_high)):
-            samples_filtered.append(sample)
-    return np.mean(samples_filtered),np.std(samples_filtered)
+def parse_stats(fn, sample_filter, quantile_error, exact_limit):
+    readings = trace_utils.load_readings(fn)/1000
+    sketch = stats_utils.QuantileSketch(quantile_error, exact_limit).update(readings)
+    with profile_utils.stage("filter", fn):
+        samples_filtered = filter_utils.apply_chain(sample_filter, readings, sketch=sketch)
+    with profile_utils.stage("stats", fn):
+        return (np.array([np.mean(samples_filtered),np.std(samples_filtered)]),)
 
 
+@profile_utils.profiled
 def plot(myDict):	
-    labels = []
-    time_0 = []
-    time_1 = []
-    time_0_std = []
-    time_1_std = []
-    for x in myDict:
-        labels.append(float(x*x*4/1024/1024))
-        time_0.append(myDict[x][0][0])
-        time_1.append(myDict[x][1][0])
-        time_0_std.append(myDict[x][0][1])
-        time_1_std.append(myDict[x][1][1])
-    
+    with profile_utils.stage("stats"):
+        labels = []
+        time_0 = []
+        time_1 = []
+        time_0_std = []
+        time_1_std = []
+        for x in myDict:
+            labels.append(float(x*x*4/1024/1024))
+            time_0.append(myDict[x][0][0])
+            time_1.append(myDict[x][1][0])
+            time_0_std.append(myDict[x][0][1])
+            time_1_std.append(myDict[x][1][1])
+
+        report_utils.record("llc_size", {
+            "llc_walk_time_ms": report_utils.series(labels, time_0, time_0_std, time_1, time_1_std, "texture_mib"),
+        })
+    if report_utils.stats_only():
+        return
+
+    import matplotlib.pyplot as plt
+    import matplotlib.ticker as ticker
     fig, a1 = plt.subplots(1, 1, figsize=(3, 2))
     plt.xlabel('Texture size (MiB)', fontsize = 8)
     plt.ylabel('LLC walk time (ms)', fontsize = 8)
@@ -57,41 +81,65 @@ def plot(myDict):
     plt.legend(loc='upper center', bbox_to_anchor=(0.42, 1.35), ncol=2, markerscale=4, fontsize=8)
     plt.subplots_adjust(left=0.16,top=0.80,right=0.98,bottom=0.2)
 
-    plt.savefig("./plot/llc_size.pdf", dpi=300)
+    with profile_utils.stage("savefig", "llc_size"):
+        plt.savefig("./plot/llc_size.pdf", dpi=300)
 
 
 def main():
-    # Prepare output directory
-    try:
-        remove_tree('plot')
-    except:
-        pass
     out_dir = 'plot'
-    try:
-        os.makedirs(out_dir)
-    except:
-        pass
 
     parser = argparse.ArgumentParser()
     parser.add_argument('folder')
+    cache_utils.add_arguments(parser)
+    pool_utils.add_arguments(parser)
+    stats_utils.add_arguments(parser)
+    profile_utils.add_arguments(parser)
+    report_utils.add_arguments(parser)
+    bootstrap_utils.add_arguments(parser)
+    roc_utils.add_arguments(parser)
+    mi_utils.add_arguments(parser)
+    parser.add_argument('--filter', type=filter_utils.parse_chain, default='percentile:5:95',
+                        help='Filter chain of the LLC walk times (default: %(default)s)')
 
     args = parser.parse_args()
+    cache_utils.configure(args)
+    report_utils.configure(args)
+
+    # Prepare output directory
+    if not args.stats_only:
+        shutil.rmtree(out_dir, ignore_errors=True)
+        os.makedirs(out_dir, exist_ok=True)
+    profile_utils.configure(args, out_dir)
     data_folder = args.folder
     files = sorted(glob.glob(data_folder + "/*"), reverse=True)
 
     size_dict = {}
+    walks = {}
     for f in files:
         size = int(f.split(".txt")[0].split("_")[-1])
         bw = int(f.split("w")[1].split("_")[0])
-        time, time_std = parse_file(f)
+        with profile_utils.stage("parse_file", f):
+            time, time_std = parse_file(f, args.filter, args.quantile_error, args.exact_quantiles)
         if(size not in size_dict):
             size_dict[size] = {}
             size_dict[size][bw] = (time, time_std)
         else:
             size_dict[size][bw] = (time, time_std)
+        # The bootstrap, the ROC and the MI need every filtered walk, not only the cached mean and std
+        if args.bootstrap or args.roc or args.mi:
+            walks.setdefault(size, {})[bw] = filter_utils.apply_chain(args.filter, trace_utils.load_readings(f)/1000)
 
     # Plot LLC walk time vs texture size for compressible and non-compressible textures.
     plot(size_dict)
 
+    # Compressible vs non-compressible walk times of every texture size
+    cells = {size*size*4/1024/1024: {"Compressible": {"LLC walk time (ms)": walk[0]}, "Non-compressible": {"LLC walk time (ms)": walk[1]}}
+             for size, walk in walks.items() if 0 in walk and 1 in walk}
+    bootstrap_utils.compare_cells(cells, args, "llc_size", key_name="texture_mib")
+    roc_utils.compare_cells(cells, args, "llc_size", key_name="texture_mib")
+    mi_utils.compare_cells(cells, args, "llc_size", key_name="texture_mib")
+    if args.stats_only:
+        report_utils.dump(files=len(files))
+
 if __name__ == "__main__":
     main()
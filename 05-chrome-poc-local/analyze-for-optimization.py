@@ -1,9 +1,13 @@
 #!/usr/bin/env python3
 """Quick analysis to optimize grid search"""
-import json
+import argparse
 
-with open('characterization_results_2025-10-31T19-43-07-154Z.json', 'r') as f:
-    data = json.load(f)
+import result_store
+
+parser = argparse.ArgumentParser(description='Rank the tested configurations by ratio')
+result_store.add_arguments(parser)
+source, data = result_store.load_records(parser.parse_args())
+print(f"Results: {source}")
 
 valid = [r for r in data if r.get('results') and r.get('results', {}).get('ratio')]
 valid.sort(key=lambda x: x['results']['ratio'], reverse=True)
@@ -0,0 +1,185 @@
+"""
+Columnar loading and group-by aggregation of characterization results
+
+The characterization page saves a JSON array of {config, results} records
+per run. load_table() decodes the array one record at a time and flattens
+the records into one NumPy column per config and results field, so a
+statistic over all tests is a single array operation. aggregate() encodes
+every parameter once and computes the per-parameter and pairwise tables of a
+value with bincount over the codes, instead of regrouping the records for
+each parameter.
+"""
+
+import json
+import itertools
+from dataclasses import dataclass
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+# Bytes read at a time while decoding a results file
+CHUNK_SIZE = 1 << 20
+
+
+def iter_records(filename: str, chunk_size: int = CHUNK_SIZE) -> Iterator[Dict[str, Any]]:
+    """Yield the records of a JSON array file one at a time, reading it in chunks"""
+    decoder = json.JSONDecoder()
+    with open(filename, 'r') as f:
+        buf = f.read(chunk_size).lstrip()
+        if not buf.startswith('['):
+            raise ValueError(f"{filename}: expected a JSON array")
+        pos = 1
+        eof = False
+        while True:
+            # Skip the separators up to the next record
+            while pos < len(buf) and buf[pos] in ' \t\r\n,':
+                pos += 1
+            if pos < len(buf) and buf[pos] == ']':
+                return
+            try:
+                if pos == len(buf):
+                    raise json.JSONDecodeError("end of chunk", buf, pos)
+                record, pos = decoder.raw_decode(buf, pos)
+            except json.JSONDecodeError:
+                if eof:
+                    raise
+                chunk = f.read(chunk_size)
+                eof = not chunk
+                buf = buf[pos:] + chunk
+                pos = 0
+                continue
+            yield record
+
+
+def _column(values: List[Any], present: List[bool]) -> np.ndarray:
+    """Typed array of a field: int64 or float64 if every present value is a number, else object"""
+    kept = [v for v, p in zip(values, present) if p]
+    if all(isinstance(v, (bool, int)) for v in kept):
+        return np.array([v if p else 0 for v, p in zip(values, present)], dtype=np.int64)
+    if all(isinstance(v, (bool, int, float)) for v in kept):
+        return np.array([v if p else np.nan for v, p in zip(values, present)], dtype=np.float64)
+    column = np.empty(len(values), dtype=object)
+    for i, value in enumerate(values):
+        column[i] = value
+    return column
+
+
+class ResultTable:
+    """The records of one or more results files, one array per field.
+
+    config[field] and results[field] hold the values of every test (0, NaN or
+    None where a test lacks the field, see has_config/has_result), fields
+    lists the config fields in the order of the first record that has them.
+    """
+
+    def __init__(self, records: Iterator[Dict[str, Any]]):
+        config: Dict[str, List[Any]] = {}
+        results: Dict[str, List[Any]] = {}
+        n = 0
+        has_results = []
+        for record in records:
+            for columns, values in ((config, record.get('config') or {}), (results, record.get('results') or {})):
+                for key, value in values.items():
+                    if key not in columns:
+                        # Tests before this one did not have the field
+                        columns[key] = [None] * n
+                    columns[key].append(value)
+                for key, column in columns.items():
+                    if len(column) == n:
+                        column.append(None)
+            has_results.append(record.get('results') is not None)
+            n += 1
+        self.fields = list(config)
+        self.has_results = np.array(has_results, dtype=bool)
+        self.has_config = {key: np.array([v is not None for v in values], dtype=bool) for key, values in config.items()}
+        self.has_result = {key: np.array([v is not None for v in values], dtype=bool) for key, values in results.items()}
+        self.config = {key: _column(values, self.has_config[key]) for key, values in config.items()}
+        self.results = {key: _column(values, self.has_result[key]) for key, values in results.items()}
+
+    def __len__(self) -> int:
+        return len(self.has_results)
+
+    def is_numeric(self, field: str) -> bool:
+        return self.config[field].dtype != object
+
+    def result_values(self, field: str) -> np.ndarray:
+        """results[field], NaN where missing, as float64"""
+        if field not in self.results:
+            return np.full(len(self), np.nan)
+        return np.where(self.has_result[field], self.results[field], np.nan).astype(np.float64)
+
+    def config_of(self, index: int) -> Dict[str, Any]:
+        """The config record of one test, as loaded"""
+        return {key: self.config[key][index].item() if self.is_numeric(key) else self.config[key][index]
+                for key in self.fields if self.has_config[key][index]}
+
+    def result_of(self, index: int) -> Dict[str, Any]:
+        return {key: column[index].item() if column.dtype != object else column[index]
+                for key, column in self.results.items() if self.has_result[key][index]}
+
+
+def load_table(*filenames: str) -> ResultTable:
+    """Load one or more characterization_results_*.json files into one table"""
+    return ResultTable(itertools.chain.from_iterable(iter_records(fn) for fn in filenames))
+
+
+@dataclass
+class GroupStats:
+    """Statistics of a value per group, groups sorted by their keys"""
+    fields: Tuple[str, ...]
+    keys: List[Tuple[Any, ...]]
+    count: np.ndarray
+    mean: np.ndarray
+    std: np.ndarray      # sample standard deviation, 0 for single-test groups
+    min: np.ndarray
+    max: np.ndarray
+
+    def rows(self) -> Iterator[Tuple[Tuple[Any, ...], int, float, float, float, float]]:
+        for i, key in enumerate(self.keys):
+            yield key, int(self.count[i]), float(self.mean[i]), float(self.std[i]), float(self.min[i]), float(self.max[i])
+
+
+def encode(table: ResultTable, field: str, mask: np.ndarray) -> Tuple[List[Any], np.ndarray]:
+    """Distinct values of a config field among the masked tests, and the code of every test (-1 if excluded)"""
+    present = mask & table.has_config[field]
+    codes = np.full(len(table), -1, dtype=np.int64)
+    if not present.any():
+        return [], codes
+    uniques, inverse = np.unique(table.config[field][present], return_inverse=True)
+    codes[present] = inverse
+    return [u.item() if table.is_numeric(field) else u for u in uniques], codes
+
+
+def group_stats(fields: Tuple[str, ...], encoded: List[Tuple[List[Any], np.ndarray]], values: np.ndarray) -> GroupStats:
+    """Count, mean, std, min and max of values per combination of the encoded fields"""
+    uniques = [u for u, _ in encoded]
+    dims = tuple(max(len(u), 1) for u in uniques)
+    keep = np.all([codes >= 0 for _, codes in encoded], axis=0) & ~np.isnan(values)
+    flat = np.ravel_multi_index(tuple(codes[keep] for _, codes in encoded), dims)
+    v = values[keep]
+    size = int(np.prod(dims))
+    count = np.bincount(flat, minlength=size)
+    groups = np.flatnonzero(count)
+    mean = np.bincount(flat, weights=v, minlength=size)[groups] / count[groups]
+    # Deviations from the group mean, for a stable variance
+    dev = v - mean[np.searchsorted(groups, flat)]
+    m2 = np.bincount(flat, weights=dev * dev, minlength=size)[groups]
+    n = count[groups]
+    std = np.where(n > 1, np.sqrt(m2 / np.maximum(n - 1, 1)), 0.0)
+    # Sorted by group, then value: the first and last of every group are its min and max
+    order = np.lexsort((v, flat))
+    ends = np.cumsum(n)
+    keys = [tuple(u[i] for u, i in zip(uniques, index)) for index in zip(*np.unravel_index(groups, dims))]
+    return GroupStats(fields, keys, n, mean, std, v[order][ends - n], v[order][ends - 1])
+
+
+def aggregate(table: ResultTable, fields: List[str], value: np.ndarray, mask: Optional[np.ndarray] = None,
+              pairs: bool = True) -> Dict[Tuple[str, ...], GroupStats]:
+    """Tables of value per field, and per pair of fields if pairs is set, keyed by the field tuple"""
+    mask = np.ones(len(table), dtype=bool) if mask is None else mask
+    encoded = {field: encode(table, field, mask) for field in fields}
+    tables = {(field,): group_stats((field,), [encoded[field]], value) for field in fields}
+    if pairs:
+        for a, b in itertools.combinations(fields, 2):
+            tables[(a, b)] = group_stats((a, b), [encoded[a], encoded[b]], value)
+    return tables
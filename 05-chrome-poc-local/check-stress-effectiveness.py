@@ -4,65 +4,75 @@ Analyze characterization results to check if memory stress is working
 and find the best configurations
 """
 
-import json
-import sys
 import os
-from typing import List, Dict, Any
+import argparse
 
-def load_results(filename: str) -> List[Dict[str, Any]]:
-    """Load results from JSON file"""
-    with open(filename, 'r') as f:
-        return json.load(f)
+import numpy as np
 
-def analyze_stress_effectiveness(results: List[Dict[str, Any]]):
+import result_store
+from characterization import ResultTable, encode
+
+def valid_mask(table: ResultTable) -> np.ndarray:
+    """Tests with a non-zero ratio"""
+    ratio = table.result_values('ratio')
+    return table.has_results & ~np.isnan(ratio) & (ratio != 0)
+
+def config_mask(table: ResultTable, param: str, value) -> np.ndarray:
+    """Tests whose config has param set to value"""
+    if param not in table.config:
+        return np.zeros(len(table), dtype=bool)
+    return table.has_config[param] & (table.config[param] == value)
+
+def analyze_stress_effectiveness(table: ResultTable):
     """Analyze whether memory stress is actually working"""
     print("="*80)
     print("MEMORY STRESS EFFECTIVENESS ANALYSIS")
     print("="*80)
     
-    valid_results = [r for r in results if r.get('results') and r.get('results', {}).get('ratio')]
+    valid = valid_mask(table)
     
-    if not valid_results:
+    if not valid.any():
         print("No valid results to analyze!")
         return
     
     # Separate stress vs no-stress
-    stress_results = [r for r in valid_results if r['config'].get('stress') == 1]
-    nostress_results = [r for r in valid_results if r['config'].get('stress') == 0]
+    stress = valid & config_mask(table, 'stress', 1)
+    nostress = valid & config_mask(table, 'stress', 0)
     
-    print(f"\nTotal valid tests: {len(valid_results)}")
-    print(f"  With stress enabled: {len(stress_results)}")
-    print(f"  Without stress: {len(nostress_results)}")
+    print(f"\nTotal valid tests: {int(valid.sum())}")
+    print(f"  With stress enabled: {int(stress.sum())}")
+    print(f"  Without stress: {int(nostress.sum())}")
     
-    if not stress_results:
+    if not stress.any():
         print("\n⚠️  WARNING: No tests with stress=1 found!")
         print("   Memory stress may not have been tested.")
         return
     
-    if not nostress_results:
+    if not nostress.any():
         print("\n⚠️  WARNING: No tests without stress found!")
         print("   Cannot compare stress effectiveness.")
         return
     
     # Calculate statistics
-    stress_ratios = [r['results']['ratio'] for r in stress_results]
-    nostress_ratios = [r['results']['ratio'] for r in nostress_results]
+    ratio = table.result_values('ratio')
+    stress_ratios = ratio[stress]
+    nostress_ratios = ratio[nostress]
     
-    stress_mean = sum(stress_ratios) / len(stress_ratios) if stress_ratios else 0
-    nostress_mean = sum(nostress_ratios) / len(nostress_ratios) if nostress_ratios else 0
-    stress_max = max(stress_ratios) if stress_ratios else 0
-    nostress_max = max(nostress_ratios) if nostress_ratios else 0
+    stress_mean = stress_ratios.mean()
+    nostress_mean = nostress_ratios.mean()
+    stress_max = stress_ratios.max()
+    nostress_max = nostress_ratios.max()
     
     print(f"\nRatio Statistics:")
     print(f"  With stress:")
     print(f"    Mean: {stress_mean:.3f}")
     print(f"    Max:  {stress_max:.3f}")
-    print(f"    Min:  {min(stress_ratios):.3f}")
+    print(f"    Min:  {stress_ratios.min():.3f}")
     
     print(f"  Without stress:")
     print(f"    Mean: {nostress_mean:.3f}")
     print(f"    Max:  {nostress_max:.3f}")
-    print(f"    Min:  {min(nostress_ratios):.3f}")
+    print(f"    Min:  {nostress_ratios.min():.3f}")
     
     # Analyze if stress is helping
     print(f"\n{'='*80}")
@@ -86,8 +96,8 @@ def analyze_stress_effectiveness(results: List[Dict[str, Any]]):
         print(f"⚠️  Stress has no effect on average ratio")
     
     # Check if ratios are close to 1.0 (bad separation)
-    stress_close_to_one = sum(1 for r in stress_ratios if abs(r - 1.0) < 0.01)
-    nostress_close_to_one = sum(1 for r in nostress_ratios if abs(r - 1.0) < 0.01)
+    stress_close_to_one = int((np.abs(stress_ratios - 1.0) < 0.01).sum())
+    nostress_close_to_one = int((np.abs(nostress_ratios - 1.0) < 0.01).sum())
     
     print(f"\n{'='*80}")
     print("SEPARATION QUALITY:")
@@ -108,27 +118,28 @@ def analyze_stress_effectiveness(results: List[Dict[str, Any]]):
     print("TOP 5 STRESS CONFIGURATIONS:")
     print("="*80)
     
-    stress_sorted = sorted(stress_results, key=lambda x: x['results']['ratio'], reverse=True)
-    for i, r in enumerate(stress_sorted[:5], 1):
-        c = r['config']
-        res = r['results']
+    for i, index in enumerate(by_ratio(table, stress)[:5], 1):
+        c = table.config_of(index)
+        res = table.result_of(index)
         print(f"\n{i}. Ratio: {res['ratio']:.3f} (Black: {res['blackTime']:.2f}ms, White: {res['whiteTime']:.2f}ms)")
         print(f"   Workers: {c.get('num_workers', 'N/A')}, Digits: {c.get('bigint_digits', 'N/A')}")
         print(f"   div_size: {c.get('div_size')}, layer: {c.get('layer')}")
         print(f"   time_collect: {c.get('time_collect')}ms, repetition: {c.get('repetition')}")
 
-def show_best_configs(results: List[Dict[str, Any]], top_n: int = 10):
+def by_ratio(table: ResultTable, mask: np.ndarray) -> np.ndarray:
+    """Indices of the masked tests, highest ratio first (ties in file order)"""
+    indices = np.flatnonzero(mask)
+    return indices[np.argsort(-table.result_values('ratio')[indices], kind='stable')]
+
+def show_best_configs(table: ResultTable, top_n: int = 10):
     """Show best configurations overall"""
     print(f"\n{'='*80}")
     print(f"TOP {top_n} CONFIGURATIONS (ALL)")
     print("="*80)
     
-    valid_results = [r for r in results if r.get('results') and r.get('results', {}).get('ratio')]
-    valid_results.sort(key=lambda x: x['results']['ratio'], reverse=True)
-    
-    for i, r in enumerate(valid_results[:top_n], 1):
-        c = r['config']
-        res = r['results']
+    for i, index in enumerate(by_ratio(table, valid_mask(table))[:top_n], 1):
+        c = table.config_of(index)
+        res = table.result_of(index)
         stress_info = ""
         if c.get('stress') == 1:
             stress_info = f" | Stress: {c.get('num_workers')} workers, {c.get('bigint_digits')} digits"
@@ -139,24 +150,29 @@ def show_best_configs(results: List[Dict[str, Any]], top_n: int = 10):
         print(f"   div_size: {c.get('div_size')}, layer: {c.get('layer')}{stress_info}")
         print(f"   time_collect: {c.get('time_collect')}ms, repetition: {c.get('repetition')}")
 
-def verify_stress_worker_counts(results: List[Dict[str, Any]]):
+def distinct_values(table: ResultTable, param: str, mask: np.ndarray) -> set:
+    """Values of param among the masked tests, 'unknown' standing for tests without it"""
+    if param not in table.config:
+        return {'unknown'}
+    values = set(encode(table, param, mask)[0])
+    if not table.has_config[param][mask].all():
+        values.add('unknown')
+    return values
+
+def verify_stress_worker_counts(table: ResultTable):
     """Check if different worker counts were tested"""
     print(f"\n{'='*80}")
     print("STRESS CONFIGURATION VARIETY")
     print("="*80)
     
-    stress_results = [r for r in results if r.get('config', {}).get('stress') == 1]
+    stress = config_mask(table, 'stress', 1)
     
-    if not stress_results:
+    if not stress.any():
         print("❌ No stress configurations found!")
         return
     
-    worker_counts = set()
-    digit_counts = set()
-    
-    for r in stress_results:
-        worker_counts.add(r['config'].get('num_workers', 'unknown'))
-        digit_counts.add(r['config'].get('bigint_digits', 'unknown'))
+    worker_counts = distinct_values(table, 'num_workers', stress)
+    digit_counts = distinct_values(table, 'bigint_digits', stress)
     
     print(f"\nWorker counts tested: {sorted(worker_counts)}")
     print(f"BigInt digits tested: {sorted(digit_counts)}")
@@ -167,40 +183,38 @@ def verify_stress_worker_counts(results: List[Dict[str, Any]]):
         print(f"⚠️  Only {list(digit_counts)[0]} digits tested - may need more variety")
 
 def main():
-    if len(sys.argv) < 2:
+    parser = argparse.ArgumentParser(description='Check whether memory stress improved the separation of the characterization runs')
+    result_store.add_arguments(parser)
+    args = parser.parse_args()
+    
+    if not args.files and not os.path.exists(args.store):
         # Try to find the most recent results file
         results_dir = os.path.dirname(os.path.abspath(__file__))
         json_files = [f for f in os.listdir(results_dir) if f.startswith('characterization_results_') and f.endswith('.json')]
         
         if json_files:
             json_files.sort(reverse=True)
-            filename = os.path.join(results_dir, json_files[0])
+            args.files = [os.path.join(results_dir, json_files[0])]
             print(f"Using most recent results file: {json_files[0]}")
         else:
-            print("Usage: python check-stress-effectiveness.py <results.json>")
-            print("\nOr place a characterization_results_*.json file in the same directory")
-            sys.exit(1)
-    else:
-        filename = sys.argv[1]
-    
-    if not os.path.exists(filename):
-        print(f"Error: File not found: {filename}")
-        sys.exit(1)
+            parser.print_usage()
+            print("\nIngest results into the store (result_store.py ingest) or place a characterization_results_*.json file in the same directory")
+            parser.exit(1)
     
-    print(f"Loading results from: {filename}")
-    results = load_results(filename)
+    source, table = result_store.load_table(args)
+    print(f"Loading results from: {source}")
     
     # Run analyses
-    analyze_stress_effectiveness(results)
-    verify_stress_worker_counts(results)
-    show_best_configs(results, top_n=10)
+    analyze_stress_effectiveness(table)
+    verify_stress_worker_counts(table)
+    show_best_configs(table, top_n=10)
     
     print(f"\n{'='*80}")
     print("RECOMMENDATIONS")
     print("="*80)
     
-    valid_results = [r for r in results if r.get('results') and r.get('results', {}).get('ratio')]
-    best_ratio = max([r['results']['ratio'] for r in valid_results]) if valid_results else 0
+    valid = valid_mask(table)
+    best_ratio = table.result_values('ratio')[valid].max() if valid.any() else 0
     
     if best_ratio < 1.1:
         print("\n❌ CRITICAL: No good separation found (best ratio < 1.1)")
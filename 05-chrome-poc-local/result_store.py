@@ -0,0 +1,278 @@
+#!/usr/bin/env python3
+"""
+SQLite store of characterization results across runs
+
+Every characterization run leaves its own characterization_results_*.json
+(run1/, run2/, run3/, ...). The store ingests any number of them into one
+SQLite database: a test is kept once per (config name, result timestamp), so
+a file copied next to the scripts or ingested twice adds nothing, and every
+config field gets a column and an index of its own, so questions across
+runs ("ratio distribution for layer=25") are a single indexed query instead
+of re-parsing every file. Failed tests (results null) have no timestamp and
+are kept per file.
+
+The analysis scripts take the same options (add_arguments/load_records):
+the files given are ingested, unless the store already holds them, and
+analyzed; without files the whole store is.
+
+Usage: python result_store.py ingest run*/characterization_results_*.json
+       python result_store.py runs
+       python result_store.py query --where layer=25 [--value ratio]
+"""
+
+import os
+import sys
+import json
+import hashlib
+import sqlite3
+import argparse
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+from characterization import ResultTable, iter_records
+
+DEFAULT_STORE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'results.sqlite')
+
+# Prefixes of the config and results field columns of the tests table
+CONFIG_PREFIX = 'config.'
+RESULT_PREFIX = 'results.'
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    id INTEGER PRIMARY KEY,
+    sha256 TEXT UNIQUE NOT NULL,
+    path TEXT NOT NULL,
+    tests INTEGER NOT NULL,
+    ingested TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+CREATE TABLE IF NOT EXISTS tests (
+    id INTEGER PRIMARY KEY,
+    name TEXT,
+    timestamp TEXT,
+    has_results INTEGER NOT NULL,
+    UNIQUE (name, timestamp)
+);
+CREATE TABLE IF NOT EXISTS file_tests (
+    file_id INTEGER NOT NULL REFERENCES files(id),
+    test_number INTEGER,
+    test_id INTEGER NOT NULL REFERENCES tests(id),
+    PRIMARY KEY (file_id, test_id)
+);
+CREATE INDEX IF NOT EXISTS file_tests_test ON file_tests (test_id);
+"""
+
+
+def parse_where(items: List[str]) -> Dict[str, Any]:
+    """field=value conditions, values parsed as JSON numbers where they are ones"""
+    where = {}
+    for item in items:
+        field, sep, value = item.partition('=')
+        if not sep:
+            raise ValueError(f"expected field=value, got {item!r}")
+        try:
+            where[field] = json.loads(value)
+        except json.JSONDecodeError:
+            where[field] = value
+    return where
+
+
+def _sha256(filename: str) -> str:
+    digest = hashlib.sha256()
+    with open(filename, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _sql_value(value: Any) -> Any:
+    """A field value as SQLite stores it, non-scalars as JSON text"""
+    if value is None or isinstance(value, (int, float, str)):
+        return value
+    return json.dumps(value)
+
+
+class ResultStore:
+    """A SQLite database of characterization tests, one column per config and results field"""
+
+    def __init__(self, path: str = DEFAULT_STORE):
+        self.path = path
+        self.db = sqlite3.connect(path)
+        self.db.executescript(SCHEMA)
+        self._load_columns()
+
+    def close(self):
+        self.db.close()
+
+    def _load_columns(self):
+        columns = [row[1] for row in self.db.execute("PRAGMA table_info(tests)")]
+        self.config_fields = [c[len(CONFIG_PREFIX):] for c in columns if c.startswith(CONFIG_PREFIX)]
+        self.result_fields = [c[len(RESULT_PREFIX):] for c in columns if c.startswith(RESULT_PREFIX)]
+
+    def _add_column(self, prefix: str, field: str):
+        column = prefix + field
+        self.db.execute(f'ALTER TABLE tests ADD COLUMN "{column}"')
+        if prefix == CONFIG_PREFIX:
+            self.db.execute(f'CREATE INDEX IF NOT EXISTS "tests_{column}" ON tests ("{column}")')
+            self.config_fields.append(field)
+        else:
+            self.result_fields.append(field)
+
+    def ingest(self, filename: str) -> Tuple[int, int, int, bool]:
+        """Add the tests of a results file: (file id, tests in the file, tests new to the store, whether the file was new)"""
+        digest = _sha256(filename)
+        row = self.db.execute("SELECT id, tests FROM files WHERE sha256 = ?", (digest,)).fetchone()
+        if row is not None:
+            return row[0], row[1], 0, False
+
+        with self.db:
+            file_id = self.db.execute("INSERT INTO files (sha256, path, tests) VALUES (?, ?, 0)",
+                                      (digest, os.path.abspath(filename))).lastrowid
+            n = added = 0
+            for record in iter_records(filename):
+                config = record.get('config') or {}
+                results = record.get('results')
+                for prefix, fields, values in ((CONFIG_PREFIX, self.config_fields, config),
+                                               (RESULT_PREFIX, self.result_fields, results or {})):
+                    for field in values:
+                        if field not in fields:
+                            self._add_column(prefix, field)
+                columns = ['name', 'timestamp', 'has_results'] + [f'"{CONFIG_PREFIX}{k}"' for k in config] + \
+                          [f'"{RESULT_PREFIX}{k}"' for k in (results or {})]
+                values = [config.get('name'), (results or {}).get('timestamp'), results is not None] + \
+                         [_sql_value(v) for v in config.values()] + [_sql_value(v) for v in (results or {}).values()]
+                cursor = self.db.execute(f"INSERT OR IGNORE INTO tests ({', '.join(columns)}) VALUES ({', '.join('?' * len(values))})",
+                                         values)
+                if cursor.rowcount:
+                    test_id = cursor.lastrowid
+                    added += 1
+                else:
+                    test_id = self.db.execute("SELECT id FROM tests WHERE name = ? AND timestamp = ?",
+                                              (values[0], values[1])).fetchone()[0]
+                self.db.execute("INSERT OR IGNORE INTO file_tests (file_id, test_number, test_id) VALUES (?, ?, ?)",
+                                (file_id, record.get('testNumber'), test_id))
+                n += 1
+            self.db.execute("UPDATE files SET tests = ? WHERE id = ?", (n, file_id))
+        return file_id, n, added, True
+
+    def _select(self, columns: str, file_ids: Optional[List[int]], where: Optional[Dict[str, Any]]) -> Tuple[str, List[Any]]:
+        """SELECT of columns over the tests of file_ids (all if None) that match where"""
+        conditions, params = [], []
+        for field, value in (where or {}).items():
+            if field not in self.config_fields:
+                raise KeyError(f"no config field {field!r} in the store")
+            conditions.append(f'tests."{CONFIG_PREFIX}{field}" = ?')
+            params.append(_sql_value(value))
+        if file_ids is not None:
+            conditions.append(f"file_tests.file_id IN ({', '.join('?' * len(file_ids))})")
+            params.extend(file_ids)
+        sql = f"SELECT {columns} FROM tests JOIN file_tests ON file_tests.test_id = tests.id " \
+              f"{'WHERE ' + ' AND '.join(conditions) if conditions else ''} " \
+              f"GROUP BY tests.id ORDER BY MIN(file_tests.rowid)"
+        return sql, params
+
+    def records(self, file_ids: Optional[List[int]] = None, where: Optional[Dict[str, Any]] = None) -> Iterator[Dict[str, Any]]:
+        """The tests as {testNumber, config, results} records, in ingestion order"""
+        config_columns = [f'tests."{CONFIG_PREFIX}{k}"' for k in self.config_fields]
+        result_columns = [f'tests."{RESULT_PREFIX}{k}"' for k in self.result_fields]
+        sql, params = self._select(', '.join(['MIN(file_tests.test_number)', 'tests.has_results'] + config_columns + result_columns),
+                                   file_ids, where)
+        n_config = len(config_columns)
+        for row in self.db.execute(sql, params):
+            config = {k: v for k, v in zip(self.config_fields, row[2:2 + n_config]) if v is not None}
+            results = {k: v for k, v in zip(self.result_fields, row[2 + n_config:]) if v is not None}
+            yield {'testNumber': row[0], 'config': config, 'results': results if row[1] else None}
+
+    def values(self, field: str, file_ids: Optional[List[int]] = None, where: Optional[Dict[str, Any]] = None) -> List[Tuple[str, Any]]:
+        """(file, value) of a results field for the matching tests, each test under the first file holding it"""
+        if field not in self.result_fields:
+            raise KeyError(f"no results field {field!r} in the store")
+        paths = dict(self.db.execute("SELECT id, path FROM files"))
+        sql, params = self._select(f'MIN(file_tests.file_id), tests."{RESULT_PREFIX}{field}"', file_ids, where)
+        return [(paths[file_id], value) for file_id, value in self.db.execute(sql, params) if value is not None]
+
+    def runs(self) -> List[Tuple[str, int, str]]:
+        """(path, tests, ingestion time) of every ingested file"""
+        return self.db.execute("SELECT path, tests, ingested FROM files ORDER BY id").fetchall()
+
+
+def add_arguments(parser: argparse.ArgumentParser):
+    """Add the result file and store options of the analysis scripts to an argparse parser"""
+    parser.add_argument('files', nargs='*', help='characterization_results_*.json files to analyze (default: the whole store)')
+    parser.add_argument('--store', default=DEFAULT_STORE, help='Result store (default: %(default)s)')
+    parser.add_argument('--where', action='append', default=[], metavar='FIELD=VALUE',
+                        help='Only tests with this config value, may be repeated')
+
+
+def load_records(args: argparse.Namespace) -> Tuple[str, List[Dict[str, Any]]]:
+    """Ingest args.files and return a description of the selection and its records"""
+    for filename in args.files:
+        if not os.path.exists(filename):
+            print(f"Error: File not found: {filename}")
+            sys.exit(1)
+    try:
+        where = parse_where(args.where)
+    except ValueError as e:
+        print(f"Error: {e}")
+        sys.exit(1)
+    store = ResultStore(args.store)
+    try:
+        file_ids = [store.ingest(filename)[0] for filename in args.files] if args.files else None
+        source = ', '.join(args.files) if args.files else f"{args.store} ({len(store.runs())} files)"
+        if where:
+            source += ' where ' + ', '.join(f"{k}={v}" for k, v in where.items())
+        try:
+            return source, list(store.records(file_ids, where))
+        except KeyError as e:
+            print(f"Error: {e.args[0]}")
+            sys.exit(1)
+    finally:
+        store.close()
+
+
+def load_table(args: argparse.Namespace) -> Tuple[str, ResultTable]:
+    source, records = load_records(args)
+    return source, ResultTable(records)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Store of characterization results across runs')
+    parser.add_argument('--store', default=DEFAULT_STORE, help='Result store (default: %(default)s)')
+    commands = parser.add_subparsers(dest='command', required=True)
+    ingest = commands.add_parser('ingest', help='Add results files to the store')
+    ingest.add_argument('files', nargs='+')
+    commands.add_parser('runs', help='List the ingested files')
+    query = commands.add_parser('query', help='Distribution of a results field per file and over all')
+    query.add_argument('--where', action='append', default=[], metavar='FIELD=VALUE',
+                       help='Only tests with this config value, may be repeated')
+    query.add_argument('--value', default='ratio', help='Results field (default: %(default)s)')
+    args = parser.parse_args()
+
+    store = ResultStore(args.store)
+    if args.command == 'ingest':
+        for filename in args.files:
+            _, n, added, new = store.ingest(filename)
+            print(f"{filename}: {n} tests, {added} new" + ("" if new else " (already ingested)"))
+    elif args.command == 'runs':
+        for path, n, ingested in store.runs():
+            print(f"{ingested}  {n:5d}  {path}")
+    else:
+        try:
+            rows = store.values(args.value, where=parse_where(args.where))
+        except (KeyError, ValueError) as e:
+            parser.error(e.args[0])
+        groups: Dict[str, List[float]] = {}
+        for path, value in rows:
+            groups.setdefault(os.path.relpath(path), []).append(value)
+        if rows:
+            groups['all'] = [value for _, value in rows]
+        print(f"{'File':<60} {'Count':>6} {'Mean':>8} {'Std':>8} {'Min':>8} {'Median':>8} {'Max':>8}")
+        for name, values in groups.items():
+            v = np.array(values, dtype=np.float64)
+            std = v.std(ddof=1) if len(v) > 1 else 0.0
+            print(f"{name:<60} {len(v):>6} {v.mean():>8.3f} {std:>8.3f} {v.min():>8.3f} {np.median(v):>8.3f} {v.max():>8.3f}")
+    store.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -2,25 +2,25 @@ import warnings
 warnings.simplefilter(action='ignore', category=FutureWarning)
 
 import numpy as np
-import matplotlib.pyplot as plt
 import os
 import argparse
 import sys
 import json
 
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "../../../util"))
+import filter_utils
+import profile_utils
+import report_utils
+import roc_utils
+import trace_utils
+
+# Exclude negative samples (due to counter overflow), then outliers
+DEFAULT_FILTER = 'positive,sigma:4'
+
+@profile_utils.profiled
 def parse_file(fn):
-    readings = []
     try:
-        with open(fn) as f:
-            for line in f:
-                begin = int(line)
-                end = 0
-                try:
-                    end = next(f)
-                except StopIteration:    
-                    break
-                if(len(end) > 1):
-                    readings.append(int(end)-begin)
+        readings = trace_utils.load_frame_cycles(fn).tolist()
     except FileNotFoundError:
         print(f"Warning: File {fn} not found, skipping...")
         return None
@@ -30,7 +30,9 @@ def parse_file(fn):
     
     return readings
 
-def plot(myDict, output_file="./plot/time.pdf"):	
+# Returns the filtered rendering times of each pattern, for roc_utils.compare_cells
+@profile_utils.profiled
+def plot(myDict, output_file="./plot/time.pdf", sample_filter=filter_utils.parse_chain(DEFAULT_FILTER)):	
     if not myDict or all(v is None for v in myDict.values()):
         print("Error: No valid data to plot")
         return
@@ -57,28 +59,21 @@ def plot(myDict, output_file="./plot/time.pdf"):
         'Non-compressible': 'darkorange'
     }
     pattern_colors = []
+    frames = {}
 
-    print("\n" + "="*60)
-    print("Rendering Time Analysis")
-    print("="*60)
+    if not report_utils.stats_only():
+        print("\n" + "="*60)
+        print("Rendering Time Analysis")
+        print("="*60)
     
     # Parse data
     for label, trace in myDict.items():
-        # Exclude negative samples (due to counter overflow)
-        samples_positive = [x for x in trace if x > 0]
-        
-        if not samples_positive:
-            print(f"Warning: No positive samples for {label}, skipping...")
-            continue
+        # Filter overflowed and outlier samples (for the plot)
+        samples_filtered = filter_utils.apply_chain(sample_filter, trace)
 
-        # Filter outliers (for the plot)
-        samples_mean = np.mean(samples_positive)
-        samples_std = np.std(samples_positive)
-        samples_filtered = [s for s in samples_positive 
-                          if abs(s - samples_mean) < 4 * samples_std]
-        
-        if not samples_filtered:
-            samples_filtered = samples_positive
+        if len(samples_filtered) == 0:
+            print(f"Warning: No samples left after filtering for {label}, skipping...", file=sys.stderr if report_utils.stats_only() else sys.stdout)
+            continue
 
         # Store data for bins
         minimum = min(min(samples_filtered), minimum)
@@ -89,14 +84,23 @@ def plot(myDict, output_file="./plot/time.pdf"):
         labels.append(label)
         weights.append(np.ones_like(samples_filtered)/float(len(samples_filtered)))
         pattern_colors.append(colors.get(label, 'gray'))
+        frames[label] = {"Rendering time (cycles)": samples_filtered}
             
+        report_utils.record(label, dict(report_utils.mean_std(samples_filtered), min=min(samples_filtered),
+                                        max=max(samples_filtered), samples=len(samples_filtered)))
+        if report_utils.stats_only():
+            continue
+
         # Print statistics
         print(f"{label:>20}: {np.mean(samples_filtered):>10.2f} ± {np.std(samples_filtered):>8.0f} cycles")
         print(f"{'':>20}  (min: {min(samples_filtered):>8.0f}, max: {max(samples_filtered):>8.0f})")
     
+    if report_utils.stats_only():
+        return frames
     print("="*60 + "\n")
     
     # Plot all data
+    import matplotlib.pyplot as plt
     fig, ax = plt.subplots(figsize=(10, 6))
     step = (maximum - minimum) / 30
     bins = np.arange(minimum - step, maximum + step*2, step)
@@ -125,10 +129,12 @@ def plot(myDict, output_file="./plot/time.pdf"):
     plt.tight_layout()
     
     # Save plot to file
-    plt.savefig(output_file, dpi=300, bbox_inches='tight')
+    with profile_utils.stage("savefig", output_file):
+        plt.savefig(output_file, dpi=300, bbox_inches='tight')
     print(f"Plot saved to: {output_file}")
     plt.clf()
     plt.close()
+    return frames
 
 def save_plotted_data(data_dict, output_file):
     with open(output_file, 'w') as f:
@@ -136,10 +142,6 @@ def save_plotted_data(data_dict, output_file):
     print(f"Data of plot saved to: {output_file}")
 
 def main():
-    # Prepare clean output directory
-    out_dir = 'plot'
-    os.makedirs(out_dir, exist_ok=True)
-
     # Argument parser
     parser = argparse.ArgumentParser(
         description='Plot GPU shader pattern rendering time comparison',
@@ -165,10 +167,22 @@ Examples:
     parser.add_argument('--output_data', default='./plot/time.dat', 
                        help='Output PDF file (default: ./plot/data.dat)')
     
+    parser.add_argument('--filter', type=filter_utils.parse_chain, default=DEFAULT_FILTER,
+                       help='Filter chain of the rendering times (default: %(default)s)')
+    profile_utils.add_arguments(parser)
+    report_utils.add_arguments(parser)
+    roc_utils.add_arguments(parser)
+    
     parser.add_argument('file1', nargs='?', help='First file (Compressible/Black)')
     parser.add_argument('file2', nargs='?', help='Second file (Non-compressible/Random)')
 
     args = parser.parse_args()
+    report_utils.configure(args)
+
+    # Prepare clean output directory
+    if not args.stats_only:
+        os.makedirs('plot', exist_ok=True)
+    profile_utils.configure(args, os.path.dirname(args.output_plot))
 
     # Build pattern dictionary
     pattern_dict = {}
@@ -198,7 +212,13 @@ Examples:
         print("Error: No valid timing data found")
         sys.exit(1)
 
-    plot(pattern_dict, args.output_plot)
+    frames = plot(pattern_dict, args.output_plot, args.filter)
+    # How well single frames tell the patterns apart
+    if frames:
+        roc_utils.compare_cells({"all": frames}, args, "time", key_name="runs")
+    if args.stats_only:
+        report_utils.dump()
+        return
     save_plotted_data(pattern_dict, args.output_data)
 
 if __name__ == "__main__":
@@ -0,0 +1,148 @@
+import warnings
+
+import numpy as np
+
+import report_utils
+
+# Covariate-adjusted rendering times.
+#
+# The rendering time of a frame follows the GPU frequency (and, over a run,
+# thermal and background drift) at least as much as the texture, and the
+# plain per-pattern mean absorbs all of it as noise. adjust_cells() fits,
+# per pattern, the least squares line of the rendering time on per-frame
+# covariates centered at the pooled covariate means of the cell (all
+# patterns of a layer, or of a stressor count):
+#   time = adjusted mean + (covariates - pooled means) . coefficients + residual
+# so the adjusted means of the patterns of a cell compare them at the same
+# covariate values, and the residual variance is what is left to average
+# out. The variance reduction factor, var(time) / var(residual), is how many
+# times fewer frames reach the same precision of the mean.
+#
+# Covariates (as far as the script has them):
+#   gpu_freq   mean GPU frequency over the frame (MHz, see align_utils.py)
+#   gpu_util   mean NVIDIA GPU utilization over the frame (%)
+#   bandwidth  DRAM traffic of the frame over its rendering time (GB/s); it
+#              carries the texture's own traffic, i.e. part of the
+#              compressible/non-compressible difference, so adjusting for it
+#              also removes part of the effect under study
+#   elapsed    time since the first frame of the run (s), for drift
+#
+# The adjusted per-frame times (adjusted mean + residual) are handed on to
+# bootstrap_utils.compare_cells as their own metric.
+
+ADJUSTED_METRIC = "Adjusted rendering time per frame (ms)"
+
+# Covariates of the frame tables of exp1/exp2 (see frame_covariates)
+FRAME_COVARIATES = ('gpu_freq', 'gpu_util', 'bandwidth', 'elapsed')
+
+
+def add_arguments(parser, covariates, default):
+    """Add the --adjust option to an argparse parser, covariates are those the script provides"""
+    def parse(spec):
+        names = [name for name in spec.split(',') if name]
+        unknown = [name for name in names if name not in covariates]
+        if unknown or not names:
+            raise ValueError("unknown covariate(s) %s" % ", ".join(unknown))
+        return names
+    parse.__name__ = 'covariate list'
+    parser.add_argument('--adjust', type=parse, nargs='?', const=parse(default), default=None, metavar='COVARIATES',
+                        help='Regress per-frame covariates out of the rendering time, comma-separated from %s (default when given alone: %s)'
+                        % (", ".join(covariates), default))
+
+
+def elapsed(begin, CPUFreq):
+    """Seconds from the first frame of a run to the beginning of every frame"""
+    if len(begin) == 0:
+        return np.zeros(0)
+    return (begin - begin[0]).astype(np.float64) / (1e9 * CPUFreq)
+
+
+def frame_covariates(frames, traffic, CPUFreq):
+    """FRAME_COVARIATES of the frames of an align_utils.frame_table, traffic is their DRAM traffic (MB)"""
+    with np.errstate(divide='ignore', invalid='ignore'):
+        # MB per ms is GB/s
+        bandwidth = traffic / frames['render_time']
+    return {'gpu_freq': frames['gpu_freq'], 'gpu_util': frames['gpu_util'], 'bandwidth': bandwidth,
+            'elapsed': elapsed(frames['begin'], CPUFreq)}
+
+
+def fit(times, covariates, reference):
+    """Least squares fit of times on the columns of covariates, centered at reference.
+
+    Covariates the run did not record (e.g. gpu_util off NVIDIA) are left
+    out, then frames with a missing covariate, then covariates that do not
+    vary over the remaining frames (they cannot be told from the intercept).
+    Returns the statistics of the fit and the adjusted per-frame times.
+    """
+    times = np.asarray(times, dtype=np.float64)
+    covariates = np.asarray(covariates, dtype=np.float64).reshape(len(times), -1)
+    finite = np.isfinite(covariates)
+    used = np.any(finite, axis=0)
+    keep = np.isfinite(times) & np.all(finite[:, used], axis=1)
+    times, covariates = times[keep], covariates[keep]
+    n = len(times)
+    varying = used & (np.ptp(np.where(np.isfinite(covariates), covariates, 0), axis=0) > 0) if n else np.zeros(len(used), dtype=bool)
+    design = np.column_stack([np.ones(n), covariates[:, varying] - reference[varying]])
+    if n <= design.shape[1]:
+        return None, times
+    coef, _, _, _ = np.linalg.lstsq(design, times, rcond=None)
+    residuals = times - design @ coef
+    var_raw = np.var(times, ddof=1)
+    var_residual = residuals @ residuals / (n - design.shape[1])
+    slopes = np.zeros(covariates.shape[1])
+    slopes[varying] = coef[1:]
+    result = {
+        'n': n,
+        'mean': float(np.mean(times)), 'adjusted_mean': float(coef[0]),
+        'std': float(np.sqrt(var_raw)), 'residual_std': float(np.sqrt(var_residual)),
+        'r2': float(1 - residuals @ residuals / ((n - 1) * var_raw)) if var_raw > 0 else np.nan,
+        'variance_reduction': float(var_raw / var_residual) if var_residual > 0 else np.inf,
+        'coefficients': slopes.tolist(),
+    }
+    return result, coef[0] + residuals
+
+
+def adjust_cells(cells, args, name, key_name="layer"):
+    """Fit every pattern of every cell, print and record the results.
+
+    cells maps a key (e.g. the layer count) to {pattern: (times, {covariate:
+    values})}, with one value per frame. Returns {key: {pattern: adjusted
+    times}}, empty unless --adjust was given.
+    """
+    if not args.adjust:
+        return {}
+    adjusted = {}
+    rows = []
+    if not report_utils.stats_only():
+        print("\n%s: rendering time adjusted for %s" % (name, ", ".join(args.adjust)))
+    for key in sorted(cells):
+        columns = {pattern: np.column_stack([np.asarray(covariates[c], dtype=np.float64) for c in args.adjust])
+                   for pattern, (_, covariates) in cells[key].items()}
+        # Pooled covariate means of the cell, every pattern is evaluated there
+        pooled = np.concatenate(list(columns.values()))
+        pooled[~np.isfinite(pooled)] = np.nan
+        with warnings.catch_warnings():
+            # Covariates no pattern has are left out by fit()
+            warnings.simplefilter('ignore', RuntimeWarning)
+            reference = np.nanmean(pooled, axis=0)
+        for pattern, (times, _) in cells[key].items():
+            result, adjusted_times = fit(times, columns[pattern], reference)
+            if result is None:
+                continue
+            adjusted.setdefault(key, {})[pattern] = adjusted_times
+            result['coefficients'] = dict(zip(args.adjust, result['coefficients']))
+            rows.append(dict({key_name: key, 'pattern': pattern}, **result))
+            if not report_utils.stats_only():
+                print("\t%s %s, %s: %f -> %f ms, std %f -> %f, variance reduction x%.2f (%.0f%% of the frames)" % (
+                    key_name, key, pattern, result['mean'], result['adjusted_mean'], result['std'], result['residual_std'],
+                    result['variance_reduction'], 100 / result['variance_reduction']))
+    report_utils.record(name + "_adjusted", {'covariates': args.adjust, 'rows': rows})
+    return adjusted
+
+
+def merge(frames, adjusted):
+    """Add the adjusted times to the {key: {pattern: {metric: samples}}} cells of compare_cells"""
+    for key, patterns in adjusted.items():
+        for pattern, times in patterns.items():
+            frames[key][pattern][ADJUSTED_METRIC] = times
+    return frames
@@ -0,0 +1,143 @@
+import numpy as np
+
+# Alignment of the GPU and memory traces onto frames.
+#
+# The driver writes three streams next to the IMC trace, none of them on the
+# frame clock of texture:
+#   gpu_* / nvidia_gpu_*  one sample every TIME_GPU, the mean frequency (and
+#                         NVIDIA utilization) over the interval ending at its TSC,
+#   mem_*                 the RSS of texture every MEM_PERIOD IMC iterations,
+#                         without a timestamp of its own: sample k is taken
+#                         right after IMC sample k * MEM_PERIOD.
+# frame_table() joins them onto the (begin, end) TSC interval of every frame,
+# as one structured array per run:
+#   - the GPU readings are averaged over the frame, weighted by how much of
+#     each sample interval the frame overlaps (integrals over prefix sums),
+#     and gpu_freq_step is the largest frequency change between the samples
+#     the frame overlaps, 0 if it ran at one frequency,
+#   - the RSS readings are taken as of the end of the frame (the last reading
+#     before it, or the first for frames before any reading).
+# The scripts keep reporting the GPU frequency and peak RSS over all the
+# samples of the traces; --frame-readings also reports them over the kept
+# frames, from the table.
+# Every lookup is a searchsorted over the sorted sample times, so a run costs
+# O((frames + samples) log samples).
+
+# IMC iterations between two mem_* samples, see monitor_imc in driver.c
+MEM_PERIOD = 1000
+
+
+def add_arguments(parser):
+    """Add the frame selection options to an argparse parser"""
+    parser.add_argument('--max-freq-step', type=float, default=None, metavar='MHZ',
+                        help='Drop the frames during which the GPU frequency changed by more than MHZ (0: any change)')
+    parser.add_argument('--frame-readings', action='store_true',
+                        help='Also report the GPU frequency and peak RSS of the kept frames, averaged over each frame')
+
+
+def select_frames(frames, args):
+    """The frames of a frame_table() kept by the options of add_arguments"""
+    if args.max_freq_step is None:
+        return frames
+    return frames[frames['gpu_freq_step'] <= args.max_freq_step]
+
+
+def covering(times, at):
+    """Index of the sample whose interval holds each time: the first sample at or after it (the last one past the end)"""
+    return np.minimum(np.searchsorted(times, at, side='left'), len(times) - 1)
+
+
+def asof(times, values, at):
+    """Last value sampled at or before each time, the first value for times before any sample"""
+    if len(times) == 0:
+        return np.full(len(at), np.nan)
+    index = np.maximum(np.searchsorted(times, at, side='right') - 1, 0)
+    return values[index].astype(np.float64)
+
+
+def interval_mean(times, values, begin, end):
+    """Time-weighted mean over every [begin, end] of a trace of interval means.
+
+    Sample i holds the mean over (times[i-1], times[i]]; the first sample
+    also stands for the time before it and the last for the time after it.
+    """
+    if len(times) == 0:
+        return np.full(len(begin), np.nan)
+    values = values.astype(np.float64)
+    # Integral of the trace from times[0] to times[i]
+    integral = np.concatenate(([0.0], np.cumsum(values[1:] * np.diff(times).astype(np.float64))))
+
+    def integrate(x):
+        k = covering(times, x)
+        prev = np.maximum(k - 1, 0)
+        return integral[prev] + values[k] * (x - times[prev]).astype(np.float64)
+
+    lo = np.clip(begin, times[0], times[-1])
+    hi = np.clip(end, times[0], times[-1])
+    width = (hi - lo).astype(np.float64)
+    mean = values[covering(times, begin)]
+    inside = width > 0
+    mean[inside] = (integrate(hi[inside]) - integrate(lo[inside])) / width[inside]
+    return mean
+
+
+def interval_step(times, values, begin, end):
+    """Largest change between consecutive samples that every [begin, end] overlaps, 0 if it overlaps one sample"""
+    if len(times) < 2:
+        return np.zeros(len(begin))
+    steps = np.abs(np.diff(values.astype(np.float64)))
+    first = covering(times, begin)
+    stop = covering(times, end)
+    # Steps first .. stop - 1 lead into the samples after first
+    bounds = np.empty(2 * len(first), dtype=np.int64)
+    bounds[0::2] = np.minimum(first, len(steps) - 1)
+    bounds[1::2] = np.minimum(stop, len(steps) - 1)
+    if len(bounds) == 0:
+        return np.zeros(0)
+    largest = np.maximum.reduceat(steps, bounds)[0::2]
+    # reduceat returns steps[first] for empty ranges, and stops one short at the last step
+    largest[first >= stop] = 0
+    last = (stop == len(steps)) & (first < stop)
+    largest[last] = np.maximum(largest[last], steps[-1])
+    return largest
+
+
+def mem_times(imc_time, offset=0):
+    """TSC of the mem_* samples taken with the IMC samples of imc_time, the first of which is IMC sample offset"""
+    return imc_time[-offset % MEM_PERIOD::MEM_PERIOD]
+
+
+def frame_table(begin, end, metrics, gpu=None, mem=None, mem_time=None):
+    """One row per frame: its TSC interval, the per-frame metrics and the aligned GPU and RSS readings.
+
+    metrics maps a field name to one value (or row of values) per frame, gpu
+    and mem are the arrays of trace_utils.load_gpu and load_mem, mem_time the
+    TSC of the mem samples (see mem_times). Readings that are not available
+    are NaN.
+    """
+    n = len(begin)
+    fields = [('begin', np.int64), ('end', np.int64)]
+    fields += [(name, np.float64, np.shape(values)[1:]) for name, values in metrics.items()]
+    fields += [('gpu_freq', np.float64), ('gpu_util', np.float64), ('gpu_freq_step', np.float64),
+               ('rss', np.float64), ('peak_rss', np.float64)]
+    frames = np.zeros(n, dtype=fields)
+    frames['begin'] = begin
+    frames['end'] = end
+    for name, values in metrics.items():
+        frames[name] = values
+    for name in ('gpu_freq', 'gpu_util', 'rss', 'peak_rss'):
+        frames[name] = np.nan
+
+    if gpu is not None and len(gpu):
+        gpu_time = np.asarray(gpu['time'])
+        frames['gpu_freq'] = interval_mean(gpu_time, np.asarray(gpu['freq']), begin, end)
+        frames['gpu_freq_step'] = interval_step(gpu_time, np.asarray(gpu['freq']), begin, end)
+        if 'util' in gpu.dtype.names:
+            frames['gpu_util'] = interval_mean(gpu_time, np.asarray(gpu['util']), begin, end)
+
+    if mem is not None and mem_time is not None and len(mem):
+        # The last mem sample may be missing its IMC sample, or the other way around
+        n_mem = min(len(mem), len(mem_time))
+        for name in ('rss', 'peak_rss'):
+            frames[name] = asof(mem_time[:n_mem], np.asarray(mem[name])[:n_mem], end)
+    return frames
@@ -0,0 +1,123 @@
+import os
+import hashlib
+import tempfile
+import zipfile
+
+import numpy as np
+
+# Persistent cache of parsed traces.
+#
+# Every analysis script spends most of its time turning raw traces into
+# per-frame arrays. cached() stores those arrays as one .npz file per input
+# group, keyed by the parser name and version, the parameters (e.g. the CPU
+# frequency) and the path, size and mtime of every input file. The cache is
+# bounded in size and evicts the least recently used entries.
+
+# Bump when the on-disk layout changes
+CACHE_VERSION = 1
+
+DEFAULT_CACHE_DIR = os.environ.get("GPUZIP_CACHE_DIR", os.path.join(os.path.expanduser("~"), ".cache", "gpu-zip"))
+DEFAULT_CACHE_SIZE = 2048  # MiB
+
+_config = {
+    "enabled": True,
+    "rebuild": False,
+    "dir": DEFAULT_CACHE_DIR,
+    "max_bytes": DEFAULT_CACHE_SIZE * 1024 * 1024,
+}
+
+
+def add_arguments(parser):
+    """Add the cache command line options to an argparse parser"""
+    parser.add_argument('--no-cache', action='store_true', help='Do not read or write the parsed-trace cache')
+    parser.add_argument('--rebuild-cache', action='store_true', help='Re-parse every trace and refresh the cache')
+    parser.add_argument('--cache-dir', default=DEFAULT_CACHE_DIR, help='Cache directory (default: %(default)s)')
+    parser.add_argument('--cache-size', type=int, default=DEFAULT_CACHE_SIZE,
+                        help='Maximum cache size in MiB (default: %(default)s)')
+
+
+def configure(args):
+    """Apply the options added by add_arguments"""
+    _config["enabled"] = not args.no_cache
+    _config["rebuild"] = args.rebuild_cache
+    _config["dir"] = args.cache_dir
+    _config["max_bytes"] = args.cache_size * 1024 * 1024
+
+
+def get_config():
+    """Current cache settings, e.g. to hand to worker processes"""
+    return dict(_config)
+
+
+def set_config(config):
+    _config.update(config)
+
+
+def cache_key(name, version, files, params):
+    """Key of a parsed input group: parser, parameters and the identity of every file"""
+    h = hashlib.sha1()
+    h.update(repr((CACHE_VERSION, name, version, tuple(params))).encode())
+    for fn in files:
+        st = os.stat(fn)
+        h.update(repr((os.path.realpath(fn), st.st_size, st.st_mtime_ns)).encode())
+    return h.hexdigest()
+
+
+def _load(path):
+    with np.load(path) as data:
+        return tuple(data["arr_%d" % i] for i in range(len(data.files)))
+
+
+def _store(path, arrays):
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            np.savez(f, *arrays)
+        os.replace(tmp, path)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+
+
+def evict(cache_dir, max_bytes):
+    """Delete least recently used entries until the cache fits in max_bytes"""
+    entries = []
+    for entry in os.scandir(cache_dir):
+        if entry.name.endswith(".npz"):
+            st = entry.stat()
+            entries.append((st.st_mtime, st.st_size, entry.path))
+    total = sum(size for _, size, _ in entries)
+    for _, size, path in sorted(entries):
+        if total <= max_bytes:
+            break
+        try:
+            os.unlink(path)
+        except FileNotFoundError:
+            pass
+        total -= size
+
+
+def cached(name, version, files, params, compute, *args):
+    """Return compute(*args) as a tuple of arrays, from the cache if possible.
+
+    name and version identify the parser, files are the inputs it reads and
+    params any other value the result depends on.
+    """
+    if not _config["enabled"]:
+        return tuple(np.asarray(a) for a in compute(*args))
+
+    os.makedirs(_config["dir"], exist_ok=True)
+    path = os.path.join(_config["dir"], "%s-%s.npz" % (name, cache_key(name, version, files, params)))
+    if not _config["rebuild"] and os.path.exists(path):
+        try:
+            arrays = _load(path)
+            # Mark as recently used
+            os.utime(path)
+            return arrays
+        except (OSError, ValueError, KeyError, zipfile.BadZipFile):
+            pass
+
+    arrays = tuple(np.asarray(a) for a in compute(*args))
+    _store(path, arrays)
+    evict(_config["dir"], _config["max_bytes"])
+    return arrays
@@ -0,0 +1,202 @@
+import os
+import re
+import argparse
+import hashlib
+import sqlite3
+import tempfile
+
+import cache_utils
+
+# Indexed catalog of measurement runs.
+#
+# The driver writes <kind>_<selector>_<run>.{out,bin} for every run (kind is
+# imc, mem, gpu or nvidia_gpu) and the texture workload writes
+# time_<workload>_<size>_<pattern>_<layer>.txt, optionally inside out-<n>
+# directories when n memory stressors were running. Driver traces of a run
+# share its run index; time files carry no run index and follow the run
+# order, i.e. their modification order. Runs and time files are only paired
+# when there are as many of each (or, while a run is starting, the first ones).
+#
+# The catalog records one row per run in a SQLite file next to the parsed
+# trace cache, with absolute paths since it is shared by every working
+# directory. It is built once per (trace dir, time dir) and only rebuilt when
+# one of the indexed directories or the modification time of a time file
+# changes, so analyses select runs with a query such as "pattern=0, layer>=10"
+# instead of globbing and opening every file again.
+
+# Bump when the schema or the naming scheme changes
+CATALOG_VERSION = 2
+
+TRACE_RE = re.compile(r'^(imc|mem|gpu|nvidia_gpu)_(\d+)_(\d+)\.(out|bin)$')
+TIME_RE = re.compile(r'^time_(\d+)_(\d+)_(-?[\d.]+)_(\d+)\.txt$')
+STRESSOR_RE = re.compile(r'^out-(\d+)$')
+
+# Columns a query may filter on
+COLUMNS = ('run', 'selector', 'workload', 'size', 'pattern', 'layer', 'stressors')
+OPERATORS = ('<=', '>=', '!=', '=', '<', '>')
+
+SCHEMA = """
+CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT);
+CREATE TABLE runs (
+    id INTEGER PRIMARY KEY,
+    run INTEGER, selector INTEGER,
+    imc TEXT, mem TEXT, gpu TEXT, nvidia_gpu TEXT, time TEXT,
+    workload INTEGER, size INTEGER, pattern REAL, layer INTEGER, stressors INTEGER
+);
+CREATE INDEX runs_label ON runs (workload, pattern, layer, stressors);
+"""
+
+
+def add_arguments(parser):
+    """Add the run selection options to an argparse parser"""
+    parser.add_argument('--where', type=parse_where, default='', metavar='QUERY',
+                        help='Only analyse matching runs, e.g. "pattern=0, layer>=10" (columns: %s)' % ", ".join(COLUMNS))
+    parser.add_argument('--rebuild-catalog', action='store_true', help='Re-index the data directories')
+
+
+def parse_where(spec):
+    """Turn "pattern=0, layer>=10" into an SQL condition and its parameters (usable as an argparse type)"""
+    conditions = []
+    params = []
+    for item in spec.split(','):
+        item = item.strip()
+        if not item:
+            continue
+        for op in OPERATORS:
+            column, sep, value = item.partition(op)
+            if sep:
+                break
+        column = column.strip()
+        try:
+            if not sep or column not in COLUMNS:
+                raise ValueError
+            params.append(float(value))
+        except ValueError:
+            raise argparse.ArgumentTypeError("bad run query '%s' (expected <column><op><number>, columns: %s)" % (item, ", ".join(COLUMNS)))
+        conditions.append("%s %s ?" % (column, op))
+    return " AND ".join(conditions) or "1", params
+
+
+def _dirs(trace_dir, time_dir):
+    # Every directory the catalog depends on: adding or removing a file changes its mtime
+    dirs = [d for d in (trace_dir, time_dir) if d is not None]
+    if time_dir is not None:
+        dirs += [os.path.join(time_dir, entry.name) for entry in os.scandir(time_dir)
+                 if entry.is_dir() and STRESSOR_RE.match(entry.name)]
+    return sorted(dirs)
+
+
+def _signature(trace_dir, time_dir):
+    # A time file rewritten in place moves in the run order without changing its directory
+    times = [(t['time'], t['mtime']) for t in _scan_times(time_dir)] if time_dir is not None else []
+    return repr([(os.path.realpath(d), os.stat(d).st_mtime_ns) for d in _dirs(trace_dir, time_dir)] + times)
+
+
+def _scan_traces(trace_dir):
+    runs = {}
+    for entry in os.scandir(trace_dir):
+        match = TRACE_RE.match(entry.name)
+        if match:
+            kind, selector, run, _ = match.groups()
+            runs.setdefault(int(run), {'selector': int(selector)})[kind] = os.path.abspath(entry.path)
+    # A run is usable once the driver wrote its IMC trace
+    return [dict(runs[run], run=run) for run in sorted(runs) if 'imc' in runs[run]]
+
+
+def _scan_times(time_dir):
+    times = []
+    dirs = [(time_dir, None)]
+    for entry in os.scandir(time_dir):
+        match = STRESSOR_RE.match(entry.name)
+        if match and entry.is_dir():
+            dirs.append((entry.path, int(match.group(1))))
+    for path, stressors in dirs:
+        for entry in os.scandir(path):
+            match = TIME_RE.match(entry.name)
+            if match:
+                workload, size, pattern, layer = match.groups()
+                times.append({'time': os.path.abspath(entry.path), 'mtime': entry.stat().st_mtime_ns, 'workload': int(workload),
+                              'size': int(size), 'pattern': float(pattern), 'layer': int(layer), 'stressors': stressors})
+    # Modification order, ties broken like the analysis scripts always did
+    times.sort(key=lambda t: t['time'], reverse=True)
+    times.sort(key=lambda t: t['mtime'])
+    return times
+
+
+def build(conn, trace_dir, time_dir, partial=False):
+    """Index trace_dir (driver traces, may be None) and time_dir into conn"""
+    conn.executescript(SCHEMA)
+    traces = _scan_traces(trace_dir) if trace_dir is not None else []
+    times = _scan_times(time_dir) if time_dir is not None else []
+    if trace_dir is not None and time_dir is not None and len(traces) != len(times):
+        # Time files carry no run index: with a file missing, every later pair would be wrong
+        if not partial:
+            raise ValueError("%d driver runs in %s but %d time files in %s, cannot pair them by run order" % (
+                len(traces), trace_dir, len(times), time_dir))
+        n = min(len(traces), len(times))
+        traces, times = traces[:n], times[:n]
+    rows = []
+    for index in range(max(len(traces), len(times))):
+        trace = traces[index] if traces else {}
+        time = times[index] if times else {}
+        rows.append((index, trace.get('run'), trace.get('selector'), trace.get('imc'), trace.get('mem'),
+                     trace.get('gpu'), trace.get('nvidia_gpu'), time.get('time'), time.get('workload'),
+                     time.get('size'), time.get('pattern'), time.get('layer'), time.get('stressors')))
+    conn.executemany("INSERT INTO runs VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", rows)
+    conn.execute("INSERT INTO meta VALUES ('version', ?)", (str(CATALOG_VERSION),))
+    conn.execute("INSERT INTO meta VALUES ('signature', ?)", (_signature(trace_dir, time_dir),))
+    conn.commit()
+
+
+def _is_current(path, signature):
+    if not os.path.exists(path):
+        return False
+    try:
+        conn = sqlite3.connect(path)
+        try:
+            meta = dict(conn.execute("SELECT key, value FROM meta"))
+        finally:
+            conn.close()
+    except sqlite3.Error:
+        return False
+    return meta.get('version') == str(CATALOG_VERSION) and meta.get('signature') == signature
+
+
+def open_catalog(trace_dir, time_dir, rebuild=False, partial=False):
+    """Connection to the catalog of trace_dir and time_dir, (re)built if needed.
+
+    Different numbers of driver runs and time files are an error, unless
+    partial is set: while a run is still starting, the first ones are paired.
+    """
+    config = cache_utils.get_config()
+    if not config["enabled"]:
+        conn = sqlite3.connect(":memory:")
+        build(conn, trace_dir, time_dir, partial)
+        return conn
+
+    key = hashlib.sha1(repr([os.path.realpath(d) if d is not None else None for d in (trace_dir, time_dir)]).encode()).hexdigest()
+    path = os.path.join(config["dir"], "catalog-%s.sqlite" % key)
+    if rebuild or config["rebuild"] or not _is_current(path, _signature(trace_dir, time_dir)):
+        os.makedirs(config["dir"], exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=config["dir"], suffix=".tmp")
+        os.close(fd)
+        try:
+            conn = sqlite3.connect(tmp)
+            build(conn, trace_dir, time_dir, partial)
+            conn.close()
+            os.replace(tmp, path)
+        except BaseException:
+            os.unlink(tmp)
+            raise
+    return sqlite3.connect(path)
+
+
+def query(trace_dir, time_dir, where=("1", []), rebuild=False, partial=False):
+    """Runs matching where (as returned by parse_where), in run order, as sqlite3.Row objects"""
+    condition, params = where
+    conn = open_catalog(trace_dir, time_dir, rebuild, partial)
+    conn.row_factory = sqlite3.Row
+    try:
+        return conn.execute("SELECT * FROM runs WHERE %s ORDER BY id" % condition, params).fetchall()
+    finally:
+        conn.close()
@@ -0,0 +1,143 @@
+import argparse
+
+import numpy as np
+
+# Composable outlier filters.
+#
+# A filter chain is a list of mask stages, written on the command line as
+# comma-separated "name[:param[:param]]" items, e.g. "positive,sigma:4".
+# Every stage sees only the samples the previous stages kept, and the final
+# boolean mask is applied to the key array and to any paired array (e.g. the
+# IMC traffic of the frames whose rendering time is filtered).
+#
+#   percentile:LOW:HIGH  keep LOW-th <= x <= HIGH-th percentile (default 5:95)
+#   sigma:K              keep |x - mean| <= K * std (default 4)
+#   mad:K                keep |x - median| <= K * 1.4826 * MAD (default 3.5)
+#   positive             keep x > 0
+#   overflow:BITS        drop wrapped BITS-wide counter differences (default 64)
+
+
+def percentile_mask(values, low=5, high=95, sketch=None):
+    """Percentile window, with the bounds taken from sketch if given"""
+    if sketch is not None:
+        values_low, values_high = sketch.percentile(low), sketch.percentile(high)
+    else:
+        values_low, values_high = np.percentile(values, low), np.percentile(values, high)
+    return (values >= values_low) & (values <= values_high)
+
+
+def sigma_mask(values, k=4):
+    return np.abs(values - np.mean(values)) <= k * np.std(values)
+
+
+def mad_mask(values, k=3.5):
+    median = np.median(values)
+    deviation = np.abs(values - median)
+    return deviation <= k * 1.4826 * np.median(deviation)
+
+
+def positive_mask(values):
+    return values > 0
+
+
+def overflow_mask(values, bits=64):
+    # A wrapped counter gives a negative difference, or a huge one if unsigned
+    return (values >= 0) & (values < 2.0 ** (bits - 1))
+
+
+# Stage name -> (mask function, maximum number of parameters)
+FILTER_STAGES = {
+    'percentile': (percentile_mask, 2),
+    'sigma': (sigma_mask, 1),
+    'mad': (mad_mask, 1),
+    'positive': (positive_mask, 0),
+    'overflow': (overflow_mask, 1),
+}
+
+
+def parse_chain(spec):
+    """Parse a filter chain such as "positive,sigma:4" (usable as an argparse type)"""
+    chain = []
+    for item in spec.split(','):
+        item = item.strip()
+        if not item or item == 'none':
+            continue
+        name, *params = item.split(':')
+        if name not in FILTER_STAGES:
+            raise argparse.ArgumentTypeError("unknown filter '%s' (choose from %s)" % (name, ", ".join(FILTER_STAGES)))
+        try:
+            params = tuple(float(p) for p in params)
+        except ValueError:
+            raise argparse.ArgumentTypeError("bad parameter in filter '%s'" % item)
+        if len(params) > FILTER_STAGES[name][1]:
+            raise argparse.ArgumentTypeError("too many parameters in filter '%s'" % item)
+        chain.append((name, params))
+    return chain
+
+
+def chain_mask(chain, values, sketch=None):
+    """Boolean mask of the samples kept by chain.
+
+    sketch (a stats_utils.QuantileSketch of values) provides the bounds of a
+    leading percentile stage; later stages see already filtered samples.
+    """
+    values = np.asarray(values, dtype=np.float64)
+    mask = np.ones(len(values), dtype=bool)
+    for index, (name, params) in enumerate(chain):
+        kept = values[mask]
+        if len(kept) == 0:
+            break
+        if name == 'percentile' and index == 0 and sketch is not None:
+            mask[mask] = percentile_mask(kept, *params, sketch=sketch)
+        else:
+            mask[mask] = FILTER_STAGES[name][0](kept, *params)
+    return mask
+
+
+def apply_chain(chain, values, *paired, sketch=None):
+    """Filter values with chain, returning it (and every paired array) as NumPy arrays"""
+    values = np.asarray(values)
+    mask = chain_mask(chain, values, sketch)
+    if not paired:
+        return values[mask]
+    return (values[mask],) + tuple(np.asarray(p)[mask] for p in paired)
+
+
+def split_chain(chain):
+    """The leading percentile stage of chain (None without one), and the stages after it.
+
+    The bounds of that stage can come from a sketch of all the samples (see
+    sketch_bounds), so that samples can be dropped as they arrive (see
+    bounds_mask): applying the rest of the chain to the samples kept then
+    keeps the same samples as apply_chain(chain, values, sketch=sketch).
+    """
+    if chain and chain[0][0] == 'percentile':
+        return chain[0], chain[1:]
+    return None, chain
+
+
+def sketch_bounds(stage, sketch):
+    """(low, high) bounds of a percentile stage of split_chain, from sketch (None without a stage)"""
+    if stage is None:
+        return None
+    low, high = tuple(stage[1]) + (5, 95)[len(stage[1]):]
+    return sketch.percentile(low), sketch.percentile(high)
+
+
+def merged_bounds(stage, labels, sketches):
+    """sketch_bounds of every label, from the merged sketches of its runs (labels and sketches run by run)"""
+    merged = {}
+    for label, sketch in zip(labels, sketches):
+        if label in merged:
+            merged[label].merge(sketch)
+        else:
+            merged[label] = sketch
+    return {label: sketch_bounds(stage, sketch) for label, sketch in merged.items()}
+
+
+def bounds_mask(values, bounds):
+    """Boolean mask of the values within bounds (see sketch_bounds), all of them if None"""
+    values = np.asarray(values, dtype=np.float64)
+    if bounds is None:
+        return np.ones(len(values), dtype=bool)
+    return (values >= bounds[0]) & (values <= bounds[1])
@@ -0,0 +1,92 @@
+import time
+
+import numpy as np
+
+import catalog_utils
+import frame_utils
+import trace_utils
+
+# Live analysis of runs the driver is still sampling.
+#
+# Every refresh re-queries the run catalog (cheap unless a new run started),
+# reads only the bytes each imc_* and time_* trace gained since the previous
+# refresh, and assigns the new samples to the frames they complete. A frame
+# is reported once a later sample closes it, exactly as in the batch parser.
+
+
+def add_arguments(parser):
+    """Add the --follow options to an argparse parser"""
+    parser.add_argument('--follow', action='store_true',
+                        help='Tail the traces of running experiments and refresh the statistics periodically')
+    parser.add_argument('--interval', type=float, default=5,
+                        help='Seconds between refreshes in --follow mode (default: %(default)s)')
+    parser.add_argument('--refreshes', type=int, default=0,
+                        help='Stop --follow after N refreshes, 0 to run until interrupted (default: %(default)s)')
+
+
+class RunFollower:
+    """Frames of one run, aggregated while its imc_* and time_* traces grow.
+
+    imc may be None when the samples arrive some other way (see push), and
+    time may be None until the time_* trace of the run is known.
+    """
+
+    def __init__(self, imc, time, CPUFreq):
+        self.imc = trace_utils.ImcTail(imc) if imc is not None else None
+        self.time = trace_utils.TimeTail(time) if time is not None else None
+        self.stream = frame_utils.FrameStream(np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64), CPUFreq)
+        self.timestamps = np.zeros(0, dtype=np.int64)
+        self.values = None
+
+    def push(self, timestamps, values):
+        """Queue IMC samples for the next poll"""
+        if values is not None and len(timestamps):
+            self.timestamps = np.concatenate((self.timestamps, timestamps))
+            self.values = values if self.values is None else np.concatenate((self.values, values))
+
+    def poll(self, final=False):
+        """(traffic, render_time) of the frames completed since the last poll, None if nothing to report yet.
+
+        final=True once both traces are complete, to also close the last frame.
+        """
+        if self.time is not None:
+            begin, end = self.time.read_frames()
+            self.stream.extend(begin, end)
+        if self.imc is not None:
+            self.push(*self.imc.read_samples())
+        if self.values is None or len(self.stream.end) == 0:
+            return None
+
+        # Later samples may still belong to frames the time trace does not have yet
+        ready = len(self.timestamps) if final else int(np.searchsorted(self.timestamps, self.stream.end[-1], side='left'))
+        traffic, render_time, _ = self.stream.feed(self.timestamps[:ready], self.values[:ready])
+        self.timestamps = self.timestamps[ready:]
+        self.values = self.values[ready:]
+        return traffic, render_time
+
+
+def follow(trace_dir, time_dir, where, CPUFreq, label, report, interval, refreshes=0):
+    """Follow every run matching where and call report(frames) after each refresh.
+
+    label(run) names the group a run belongs to and frames maps each label to
+    the (traffic, render_time) arrays of all its frames completed so far.
+    """
+    followers = {}
+    frames = {}
+    refresh = 0
+    try:
+        while True:
+            for run in catalog_utils.query(trace_dir, time_dir, where, partial=True):
+                if run['imc'] not in followers:
+                    followers[run['imc']] = RunFollower(run['imc'], run['time'], CPUFreq)
+                new = followers[run['imc']].poll()
+                if new is not None and len(new[1]):
+                    frames.setdefault(label(run), []).append(new)
+            report({name: (np.concatenate([traffic for traffic, _ in chunks]), np.concatenate([render_time for _, render_time in chunks]))
+                    for name, chunks in frames.items()})
+            refresh += 1
+            if refreshes and refresh >= refreshes:
+                break
+            time.sleep(interval)
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,186 @@
+import numpy as np
+
+# MiB to MB
+MIB_TO_MB = 1.04858
+
+# Frame-interval aggregation shared by the exp1/exp2 analysers.
+#
+# The driver samples the IMC counters every TIME_IMC while texture writes one
+# (begin, end) TSC pair per rendered frame. The original per-line parsers walk
+# the IMC trace with a frame counter:
+#   - a sample with time >= end of the current frame closes that frame
+#     (the closing sample itself is not counted), and
+#   - a sample with begin <= time < end is accumulated into the frame.
+# The functions below reproduce exactly that state machine with array
+# operations. Timestamps are assumed to be monotonic, which holds because
+# monitor_imc is pinned to a single core and reads the TSC with rdtscp.
+
+
+def assign_frames(timestamps, begin, end):
+    """Map IMC samples onto frame intervals.
+
+    Returns (first, stop) index arrays, one entry per completed frame: the
+    samples accumulated into frame k are timestamps[first[k]:stop[k]] and
+    stop[k] is the sample that closed the frame.
+    """
+    counter = np.arange(len(end))
+
+    # First sample at or after the end of each frame. A sample can close at
+    # most one frame, so frame k closes no earlier than one sample after k-1.
+    stop = np.searchsorted(timestamps, end, side='left') - counter
+    stop = np.maximum.accumulate(stop) + counter
+
+    # Frames that never saw a closing sample are not reported
+    n_closed = int(np.searchsorted(stop, len(timestamps), side='left'))
+    stop = stop[:n_closed]
+
+    # Accumulation starts at the first sample after the previous close that
+    # is also at or after the beginning of the frame
+    after_prev = np.concatenate(([0], stop[:-1] + 1))[:n_closed]
+    first = np.maximum(after_prev, np.searchsorted(timestamps, begin[:n_closed], side='left'))
+    first = np.minimum(first, stop)
+    return first, stop
+
+
+def segment_sums(values, first, stop):
+    """Sum values[first[k]:stop[k]] along the first axis for every frame"""
+    if len(first) == 0:
+        return np.zeros((0,) + values.shape[1:], dtype=np.float64)
+    bounds = np.empty(2 * len(first), dtype=np.int64)
+    bounds[0::2] = first
+    bounds[1::2] = stop
+    sums = np.add.reduceat(values, bounds, axis=0)[0::2]
+    # reduceat returns values[first] for empty segments
+    sums[first == stop] = 0
+    return sums
+
+
+def sample_mask(timestamps, begin, first, stop):
+    """Boolean mask of the samples that were accumulated into any frame.
+
+    This includes the samples of the frame still open when the trace ends:
+    they are accumulated but the frame itself is never reported.
+    """
+    n_samples = len(timestamps)
+    n_closed = len(stop)
+    if n_closed < len(begin):
+        tail = max(stop[-1] + 1 if n_closed else 0, np.searchsorted(timestamps, begin[n_closed], side='left'))
+        first = np.append(first, min(tail, n_samples))
+        stop = np.append(stop, n_samples)
+    marks = np.zeros(n_samples + 1, dtype=np.int64)
+    np.add.at(marks, first, 1)
+    np.add.at(marks, stop, -1)
+    return np.cumsum(marks[:-1]) > 0
+
+
+def aggregate_frames(timestamps, values, begin, end, CPUFreq):
+    """Aggregate an IMC trace into per-frame DRAM traffic (MB) and render time (ms)"""
+    first, stop = assign_frames(timestamps, begin, end)
+    traffic = segment_sums(values, first, stop) * MIB_TO_MB
+    n_closed = len(stop)
+    render_time = (end[:n_closed] - begin[:n_closed]).astype(np.float64) / (1000000 * CPUFreq)
+    return traffic, render_time, first, stop
+
+
+def sample_totals(values):
+    """Sum of the counters of every sample, column by column (a reduction over the few columns is slow)"""
+    total = values[:, 0].copy()
+    for column in range(1, values.shape[1]):
+        total += values[:, column]
+    return total
+
+
+def sample_bandwidth(timestamps, values, begin, first, stop, CPUFreq):
+    """Bandwidth (GB/s) of every accumulated sample, relative to the previous accumulated sample"""
+    mask = sample_mask(timestamps, begin, first, stop)
+    total = sample_totals(values)[mask]
+    times = timestamps[mask]
+    prev = np.concatenate(([0], times[:-1]))
+    return total * MIB_TO_MB / (1000 * ((times - prev).astype(np.float64) / (1000000000 * CPUFreq)))
+
+
+class FrameStream:
+    """Incremental aggregate_frames for IMC traces read in chunks.
+
+    Carries the frame counter, the last closing sample and the partial sums
+    of the open frame from one chunk to the next, so feeding a trace chunk by
+    chunk gives the same frames as aggregate_frames on the whole trace.
+    """
+
+    def __init__(self, begin, end, CPUFreq):
+        self.begin = begin
+        self.end = end
+        self.CPUFreq = CPUFreq
+        self.counter = 0       # frame currently being accumulated
+        self.last_close = -1   # global index of the last closing sample
+        self.offset = 0        # global index of the first sample of the next chunk
+        self.partial = 0       # accumulated values of the open frame
+        self.prev_time = 0     # time of the last accumulated sample
+
+    def extend(self, begin, end):
+        """Append frames, e.g. those a growing time_* trace gained since the last feed.
+
+        Only feed samples earlier than the end of the last known frame, later
+        ones may still belong to frames that are not known yet.
+        """
+        self.begin = np.concatenate((self.begin, begin))
+        self.end = np.concatenate((self.end, end))
+
+    def feed(self, timestamps, values):
+        """Consume one chunk.
+
+        Returns (traffic, render_time, bandwidth): traffic and render time of
+        the frames closed by this chunk, and the bandwidth of every sample of
+        the chunk that was accumulated (see sample_bandwidth).
+        """
+        n_samples = len(timestamps)
+        g = self.offset
+        self.offset += n_samples
+        c = self.counter
+        n_frames = len(self.end)
+        if n_samples == 0 or c >= n_frames:
+            return (np.zeros((0,) + values.shape[1:]), np.zeros(0), np.zeros(0))
+
+        # Frames that may close in this chunk, same recurrence as assign_frames
+        # but starting after the last close of the previous chunk
+        n_cand = int(np.searchsorted(self.end[c:], timestamps[-1], side='right'))
+        counter = np.arange(n_cand)
+        s = g + np.searchsorted(timestamps, self.end[c:c + n_cand], side='left') - counter
+        stop = np.maximum.accumulate(np.concatenate(([self.last_close + 1], s)))[1:] + counter
+        n_closed = int(np.searchsorted(stop, g + n_samples, side='left'))
+        stop = stop[:n_closed]
+
+        prev_close = np.concatenate(([self.last_close], stop[:-1]))[:n_closed]
+        first = np.maximum(prev_close + 1, g + np.searchsorted(timestamps, self.begin[c:c + n_closed], side='left'))
+        first = np.minimum(first, stop) - g
+        stop = stop - g
+
+        traffic = segment_sums(values, first, stop)
+        if n_closed:
+            # The first closed frame may have started in an earlier chunk
+            traffic[0] = traffic[0] + self.partial
+            self.partial = 0
+            self.last_close = g + stop[-1]
+        render_time = (self.end[c:c + n_closed] - self.begin[c:c + n_closed]).astype(np.float64) / (1000000 * self.CPUFreq)
+        self.counter = c + n_closed
+
+        # Samples of the frame still open at the end of the chunk
+        if self.counter < n_frames:
+            open_start = max(self.last_close + 1, g + int(np.searchsorted(timestamps, self.begin[self.counter], side='left')))
+            open_start = min(open_start - g, n_samples)
+            self.partial = self.partial + values[open_start:].sum(axis=0)
+            first = np.append(first, open_start)
+            stop = np.append(stop, n_samples)
+
+        marks = np.zeros(n_samples + 1, dtype=np.int64)
+        np.add.at(marks, first, 1)
+        np.add.at(marks, stop, -1)
+        mask = np.cumsum(marks[:-1]) > 0
+        total = sample_totals(values)[mask]
+        times = timestamps[mask]
+        prev = np.concatenate(([self.prev_time], times[:-1]))
+        if len(times):
+            self.prev_time = times[-1]
+        bandwidth = total * MIB_TO_MB / (1000 * ((times - prev).astype(np.float64) / (1000000000 * self.CPUFreq)))
+
+        return traffic * MIB_TO_MB, render_time, bandwidth
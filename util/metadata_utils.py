@@ -0,0 +1,214 @@
+import os
+import re
+import sys
+import json
+import socket
+import argparse
+import platform
+import tempfile
+import subprocess
+
+import cache_utils
+
+# Hardware metadata of a measurement (metadata.json sidecar).
+#
+# The driver writes metadata.json into its trace directory, with the TSC
+# frequency it measured and its sampling parameters, and the measurement
+# scripts run `python metadata_utils.py DIR` to add the CPU, GPU, GPU driver
+# and kernel of the machine (or to create the file when no driver ran, e.g.
+# for the memory stressor). The analysis scripts read the sidecar, so TSC
+# timestamps are converted with the frequency of the machine that recorded
+# them. Data without a sidecar falls back to probing the analysing machine;
+# the probe is cached per boot next to the parsed trace cache, so cpuinfo
+# and lspci only run once.
+#
+# Usage: python metadata_utils.py DIR [--set KEY=VALUE ...]
+
+METADATA_FILE = "metadata.json"
+
+# Bump when probe() changes its output (invalidates cached probes)
+PROBE_VERSION = 1
+
+DEFAULT_CPU_FREQ = 3.0  # GHz, when nothing better is known
+
+
+def add_arguments(parser):
+    """Add the TSC frequency options to an argparse parser"""
+    parser.add_argument('--cpu-freq', type=float, default=None,
+                        help='TSC frequency in GHz (default: from metadata.json of the data, else probed)')
+    parser.add_argument('--reprobe', action='store_true', help='Probe the machine again instead of using the cached probe')
+
+
+def probe_cpu():
+    """Advertised TSC frequency (Hz, or None) and brand of this machine's CPU"""
+    try:
+        import cpuinfo
+        info = cpuinfo.get_cpu_info()
+    except Exception as e:
+        print("Warning: Could not read the CPU information: %s" % e, file=sys.stderr)
+        return None, None
+    brand = info.get("brand_raw")
+    for key in ("hz_advertised", "hz_actual"):
+        if info.get(key):
+            freq_hz = info[key][0] if isinstance(info[key], (list, tuple)) else info[key]
+            return float(freq_hz), brand
+    # Fallback: try to parse from brand string
+    match = re.search(r'(\d+\.?\d*)\s*GHz', brand or "")
+    return (float(match.group(1)) * 1e9 if match else None), brand
+
+
+def probe_gpu():
+    """Type (Intel iGPU, AMD Radeon iGPU or NVIDIA dGPU), kernel driver and driver version of the GPU"""
+    gpu, driver = "Unknown GPU", None
+    try:
+        if platform.system() == "Linux":
+            output = subprocess.run(['lspci', '-k'], capture_output=True, text=True).stdout
+            # Devices start unindented, their kernel driver follows indented
+            for device in re.split(r'\n(?=\S)', output):
+                lines = device.splitlines()
+                if not lines or not re.search(r'VGA|3D', lines[0]):
+                    continue
+                name = lines[0].lower()
+                if 'nvidia' in name:
+                    kind = "NVIDIA dGPU"
+                elif 'amd' in name or 'radeon' in name:
+                    kind = "AMD Radeon iGPU"
+                elif 'intel' in name:
+                    kind = "Intel iGPU"
+                else:
+                    continue
+                in_use = [line.split(":", 1)[1].strip() for line in lines if "Kernel driver in use" in line]
+                # A dGPU is the interesting one when there are two
+                if gpu == "Unknown GPU" or kind == "NVIDIA dGPU":
+                    gpu, driver = kind, (in_use[0] if in_use else None)
+    except Exception:
+        pass
+    version = None
+    if driver:
+        try:
+            with open("/sys/module/%s/version" % driver) as f:
+                version = f.read().strip()
+        except OSError:
+            version = platform.release() if driver in ('i915', 'xe', 'amdgpu') else None
+    return gpu, driver, version
+
+
+def probe():
+    """Metadata of this machine, as far as it can be told without the driver"""
+    tsc_hz, cpu = probe_cpu()
+    gpu, gpu_driver, gpu_driver_version = probe_gpu()
+    return {
+        'tsc_hz': tsc_hz,
+        'tsc_source': "advertised" if tsc_hz else None,
+        'cpu': cpu,
+        'gpu': gpu,
+        'gpu_driver': gpu_driver,
+        'gpu_driver_version': gpu_driver_version,
+        'kernel': platform.release(),
+        'hostname': socket.gethostname(),
+    }
+
+
+def _boot_id():
+    try:
+        with open("/proc/sys/kernel/random/boot_id") as f:
+            return f.read().strip()
+    except OSError:
+        return None
+
+
+def cached_probe(refresh=False):
+    """probe(), cached until the next boot"""
+    path = os.path.join(cache_utils.get_config()["dir"], "probe.json")
+    key = [PROBE_VERSION, socket.gethostname(), _boot_id()]
+    if not refresh and key[-1] is not None:
+        try:
+            with open(path) as f:
+                cached = json.load(f)
+            if cached.get('key') == key:
+                return cached['metadata']
+        except (OSError, ValueError, KeyError):
+            pass
+    metadata = probe()
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        _write(path, {'key': key, 'metadata': metadata})
+    except OSError:
+        pass
+    return metadata
+
+
+def load(*dirs):
+    """Contents of the first metadata.json found in dirs, or None"""
+    for path in dirs:
+        if path is None:
+            continue
+        fn = os.path.join(path, METADATA_FILE)
+        if os.path.exists(fn):
+            with open(fn) as f:
+                return json.load(f)
+    return None
+
+
+def resolve(args, *dirs):
+    """Metadata of the data in dirs (see load), falling back to the cached probe, with a TSC frequency"""
+    metadata = load(*dirs)
+    if metadata is None:
+        metadata = dict(cached_probe(args.reprobe))
+        if not args.cpu_freq and any(dirs):
+            print("Warning: No %s in %s, using the TSC frequency of this machine" % (METADATA_FILE, " or ".join(d for d in dirs if d)),
+                  file=sys.stderr)
+    if args.cpu_freq:
+        metadata['tsc_hz'], metadata['tsc_source'] = args.cpu_freq * 1e9, "specified"
+    elif not metadata.get('tsc_hz'):
+        print("Warning: Unknown TSC frequency, using %.1f GHz" % DEFAULT_CPU_FREQ, file=sys.stderr)
+        metadata['tsc_hz'], metadata['tsc_source'] = DEFAULT_CPU_FREQ * 1e9, "default"
+    return metadata
+
+
+def _write(path, data):
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path) or ".", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w") as f:
+            json.dump(data, f, indent=2)
+        os.replace(tmp, path)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+
+
+def complete(path, probed, settings=()):
+    """Add the probed machine metadata and the sampling settings to the metadata.json in path"""
+    # What the driver measured takes precedence over the probe
+    metadata = dict(probed)
+    metadata.update(load(path) or {})
+    metadata.setdefault('sampling', {}).update(settings)
+    _write(os.path.join(path, METADATA_FILE), metadata)
+    return metadata
+
+
+def parse_setting(spec):
+    """Turn "samples=10000" into ("samples", 10000) (usable as an argparse type)"""
+    key, sep, value = spec.partition("=")
+    if not sep or not key:
+        raise argparse.ArgumentTypeError("bad setting '%s' (expected KEY=VALUE)" % spec)
+    try:
+        return key, json.loads(value)
+    except ValueError:
+        return key, value
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Add the machine metadata to the metadata.json of a data directory')
+    parser.add_argument('dir', help='Data directory (the driver\'s out directory, or the time directory)')
+    parser.add_argument('--set', type=parse_setting, action='append', default=[], metavar='KEY=VALUE',
+                        help='Also record this sampling parameter (repeatable)')
+    args = parser.parse_args()
+
+    metadata = complete(args.dir, probe(), args.set)
+    print("%s: TSC %.3f GHz (%s), %s, %s" % (os.path.join(args.dir, METADATA_FILE), (metadata['tsc_hz'] or 0) / 1e9,
+                                             metadata['tsc_source'], metadata['cpu'], metadata['gpu']))
+
+
+if __name__ == "__main__":
+    main()
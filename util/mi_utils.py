@@ -0,0 +1,166 @@
+import numpy as np
+
+import bootstrap_utils
+import profile_utils
+import report_utils
+
+# Mutual information and capacity of the pattern channel.
+#
+# To compare configurations on equal terms, every pattern pair of a cell
+# (e.g. a layer count) is treated as a channel: the texture sends one of its
+# two patterns, the receiver sees the binned metric of one frame. The bins of
+# a metric are set once per cell, at the quantiles of the frames of all its
+# patterns and at the extremes of every pattern, and every frame is coded
+# once; the histograms of a pattern pair are then bincounts of the shared
+# codes. Binning only loses information, so fewer bins give lower MI. Per
+# pair and metric:
+#   mi_plugin  I(pattern; bin) in bits per frame at equal priors, from the
+#              histograms as they are (biased upwards by the finite sample)
+#   mi         the same with the Miller-Madow correction of the entropies,
+#              (occupied bins - 1) / 2N, N the effective number of frames
+#              of the mixture; clipped to [0, capacity upper bound]
+#   capacity   bounds on the capacity of the binned channel by
+#              Blahut-Arimoto over the priors: the corrected MI at the
+#              optimal prior (at least mi), and the largest divergence of a
+#              pattern from the output distribution at it (at most 1 bit)
+#
+# compare_cells() prints one table over all the cells of an analysis, records
+# it for --stats-only and draws the corrected MI of every cell as a heatmap.
+
+# Blahut-Arimoto stops once its bounds are this close (bits), or after MAX_ITERATIONS
+TOLERANCE = 1e-6
+MAX_ITERATIONS = 1000
+
+
+def add_arguments(parser):
+    """Add the mutual information options to an argparse parser"""
+    parser.add_argument('--mi', action='store_true',
+                        help='Report the mutual information and capacity bounds (bits per frame) of every pattern pair, and plot them')
+    parser.add_argument('--mi-bins', type=int, default=0, metavar='N',
+                        help='Bins per metric and cell (default: cube root of the frames of the cell, 2 to 64)')
+
+
+def bin_codes(samples, bins=0):
+    """Bin of every sample of every pattern, with the edges at the quantiles of all of them"""
+    samples = [np.asarray(s, dtype=np.float64) for s in samples]
+    pooled = np.concatenate(samples)
+    pooled = pooled[np.isfinite(pooled)]
+    if bins <= 0:
+        bins = int(np.clip(round(len(pooled) ** (1 / 3)), 2, 64))
+    if not len(pooled):
+        return [np.full(len(s), -1) for s in samples], 1
+    # The extremes of every pattern are edges too, so that no bin spans the gap between patterns that do not overlap
+    extremes = [f(s[np.isfinite(s)]) for s in samples if np.isfinite(s).any() for f in (np.min, np.max)]
+    edges = np.unique(np.concatenate((np.quantile(pooled, np.linspace(0, 1, bins + 1)[1:-1]), extremes)))
+    edges = edges[(edges > pooled.min()) & (edges <= pooled.max())]
+    # Non-finite samples are left out with code -1
+    return [np.where(np.isfinite(s), np.searchsorted(edges, s, side='right'), -1) for s in samples], len(edges) + 1
+
+
+def entropy(p):
+    """Entropy in nats of the rows of p"""
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return -np.sum(np.where(p > 0, p * np.log(p), 0.0), axis=-1)
+
+
+def information(counts, prior):
+    """Plug-in and Miller-Madow corrected I(pattern; bin) in nats, counts holds one histogram per pattern"""
+    n = counts.sum(axis=1)
+    channel = counts / n[:, None]
+    output = prior @ channel
+    plugin = entropy(output) - prior @ entropy(channel)
+    # Effective number of frames of the mixture: 1 / sum of prior^2 / n
+    n_mix = 1 / np.sum(prior ** 2 / n)
+    correction = (np.count_nonzero(output) - 1) / (2 * n_mix) - prior @ ((np.count_nonzero(counts, axis=1) - 1) / (2 * n))
+    return plugin, plugin + correction
+
+
+def capacity(counts):
+    """Blahut-Arimoto on the binned channel: the optimal prior and the upper bound on the capacity (nats)"""
+    channel = counts / counts.sum(axis=1)[:, None]
+    prior = np.full(len(channel), 1 / len(channel))
+    for _ in range(MAX_ITERATIONS):
+        output = prior @ channel
+        with np.errstate(divide='ignore', invalid='ignore'):
+            divergence = np.sum(np.where(channel > 0, channel * np.log(channel / output), 0.0), axis=1)
+        lower, upper = prior @ divergence, divergence.max()
+        if upper - lower < TOLERANCE * np.log(2):
+            break
+        prior = prior * np.exp(divergence)
+        prior /= prior.sum()
+    return prior, upper
+
+
+def compare(counts):
+    """Information of a pair of histograms (over the same bins), in bits per frame"""
+    equal = np.full(len(counts), 1 / len(counts))
+    plugin, corrected = information(counts, equal)
+    prior, upper = capacity(counts)
+    _, lower = information(counts, prior)
+    # The corrections may overshoot what the plug-in channel carries
+    corrected = np.clip(corrected, 0, upper)
+    lower = np.clip(lower, corrected, upper)
+    return {
+        'n_a': int(counts[0].sum()), 'n_b': int(counts[1].sum()),
+        'mi_plugin': float(plugin / np.log(2)), 'mi': float(corrected / np.log(2)),
+        'capacity': [float(lower / np.log(2)), float(upper / np.log(2))],
+    }
+
+
+def compare_cells(cells, args, name, key_name="layer"):
+    """Information of the patterns of every cell, print, record and plot the results.
+
+    cells maps a key (e.g. the layer count) to {pattern: {metric: samples}};
+    every pair of patterns of a key is compared on every metric they share.
+    """
+    if not args.mi:
+        return []
+    rows = []
+    for key in sorted(cells):
+        patterns = list(cells[key])
+        metrics = [metric for metric in cells[key][patterns[0]] if all(metric in cells[key][p] for p in patterns)] if patterns else []
+        for metric in metrics:
+            codes, bins = bin_codes([cells[key][p][metric] for p in patterns], args.mi_bins)
+            counts = {p: np.bincount(c[c >= 0], minlength=bins) for p, c in zip(patterns, codes)}
+            for pattern_a, pattern_b in bootstrap_utils.pattern_pairs(patterns):
+                pair = np.array([counts[pattern_a], counts[pattern_b]], dtype=np.float64)
+                if pair[0].sum() == 0 or pair[1].sum() == 0:
+                    continue
+                rows.append(dict({key_name: key, 'a': pattern_a, 'b': pattern_b, 'metric': metric, 'bins': bins}, **compare(pair)))
+    report_utils.record(name + "_mi", rows)
+    if report_utils.stats_only() or not rows:
+        return rows
+
+    print("\n%s: information of the pattern pairs (bits per frame, equal priors)" % name)
+    print("\t%12s  %-34s  %-40s %6s %6s %9s %9s %19s" % (key_name, "pair", "metric", "frames", "bins", "plug-in", "MI", "capacity"))
+    for row in rows:
+        print("\t%12s  %-34s  %-40s %6d %6d %9.4f %9.4f  [%7.4f, %7.4f]" % (
+            "%g" % row[key_name] if isinstance(row[key_name], (int, float)) else row[key_name], "%s vs %s" % (row['a'], row['b']),
+            row['metric'], row['n_a'] + row['n_b'], row['bins'], row['mi_plugin'], row['mi'], row['capacity'][0], row['capacity'][1]))
+    plot(rows, name, key_name)
+    return rows
+
+
+@profile_utils.profiled
+def plot(rows, name, key_name):
+    """Heatmap of the corrected MI, one row per pattern pair and metric, one column per cell"""
+    keys = sorted({row[key_name] for row in rows})
+    labels = list(dict.fromkeys("%s vs %s, %s" % (row['a'], row['b'], row['metric']) for row in rows))
+    grid = np.full((len(labels), len(keys)), np.nan)
+    for row in rows:
+        grid[labels.index("%s vs %s, %s" % (row['a'], row['b'], row['metric'])), keys.index(row[key_name])] = row['mi']
+
+    import matplotlib.pyplot as plt
+    fig, ax = plt.subplots(1, 1, figsize=(max(3, 0.4 * len(keys) + 2.5), 0.3 * len(labels) + 1.2))
+    image = ax.imshow(grid, aspect='auto', cmap='viridis', vmin=0, vmax=1)
+    ax.set_xticks(range(len(keys)))
+    ax.set_xticklabels(["%g" % k if isinstance(k, (int, float)) else k for k in keys], fontsize=6, rotation=90)
+    ax.set_yticks(range(len(labels)))
+    ax.set_yticklabels(labels, fontsize=6)
+    ax.set_xlabel(key_name, fontsize=8)
+    fig.colorbar(image, ax=ax).set_label('MI (bits per frame)', fontsize=8)
+    plt.tight_layout()
+
+    with profile_utils.stage("savefig", name + "_mi"):
+        plt.savefig("./plot/%s_mi.pdf" % name, dpi=300, bbox_inches='tight')
+    plt.close(fig)
@@ -0,0 +1,33 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import cache_utils
+
+# Parallel parsing of independent trace groups.
+#
+# Each (imc, time, mem, gpu) group is parsed on its own, so the groups can be
+# spread over a process pool. Workers return NumPy arrays, which pickle as
+# raw buffers, and results come back in submission order so that merging them
+# by label gives exactly the same output as the serial loop.
+
+
+def add_arguments(parser):
+    """Add the --jobs option to an argparse parser"""
+    parser.add_argument('--jobs', '-j', type=int, default=1,
+                        help='Number of worker processes (parsing, bootstrap), 0 for one per CPU (default: %(default)s)')
+
+
+def map_groups(func, groups, jobs):
+    """Return [func(*group) for group in groups], using up to jobs processes"""
+    groups = list(groups)
+    if jobs == 0:
+        jobs = os.cpu_count() or 1
+    jobs = min(jobs, len(groups))
+    if jobs <= 1:
+        return [func(*group) for group in groups]
+
+    # Workers may be spawned rather than forked: hand them the cache settings
+    with ProcessPoolExecutor(max_workers=jobs, initializer=cache_utils.set_config,
+                             initargs=(cache_utils.get_config(),)) as executor:
+        futures = [executor.submit(func, *group) for group in groups]
+        return [future.result() for future in futures]
@@ -0,0 +1,165 @@
+import os
+import sys
+import json
+import time
+import atexit
+import functools
+import cProfile
+import resource
+import contextlib
+import tracemalloc
+
+import pool_utils
+
+# Per-stage profiling of the analysis scripts (--profile).
+#
+# Scripts mark their stages with `with profile_utils.stage(name, file):` (or
+# the @profiled decorator) and parse their inputs with map_files. Without
+# --profile, stage() hands back a shared no-op context manager and map_files
+# is pool_utils.map_groups, so the hooks cost a function call per stage.
+#
+# With --profile, every stage records its wall time, CPU time, and the peak
+# and net memory allocated by Python objects and NumPy arrays (tracemalloc)
+# relative to the start of the stage. Stages nest; the per-file stages of
+# map_files also run in the worker processes and are sent back with the
+# results. The JSON report is written when the script exits. With --cprofile,
+# the slowest top-level stage is also dumped in cProfile format, readable
+# with `python -m pstats` or snakeviz.
+
+_profiler = None
+_disabled = contextlib.nullcontext()
+
+
+def add_arguments(parser):
+    """Add the profiling options to an argparse parser"""
+    parser.add_argument('--profile', action='store_true',
+                        help='Write the wall time, CPU time and memory of every stage to profile.json next to the output')
+    parser.add_argument('--cprofile', action='store_true',
+                        help='With --profile, also dump a cProfile of the slowest stage (slows every stage down)')
+
+
+def configure(args, out_dir):
+    """Apply the options added by add_arguments, the report goes to out_dir/profile.json"""
+    global _profiler
+    if args.profile:
+        _profiler = Profiler(args.cprofile)
+        atexit.register(_profiler.write, os.path.join(out_dir, "profile.json"))
+
+
+class Profiler:
+    """Records of the stages run so far, see stage"""
+
+    def __init__(self, cprofile=False):
+        self.cprofile = cprofile
+        self.pid = os.getpid()
+        self.records = []
+        self.stack = []
+        self.profiles = {}
+        self.wall = time.perf_counter()
+        self.cpu = time.process_time()
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+    @contextlib.contextmanager
+    def stage(self, name, file=None):
+        # The enclosing stage keeps the peak it reached before ours resets it
+        if self.stack:
+            self.stack[-1]['peak_seen'] = max(self.stack[-1]['peak_seen'], tracemalloc.get_traced_memory()[1])
+        tracemalloc.reset_peak()
+        start = tracemalloc.get_traced_memory()[0]
+        record = {'stage': name, 'file': file, 'depth': len(self.stack), 'pid': os.getpid()}
+        frame = {'peak_seen': 0}
+        self.records.append(record)
+        self.stack.append(frame)
+        # cProfile cannot nest, only top-level stages are profiled
+        profile = cProfile.Profile() if self.cprofile and len(self.stack) == 1 else None
+        wall = time.perf_counter()
+        cpu = time.process_time()
+        if profile is not None:
+            profile.enable()
+        try:
+            yield
+        finally:
+            if profile is not None:
+                profile.disable()
+                self.profiles[id(record)] = profile
+            record['wall'] = time.perf_counter() - wall
+            record['cpu'] = time.process_time() - cpu
+            current, peak = tracemalloc.get_traced_memory()
+            peak = max(peak, frame['peak_seen'])
+            self.stack.pop()
+            if self.stack:
+                self.stack[-1]['peak_seen'] = max(self.stack[-1]['peak_seen'], peak)
+            record['peak_kib'] = (peak - start) / 1024
+            record['net_kib'] = (current - start) / 1024
+
+    def write(self, path):
+        top = [record for record in self.records if record['depth'] == 0 and 'wall' in record]
+        slowest = max(top, key=lambda record: record['wall']) if top else None
+        report = {
+            'argv': sys.argv,
+            'wall': time.perf_counter() - self.wall,
+            'cpu': time.process_time() - self.cpu,
+            # ru_maxrss is in KiB on Linux
+            'peak_rss_kib': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+            'slowest': slowest['stage'] if slowest else None,
+            'cprofile': None,
+            'stages': self.records,
+        }
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        if slowest is not None and id(slowest) in self.profiles:
+            report['cprofile'] = os.path.join(os.path.dirname(path), "profile-%s.prof" % slowest['stage'])
+            self.profiles[id(slowest)].dump_stats(report['cprofile'])
+        with open(path, 'w') as f:
+            json.dump(report, f, indent=2)
+        print("Profile written to %s" % path, file=sys.stderr)
+
+
+def stage(name, file=None):
+    """Context manager timing one stage, optionally tied to an input file"""
+    if _profiler is None:
+        return _disabled
+    return _profiler.stage(name, file)
+
+
+def profiled(func):
+    """Decorator running every call of func as a stage named after it"""
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        if _profiler is None:
+            return func(*args, **kwargs)
+        with _profiler.stage(func.__name__):
+            return func(*args, **kwargs)
+    return wrapper
+
+
+class _FileStage:
+    # Picklable wrapper of a map_files function, runs in the worker processes
+    def __init__(self, name, func, file_index):
+        self.name = name
+        self.func = func
+        self.file_index = file_index
+
+    def __call__(self, *group):
+        global _profiler
+        # Forked workers inherit the profiler of the main process, start afresh
+        if _profiler is None or _profiler.pid != os.getpid():
+            _profiler = Profiler()
+        first = len(_profiler.records)
+        with _profiler.stage(self.name, group[self.file_index]):
+            result = self.func(*group)
+        return result, _profiler.records[first:]
+
+
+def map_files(name, func, groups, jobs, file_index=0):
+    """pool_utils.map_groups, timing every group as a stage named after its file_index-th item"""
+    if _profiler is None:
+        return pool_utils.map_groups(func, groups, jobs)
+    results = pool_utils.map_groups(_FileStage(name, func, file_index), groups, jobs)
+    for _, records in results:
+        # Records of groups parsed in this process are already there
+        for record in records:
+            if record['pid'] != os.getpid():
+                record['depth'] += len(_profiler.stack)
+                _profiler.records.append(record)
+    return [result for result, _ in results]
@@ -0,0 +1,78 @@
+import sys
+import json
+import math
+
+import numpy as np
+
+# Machine-readable statistics of the analysis scripts (--stats-only).
+#
+# The plotting functions record the series they are about to plot with
+# record(), then return before touching matplotlib when stats_only() is set;
+# the scripts import matplotlib inside their plotting code, so a stats-only
+# run never pays for it. dump() prints everything recorded as one JSON
+# document on stdout, for batch scripts that only want the numbers.
+
+_config = {
+    "stats_only": False,
+}
+_stats = {}
+
+
+def add_arguments(parser):
+    """Add the --stats-only option to an argparse parser"""
+    parser.add_argument('--stats-only', action='store_true',
+                        help='Print the statistics as JSON on stdout instead of plotting (does not load matplotlib)')
+
+
+def configure(args):
+    """Apply the options added by add_arguments"""
+    _config["stats_only"] = args.stats_only
+
+
+def stats_only():
+    return _config["stats_only"]
+
+
+def mean_std(values):
+    """{"mean": ..., "std": ...} of a series of samples"""
+    return {"mean": float(np.mean(values)), "std": float(np.std(values))}
+
+
+def series(keys, c, c_std, nc, nc_std, key="layer"):
+    """Rows of a compressible vs non-compressible plot, one per x value"""
+    return [{key: k, "compressible": {"mean": c[i], "std": c_std[i]},
+             "non_compressible": {"mean": nc[i], "std": nc_std[i]}}
+            for i, k in enumerate(keys)]
+
+
+def record(name, stats):
+    """Keep the statistics of one plot (or report) under name"""
+    _stats[name] = stats
+
+
+def _default(value):
+    # NumPy scalars and arrays
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    raise TypeError("%r is not JSON serializable" % (value,))
+
+
+def _finite(value):
+    # JSON has no NaN or infinity: those become null, in NumPy arrays and scalars too
+    if isinstance(value, dict):
+        return {k: _finite(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_finite(v) for v in value]
+    if isinstance(value, (np.generic, np.ndarray)):
+        return _finite(value.tolist())
+    if isinstance(value, float) and not math.isfinite(value):
+        return None
+    return value
+
+
+def dump(file=sys.stdout, **extra):
+    """Print the recorded statistics (and extra top-level items) as JSON, with null for NaN"""
+    json.dump(_finite(dict(extra, **_stats)), file, indent=2, default=_default, allow_nan=False)
+    file.write("\n")
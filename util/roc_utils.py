@@ -0,0 +1,102 @@
+import numpy as np
+
+import bootstrap_utils
+import report_utils
+
+# ROC curves of pattern pairs.
+#
+# Whether the compressibility of a texture leaks is whether a single frame
+# tells the patterns apart, not how far their means are. roc() sorts the
+# samples of both patterns once and reads the whole ROC curve of the rule
+# "pattern b if x > t" off the cumulative counts at every distinct value t,
+# so a pair costs one O(n log n) sort however many frames it has. From the
+# curve:
+#   auc       P(b > a) + P(b = a) / 2, 0.5 when the patterns are alike and
+#             below it when b tends to be the smaller one
+#   accuracy  the best single-threshold classification accuracy at equal
+#             priors, (1 + max |TPR - FPR|) / 2 over thresholds and both
+#             directions of the rule
+#
+# compare_cells() runs every (key, pattern pair, metric) cell of an analysis,
+# the cells of bootstrap_utils.compare_cells, prints one line per cell and
+# records the rows (with the curve at --roc-points points) for --stats-only.
+
+
+def add_arguments(parser):
+    """Add the ROC options to an argparse parser"""
+    parser.add_argument('--roc', action='store_true', help='Report the ROC AUC and best threshold accuracy of every pattern pair')
+    parser.add_argument('--roc-points', type=int, default=101, metavar='N',
+                        help='Points of every ROC curve kept in the --stats-only report (default: %(default)s)')
+
+
+def roc(a, b):
+    """False and true positive rates of "b if x > t" for every distinct sample value t, and the thresholds.
+
+    The curve runs from (1, 1) (t below every sample) to (0, 0).
+    """
+    a = np.asarray(a, dtype=np.float64)
+    b = np.asarray(b, dtype=np.float64)
+    a = a[np.isfinite(a)]
+    b = b[np.isfinite(b)]
+    values = np.concatenate((a, b))
+    is_b = np.concatenate((np.zeros(len(a), dtype=bool), np.ones(len(b), dtype=bool)))
+    order = np.argsort(values)
+    values = values[order]
+    is_b = is_b[order]
+    # Last sample of every run of equal values
+    last = np.flatnonzero(np.append(values[1:] != values[:-1], True))
+    below_b = np.cumsum(is_b)[last]
+    below_a = last + 1 - below_b
+    fpr = np.concatenate(([1.0], (len(a) - below_a) / max(len(a), 1)))
+    tpr = np.concatenate(([1.0], (len(b) - below_b) / max(len(b), 1)))
+    thresholds = np.concatenate(([-np.inf], values[last]))
+    return fpr, tpr, thresholds
+
+
+def compare(a, b, points=0):
+    """AUC and best threshold accuracy of telling b from a, with the curve at (about) points points"""
+    fpr, tpr, thresholds = roc(a, b)
+    # The curve runs right to left
+    auc = float(np.sum((fpr[:-1] - fpr[1:]) * (tpr[:-1] + tpr[1:]) / 2))
+    gap = tpr - fpr
+    best = np.argmax(np.abs(gap))
+    result = {
+        'n_a': int(np.sum(np.isfinite(a))), 'n_b': int(np.sum(np.isfinite(b))),
+        'auc': auc,
+        'accuracy': float((1 + abs(gap[best])) / 2),
+        # x > threshold classifies as b ("above"), or as a ("below")
+        'threshold': float(thresholds[best]),
+        'direction': "above" if gap[best] >= 0 else "below",
+    }
+    if points > 0:
+        keep = np.unique(np.linspace(0, len(fpr) - 1, min(points, len(fpr))).round().astype(np.int64))
+        result['fpr'] = fpr[keep].tolist()
+        result['tpr'] = tpr[keep].tolist()
+    return result
+
+
+def compare_cells(cells, args, name, key_name="layer"):
+    """ROC of the patterns of every cell, print and record the results.
+
+    cells maps a key (e.g. the layer count) to {pattern: {metric: samples}};
+    every pair of patterns of a key is compared on every metric they share.
+    """
+    if not args.roc:
+        return []
+    rows = []
+    if not report_utils.stats_only():
+        print("\n%s: ROC of the pattern pairs (AUC of the second pattern, best threshold accuracy)" % name)
+    for key in sorted(cells):
+        for pattern_a, pattern_b in bootstrap_utils.pattern_pairs(list(cells[key])):
+            for metric in cells[key][pattern_a]:
+                a, b = cells[key][pattern_a][metric], cells[key][pattern_b].get(metric)
+                if b is None or len(a) == 0 or len(b) == 0:
+                    continue
+                result = compare(a, b, args.roc_points)
+                rows.append(dict({key_name: key, 'a': pattern_a, 'b': pattern_b, 'metric': metric}, **result))
+                if not report_utils.stats_only():
+                    print("\t%s %s, %s vs %s, %s: AUC %.4f, accuracy %.4f (%s above %f)" % (
+                        key_name, key, pattern_a, pattern_b, metric, result['auc'], result['accuracy'],
+                        pattern_b if result['direction'] == "above" else pattern_a, result['threshold']))
+    report_utils.record(name + "_roc", rows)
+    return rows
@@ -0,0 +1,146 @@
+import numpy as np
+
+import report_utils
+
+# Steady-state segmentation of the frames of a run.
+#
+# A driver run starts with warm-up frames, and may throttle or change GPU
+# frequency on the way; the percentile filter of the analysers only clips
+# the tails of the pooled frames, so such stretches are averaged in. With
+# --segment, every run is split at its change points first, and only its
+# steady-state segments go into the statistics.
+#
+# The series of a run (rendering time, DRAM traffic and GPU frequency, as far
+# as the run has them) are each scaled to unit frame noise, estimated from
+# the differences of consecutive frames so that level changes do not inflate
+# it, and clipped at CLIP noise units so that single outlier frames do not
+# pose as segments. The traffic follows the rendering time from frame to
+# frame, so the clipped series are then whitened with the covariance of
+# their differences, lest the same noise count once per series. Binary
+# segmentation then splits a segment [a, b) at the frame t that most reduces
+# the squared error of the segment means, summed over the series,
+#   gain(t) = |S(a, t)|^2 / (t - a) + |S(t, b)|^2 / (b - t) - |S(a, b)|^2 / (b - a)
+# with S the sums over prefix sums, i.e. one vectorized pass per segment. A
+# split is kept if its gain exceeds --segment-penalty * log(frames) and both
+# sides have --min-segment frames.
+#
+# The longest segment is taken as the steady state of the run; segments whose
+# mean lies within --steady-tolerance noise units of it in every (decorrelated)
+# series are steady too (the run returned to it), the others (warm-up,
+# throttled or off-frequency stretches) are dropped.
+
+# Noise units at which the scaled series are clipped
+CLIP = 4.0
+
+
+def add_arguments(parser):
+    """Add the steady-state segmentation options to an argparse parser"""
+    parser.add_argument('--segment', action='store_true',
+                        help='Only keep the steady-state frames of every run, split at the change points of its rendering time, traffic and GPU frequency')
+    parser.add_argument('--segment-penalty', type=float, default=3.0, metavar='K',
+                        help='Gain a change point needs, K * log(frames) in units of the frame noise variance (default: %(default)s)')
+    parser.add_argument('--min-segment', type=int, default=50, metavar='FRAMES',
+                        help='Shortest segment (default: %(default)s)')
+    parser.add_argument('--steady-tolerance', type=float, default=0.5, metavar='NOISE',
+                        help='Largest difference to the longest segment of a steady segment, in frame noise units (default: %(default)s)')
+
+
+def noise_scale(values):
+    """Standard deviation of the frame noise, from the median absolute difference of consecutive frames"""
+    scale = 1.4826 * np.median(np.abs(np.diff(values))) / np.sqrt(2) if len(values) > 1 else 0.0
+    return scale if scale > 0 else np.std(values)
+
+
+def scaled(series):
+    """The series as the uncorrelated columns of an array in noise units, without those that are missing or constant"""
+    columns = []
+    for values in series:
+        values = np.asarray(values, dtype=np.float64)
+        finite = np.isfinite(values)
+        if not finite.any():
+            continue
+        values = np.where(finite, values, np.mean(values[finite]))
+        scale = noise_scale(values)
+        if scale > 0:
+            columns.append(np.clip((values - np.median(values)) / scale, -CLIP, CLIP))
+    n = len(series[0]) if len(series) else 0
+    if not columns:
+        return np.zeros((n, 0))
+    X = np.column_stack(columns)
+    if n < 3:
+        return X
+    # Whiten with the covariance of the frame noise, leaving out directions without noise (e.g. read and write in proportion)
+    w, V = np.linalg.eigh(np.atleast_2d(np.cov(np.diff(X, axis=0), rowvar=False)) / 2)
+    keep = w > 1e-6 * w.max()
+    return X @ V[:, keep] / np.sqrt(w[keep])
+
+
+def change_points(X, penalty, min_size):
+    """Change points of the columns of X by binary segmentation, sorted"""
+    n = len(X)
+    prefix = np.zeros((n + 1, X.shape[1]))
+    np.cumsum(X, axis=0, out=prefix[1:])
+    points = []
+    pending = [(0, n)]
+    while pending:
+        a, b = pending.pop()
+        if b - a < 2 * min_size or X.shape[1] == 0:
+            continue
+        t = np.arange(a + min_size, b - min_size + 1)
+        left = prefix[t] - prefix[a]
+        right = prefix[b] - prefix[t]
+        total = prefix[b] - prefix[a]
+        gain = (np.einsum('ij,ij->i', left, left) / (t - a) + np.einsum('ij,ij->i', right, right) / (b - t)
+                - total @ total / (b - a))
+        best = np.argmax(gain)
+        if gain[best] <= penalty:
+            continue
+        points.append(int(t[best]))
+        pending += [(a, int(t[best])), (int(t[best]), b)]
+    return sorted(points)
+
+
+def segments(series, args):
+    """(start, stop, steady) of every segment of a run, series holds one array per metric with a value per frame"""
+    X = scaled(series)
+    n = len(X)
+    if n == 0:
+        return []
+    bounds = [0] + change_points(X, args.segment_penalty * np.log(max(n, 2)), max(args.min_segment, 1)) + [n]
+    levels = np.array([X[a:b].mean(axis=0) for a, b in zip(bounds[:-1], bounds[1:])])
+    longest = np.argmax(np.diff(bounds))
+    steady = np.all(np.abs(levels - levels[longest]) <= args.steady_tolerance, axis=1)
+    return [(a, b, bool(s)) for a, b, s in zip(bounds[:-1], bounds[1:], steady)]
+
+
+def steady_mask(series, args):
+    """Boolean mask of the steady-state frames of a run (all frames without --segment), and its segments"""
+    n = len(series[0])
+    if not args.segment:
+        return np.ones(n, dtype=bool), []
+    found = segments(series, args)
+    mask = np.zeros(n, dtype=bool)
+    for a, b, steady in found:
+        mask[a:b] = steady
+    return mask, found
+
+
+def report(name, runs):
+    """Print and record the segments of every run, runs maps a run label to its segments (see steady_mask)"""
+    if not runs or not any(runs.values()):
+        return
+    rows = []
+    for label, found in runs.items():
+        frames = sum(b - a for a, b, _ in found)
+        kept = sum(b - a for a, b, steady in found if steady)
+        rows.append({'run': label, 'frames': frames, 'kept': kept, 'segments': [[a, b, steady] for a, b, steady in found]})
+    report_utils.record(name + "_segments", rows)
+    if report_utils.stats_only():
+        return
+    frames = sum(row['frames'] for row in rows)
+    kept = sum(row['kept'] for row in rows)
+    print("\n%s: steady state of %d runs, %d of %d frames (%.1f%%), %d runs with change points" % (
+        name, len(rows), kept, frames, 100.0 * kept / max(frames, 1), sum(len(row['segments']) > 1 for row in rows)))
+    for row in rows:
+        if len(row['segments']) > 1:
+            print("\t%s: %s" % (row['run'], ", ".join("%d-%d%s" % (a, b, "" if steady else " (dropped)") for a, b, steady in row['segments'])))
@@ -0,0 +1,94 @@
+import itertools
+
+import numpy as np
+
+import stats_utils
+
+# Sequential comparison of pattern streams, for stopping a measurement early.
+#
+# A fixed sample count is sized for the slowest configuration; most pattern
+# pairs separate long before. The controller (trace_sequential.py) feeds the
+# frames of every round into a SequentialComparison and stops as soon as
+# every difference of means is known to --precision, i.e. the interval around
+# it is narrower than precision times its size (which, below 1, also settles
+# its sign).
+#
+# The intervals are asymptotic confidence sequences (Waudby-Smith et al.,
+# "Time-uniform central limit theory and asymptotic confidence sequences"):
+# a normal-mixture boundary around the running mean, valid at every round
+# simultaneously, so looking after each round does not inflate the error
+# rate the way repeated fixed-n tests would. Each mean gets alpha / 2 of the
+# budget of its pair, and the pairs and metrics of a configuration share
+# 1 - confidence by a union bound.
+
+DEFAULT_CONFIDENCE = 0.95
+DEFAULT_PRECISION = 0.25
+DEFAULT_MIN_FRAMES = 100
+
+
+def add_arguments(parser):
+    """Add the stopping rule options to an argparse parser"""
+    parser.add_argument('--confidence', type=float, default=DEFAULT_CONFIDENCE,
+                        help='Simultaneous coverage of the confidence sequences (default: %(default)s)')
+    parser.add_argument('--precision', type=float, default=DEFAULT_PRECISION,
+                        help='Stop once every interval is narrower than this fraction of its difference (default: %(default)s)')
+    parser.add_argument('--min-frames', type=int, default=DEFAULT_MIN_FRAMES,
+                        help='Frames per pattern before stopping is considered, the boundary is tightest there (default: %(default)s)')
+
+
+def mixture_rho2(alpha, n):
+    """Mixing variance of the boundary that is tightest after n samples"""
+    log_term = -2 * np.log(alpha)
+    return (log_term + np.log(log_term + 1)) / n
+
+
+def radius(n, std, alpha, rho2):
+    """Half-width of the asymptotic confidence sequence of a mean after n samples"""
+    if n < 2:
+        return np.inf
+    t_rho2 = n * rho2
+    return std * np.sqrt(2 * (t_rho2 + 1) / (n * n * rho2) * np.log(np.sqrt(t_rho2 + 1) / alpha))
+
+
+class SequentialComparison:
+    """Running difference of means of every (pattern pair, metric) of a configuration.
+
+    update() folds in the frames of one pattern, results() and resolved()
+    tell how far every difference is known after all updates so far.
+    """
+
+    def __init__(self, pairs, metrics, confidence=DEFAULT_CONFIDENCE, precision=DEFAULT_PRECISION,
+                 min_frames=DEFAULT_MIN_FRAMES):
+        self.pairs = list(pairs)
+        self.metrics = list(metrics)
+        self.precision = precision
+        self.min_frames = min_frames
+        self.alpha = (1 - confidence) / (2 * len(self.pairs) * len(self.metrics))
+        self.rho2 = mixture_rho2(self.alpha, min_frames)
+        patterns = set(itertools.chain.from_iterable(self.pairs))
+        self.stats = {pattern: {metric: stats_utils.RunningStats() for metric in self.metrics} for pattern in patterns}
+
+    def update(self, pattern, samples):
+        """Add the frames of pattern, samples maps each metric to its per-frame values"""
+        for metric in self.metrics:
+            self.stats[pattern][metric].update(samples[metric])
+
+    def results(self):
+        """One row per (pair, metric): counts, difference (b - a), its interval and whether it is resolved"""
+        rows = []
+        for a, b in self.pairs:
+            for metric in self.metrics:
+                sa, sb = self.stats[a][metric], self.stats[b][metric]
+                delta = sb.mean - sa.mean
+                # std with ddof=1
+                width = sum(radius(s.count, np.sqrt(s.m2 / max(s.count - 1, 1)), self.alpha, self.rho2) for s in (sa, sb))
+                rows.append({
+                    'a': a, 'b': b, 'metric': metric,
+                    'n_a': sa.count, 'n_b': sb.count,
+                    'delta': delta, 'delta_cs': [delta - width, delta + width],
+                    'resolved': bool(min(sa.count, sb.count) >= self.min_frames and width <= self.precision * abs(delta)),
+                })
+        return rows
+
+    def resolved(self):
+        return all(row['resolved'] for row in self.results())
@@ -0,0 +1,137 @@
+import numpy as np
+
+# Mergeable running statistics for traces that do not fit in memory.
+
+# Defaults of the quantile sketch used for the 5/95 percentile trimming
+DEFAULT_QUANTILE_ERROR = 0.001
+DEFAULT_EXACT_LIMIT = 10000
+
+
+def add_arguments(parser):
+    """Add the quantile sketch options to an argparse parser"""
+    parser.add_argument('--quantile-error', type=float, default=DEFAULT_QUANTILE_ERROR,
+                        help='Rank error of the percentile sketch, as a fraction of the samples (default: %(default)s)')
+    parser.add_argument('--exact-quantiles', type=int, default=DEFAULT_EXACT_LIMIT, metavar='N',
+                        help='Use exact percentiles for labels with up to N samples (default: %(default)s)')
+
+
+class RunningStats:
+    """Count, mean, M2, min and max of a stream of samples.
+
+    Chunks are folded in with the pairwise update of Chan et al., so stats
+    computed per file, per label or per worker can be merged in any order.
+    std is the population standard deviation, like np.std.
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.min = np.inf
+        self.max = -np.inf
+
+    def update(self, values):
+        values = np.asarray(values, dtype=np.float64).ravel()
+        if len(values) == 0:
+            return self
+        chunk = RunningStats()
+        chunk.count = len(values)
+        chunk.mean = float(np.mean(values))
+        chunk.m2 = float(np.sum((values - chunk.mean) ** 2))
+        chunk.min = float(np.min(values))
+        chunk.max = float(np.max(values))
+        return self.merge(chunk)
+
+    def merge(self, other):
+        if other.count == 0:
+            return self
+        count = self.count + other.count
+        delta = other.mean - self.mean
+        self.mean = self.mean + delta * other.count / count
+        self.m2 = self.m2 + other.m2 + delta * delta * self.count * other.count / count
+        self.count = count
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        return self
+
+    @property
+    def var(self):
+        return self.m2 / self.count if self.count else np.nan
+
+    @property
+    def std(self):
+        return float(np.sqrt(self.var))
+
+    def summary(self):
+        """(mean, std) as np.mean/np.std would report them, nan if empty"""
+        return (self.mean if self.count else np.nan), self.std
+
+
+class QuantileSketch:
+    """Mergeable KLL sketch of a stream of samples, for percentile bounds.
+
+    Up to exact_limit samples are kept as they are and percentile() matches
+    np.percentile. Past that, every level is a compactor that keeps every
+    other sorted item with twice the weight, so the sketch holds about
+    6/error items and percentile() is off by at most about error * count in
+    rank. Sketches built per file or per worker can be merged in any order.
+    """
+
+    def __init__(self, error=DEFAULT_QUANTILE_ERROR, exact_limit=DEFAULT_EXACT_LIMIT, seed=0):
+        self.k = max(8, int(np.ceil(2.0 / error)))
+        self.exact_limit = exact_limit
+        self.exact = True
+        self.count = 0
+        self.levels = [np.zeros(0)]
+        self._rng = np.random.default_rng(seed)
+
+    def _capacity(self, level):
+        depth = len(self.levels) - 1 - level
+        return max(2, int(np.ceil(self.k * (2.0 / 3.0) ** depth)))
+
+    def _compress(self):
+        if self.exact:
+            if self.count <= self.exact_limit:
+                return
+            self.exact = False
+        # Compact the lowest full level until the sketch fits its total capacity
+        while sum(len(items) for items in self.levels) > sum(self._capacity(level) for level in range(len(self.levels))):
+            level = next(level for level, items in enumerate(self.levels) if len(items) > self._capacity(level))
+            if level + 1 == len(self.levels):
+                self.levels.append(np.zeros(0))
+            items = np.sort(self.levels[level])
+            # An odd item out stays on this level
+            odd = len(items) % 2
+            offset = self._rng.integers(2)
+            self.levels[level + 1] = np.concatenate((self.levels[level + 1], items[offset:len(items) - odd:2]))
+            self.levels[level] = items[len(items) - odd:]
+
+    def update(self, values):
+        values = np.asarray(values, dtype=np.float64).ravel()
+        self.count += len(values)
+        self.levels[0] = np.concatenate((self.levels[0], values))
+        self._compress()
+        return self
+
+    def merge(self, other):
+        self.exact = self.exact and other.exact
+        self.count += other.count
+        for level, items in enumerate(other.levels):
+            if level == len(self.levels):
+                self.levels.append(np.zeros(0))
+            self.levels[level] = np.concatenate((self.levels[level], items))
+        self._compress()
+        return self
+
+    def percentile(self, q):
+        """q-th percentile (0-100) of the samples, nan if empty"""
+        if self.count == 0:
+            return np.nan
+        if self.exact:
+            return np.percentile(self.levels[0], q)
+        values = np.concatenate(self.levels)
+        weights = np.concatenate([np.full(len(items), 2.0 ** level) for level, items in enumerate(self.levels)])
+        order = np.argsort(values, kind='stable')
+        ranks = np.cumsum(weights[order])
+        index = np.searchsorted(ranks, q / 100.0 * ranks[-1])
+        return values[order[min(index, len(order) - 1)]]
@@ -0,0 +1,168 @@
+#include <errno.h>
+#include <fcntl.h>
+#include <pthread.h>
+#include <signal.h>
+#include <sys/socket.h>
+#include <sys/stat.h>
+#include <sys/uio.h>
+#include <sys/un.h>
+#include <unistd.h>
+
+#include "trace-utils.h"
+
+// Streaming sink state, shared by the sampling threads
+static int sink_fd = -1;
+static int sink_streams = 0;
+static pthread_mutex_t sink_lock = PTHREAD_MUTEX_INITIALIZER;
+
+/*
+ * Fill the header of a binary trace
+ */
+static void fill_header(struct trace_header *header, uint32_t backend, uint32_t n_columns, const struct trace_column *columns)
+{
+	memset(header, 0, sizeof(*header));
+	memcpy(header->magic, TRACE_MAGIC, sizeof(TRACE_MAGIC));
+	header->version = TRACE_VERSION;
+	header->backend = backend;
+	header->n_columns = n_columns;
+	header->record_size = n_columns * sizeof(union trace_value);
+	memcpy(header->columns, columns, n_columns * sizeof(struct trace_column));
+}
+
+/*
+ * Write the header of a binary trace
+ */
+int trace_write_header(FILE *file, uint32_t backend, uint32_t n_columns, const struct trace_column *columns)
+{
+	if (n_columns > TRACE_MAX_COLUMNS)
+		return -1;
+
+	struct trace_header header;
+	fill_header(&header, backend, n_columns, columns);
+
+	if (fwrite(&header, sizeof(header), 1, file) != 1)
+		return -1;
+	return 0;
+}
+
+/*
+ * Connect the streaming sink to a Unix domain socket or a FIFO
+ */
+int trace_sink_open(const char *path)
+{
+	struct stat st;
+	if (stat(path, &st) != 0)
+	{
+		perror("Trace sink not found");
+		return -1;
+	}
+
+	// A consumer that goes away must not kill the driver
+	signal(SIGPIPE, SIG_IGN);
+
+	if (S_ISFIFO(st.st_mode))
+	{
+		sink_fd = open(path, O_WRONLY);
+	}
+	else
+	{
+		struct sockaddr_un addr;
+		memset(&addr, 0, sizeof(addr));
+		addr.sun_family = AF_UNIX;
+		strncpy(addr.sun_path, path, sizeof(addr.sun_path) - 1);
+		sink_fd = socket(AF_UNIX, SOCK_STREAM, 0);
+		if (sink_fd >= 0 && connect(sink_fd, (struct sockaddr *)&addr, sizeof(addr)) != 0)
+		{
+			close(sink_fd);
+			sink_fd = -1;
+		}
+	}
+	if (sink_fd < 0)
+	{
+		perror("Trace sink open fail");
+		return -1;
+	}
+	return 0;
+}
+
+/*
+ * Send one message and its payload, atomically with respect to the other threads
+ */
+static void sink_send(struct trace_message *message, const void *payload)
+{
+	struct iovec iov[2] = {{message, sizeof(*message)}, {(void *)payload, message->length}};
+	size_t left = sizeof(*message) + message->length;
+	int n_iov = message->length ? 2 : 1;
+
+	pthread_mutex_lock(&sink_lock);
+	struct iovec *curr = iov;
+	while (sink_fd >= 0 && left > 0)
+	{
+		ssize_t written = writev(sink_fd, curr, n_iov);
+		if (written < 0)
+		{
+			if (errno == EINTR)
+				continue;
+			// Keep sampling to the trace files without the consumer
+			perror("Trace sink write fail, disabling the sink");
+			close(sink_fd);
+			sink_fd = -1;
+			break;
+		}
+		left -= written;
+		while (n_iov > 0 && (size_t)written >= curr->iov_len)
+		{
+			written -= curr->iov_len;
+			curr++;
+			n_iov--;
+		}
+		if (n_iov > 0)
+		{
+			curr->iov_base = (char *)curr->iov_base + written;
+			curr->iov_len -= written;
+		}
+	}
+	pthread_mutex_unlock(&sink_lock);
+}
+
+/*
+ * Announce a new trace on the streaming sink
+ */
+int trace_sink_stream(uint32_t backend, uint32_t n_columns, const struct trace_column *columns, int run, int selector)
+{
+	if (sink_fd < 0 || n_columns > TRACE_MAX_COLUMNS)
+		return -1;
+
+	struct trace_header header;
+	fill_header(&header, backend, n_columns, columns);
+
+	pthread_mutex_lock(&sink_lock);
+	int stream = sink_streams++;
+	pthread_mutex_unlock(&sink_lock);
+
+	struct trace_message message = {TRACE_MSG_OPEN, stream, sizeof(header), run, selector, 0};
+	sink_send(&message, &header);
+	return stream;
+}
+
+/*
+ * Send one record to the streaming sink
+ */
+void trace_sink_record(int stream, const union trace_value *record, uint32_t n_columns)
+{
+	if (stream < 0 || sink_fd < 0)
+		return;
+	struct trace_message message = {TRACE_MSG_RECORD, stream, n_columns * sizeof(union trace_value), 0, 0, 0};
+	sink_send(&message, record);
+}
+
+/*
+ * Mark a trace of the streaming sink as complete
+ */
+void trace_sink_close(int stream)
+{
+	if (stream < 0 || sink_fd < 0)
+		return;
+	struct trace_message message = {TRACE_MSG_CLOSE, stream, 0, 0, 0, 0};
+	sink_send(&message, NULL);
+}
@@ -0,0 +1,102 @@
+#ifndef _TRACE_UTILS_H
+#define _TRACE_UTILS_H
+
+#include <inttypes.h>
+#include <stdio.h>
+#include <string.h>
+
+// Binary fixed-record trace format.
+//
+// A binary trace is a struct trace_header followed by fixed-size records of
+// n_columns 8-byte values. Values are written in the native (little-endian on
+// x86) byte order, so the analysis side can memory-map the records directly.
+// The Python counterpart lives in util/trace_utils.py.
+
+#define TRACE_MAGIC "GPUZTRC"
+#define TRACE_VERSION 1
+#define TRACE_MAX_COLUMNS 8
+
+// Source of the samples in a trace
+enum trace_backend
+{
+	TRACE_IMC_LEGACY = 0, // Intel IMC perf events (Skylake and older)
+	TRACE_IMC_ALDER = 1,  // Intel IMC perf events (Alder Lake)
+	TRACE_IMC_AMD = 2,	  // AMD data fabric MSRs
+	TRACE_GPU_INTEL = 3,  // Intel iGPU frequency and rcs0-busy
+	TRACE_GPU_AMD = 4,	  // AMD iGPU frequency
+	TRACE_GPU_NVIDIA = 5, // NVIDIA dGPU frequency and utilization
+	TRACE_MEM = 6,		  // Memory utilization of the texture program
+};
+
+// Column types: 'f' for double, 'i' for int64_t
+struct trace_column
+{
+	char name[15];
+	char type;
+};
+
+struct trace_header
+{
+	char magic[8];
+	uint32_t version;
+	uint32_t backend;
+	uint32_t n_columns;
+	uint32_t record_size;
+	struct trace_column columns[TRACE_MAX_COLUMNS];
+};
+
+union trace_value
+{
+	double f;
+	int64_t i;
+};
+
+// Write the header of a binary trace. Return 0 on success.
+int trace_write_header(FILE *file, uint32_t backend, uint32_t n_columns, const struct trace_column *columns);
+
+// Append one record of n_columns values to a binary trace
+static inline void trace_write_record(FILE *file, const union trace_value *record, uint32_t n_columns)
+{
+	fwrite(record, sizeof(union trace_value), n_columns, file);
+}
+
+// Streaming sink.
+//
+// Records can also be sent, as they are sampled, to a Unix domain socket or
+// a FIFO. The stream is a sequence of struct trace_message, each followed by
+// length bytes of payload:
+//   TRACE_MSG_OPEN    the struct trace_header of a new trace
+//   TRACE_MSG_RECORD  one or more records of that trace
+//   TRACE_MSG_CLOSE   no payload, the trace is complete
+// The Python consumer lives in util/trace_consumer.py.
+
+enum trace_message_type
+{
+	TRACE_MSG_OPEN = 1,
+	TRACE_MSG_RECORD = 2,
+	TRACE_MSG_CLOSE = 3,
+};
+
+struct trace_message
+{
+	uint32_t type;
+	uint32_t stream; // Identifies the trace, unique per sink
+	uint32_t length; // Payload bytes after this message
+	int32_t run;	 // Driver run index (rept_index)
+	int32_t selector;
+	uint32_t reserved;
+};
+
+// Connect to the Unix domain socket, or open the FIFO, at path. Return 0 on success.
+int trace_sink_open(const char *path);
+
+// Announce a new trace on the sink. Return its stream id, or -1 without a sink.
+int trace_sink_stream(uint32_t backend, uint32_t n_columns, const struct trace_column *columns, int run, int selector);
+
+// Send one record of a stream (no-op for stream -1)
+void trace_sink_record(int stream, const union trace_value *record, uint32_t n_columns);
+
+// Mark a stream as complete (no-op for stream -1)
+void trace_sink_close(int stream);
+
+#endif
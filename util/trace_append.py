@@ -0,0 +1,89 @@
+import os
+import time
+import argparse
+
+import numpy as np
+
+import metadata_utils
+
+# Append synthetic driver and texture traces to files, at the pace of a real
+# experiment, to exercise the --follow mode of the analysers without the
+# hardware.
+#
+# Runs one pattern after the other like driver.c does with input.txt: run r
+# writes out_dir/{imc,mem,gpu}_<r>_<r>.out and time_dir/time_<workload>_<size>_<pattern>_<layer>.txt.
+# Black (0) and gradient (100) textures compress, so they read less DRAM.
+#
+# Usage: python trace_append.py out time --patterns 0,1 --duration 20
+
+SAMPLE_PERIOD = 0.001   # seconds between IMC samples (TIME_IMC in driver.c)
+FRAME_TIME = 0.016      # seconds per frame at layer 1
+TICK = 0.1              # seconds of trace appended per write
+
+
+def run(out_dir, time_dir, index, pattern, args, rng):
+    tsc_hz = args.cpu_freq * 1e9
+    imc_fn = os.path.join(out_dir, "imc_%d_%06d.out" % (index, index))
+    mem_fn = os.path.join(out_dir, "mem_%d_%06d.out" % (index, index))
+    gpu_fn = os.path.join(out_dir, "gpu_%d_%06d.out" % (index, index))
+    time_fn = os.path.join(time_dir, "time_%d_%d_%.1f_%d.txt" % (args.workload, args.size, pattern, args.layer))
+    compressible = pattern in (0, 100)
+    # MiB read per sample
+    rate = (0.3 if compressible else 0.8) * args.layer ** 0.5
+
+    now = int(time.time() * tsc_hz)
+    next_frame = now
+    with open(imc_fn, "w") as imc, open(mem_fn, "w") as mem, open(gpu_fn, "w") as gpu, open(time_fn, "w") as frames:
+        for _ in range(int(args.duration / TICK)):
+            end = now + int(TICK * tsc_hz)
+
+            stamps = np.arange(now, end, int(SAMPLE_PERIOD * tsc_hz))
+            read = np.abs(rng.normal(rate, rate / 10, len(stamps)))
+            if args.imc_columns == 3:
+                write = np.abs(rng.normal(rate / 4, rate / 40, len(stamps)))
+                imc.writelines("%.15f, %.15f, %d\n" % line for line in zip(read, write, stamps))
+            else:
+                imc.writelines("%.15f, %d\n" % line for line in zip(read, stamps))
+
+            while next_frame < end:
+                frame = FRAME_TIME * args.layer ** 0.5 * (1.2 if not compressible else 1.0) * rng.uniform(0.9, 1.1)
+                frames.write(" %d \n %d \n" % (next_frame, next_frame + int(frame * tsc_hz)))
+                next_frame += int((frame + 0.001) * tsc_hz)
+
+            mem.write("%d, %d, %d, %d\n" % (100000, 120000, 500000, 520000))
+            gpu.write("%d, %d, %d \n" % (1200, 90, end))
+            for f in (imc, mem, gpu, frames):
+                f.flush()
+            now = end
+            time.sleep(TICK / args.speed)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Append synthetic traces to files, like a running experiment')
+    parser.add_argument('out_dir', help='Directory for the driver traces (imc_*, mem_*, gpu_*)')
+    parser.add_argument('time_dir', help='Directory for the time_* traces')
+    parser.add_argument('--patterns', default='0,1', help='Comma-separated texture patterns, one run each (default: %(default)s)')
+    parser.add_argument('--layer', type=int, default=20, help='Workload complexity (default: %(default)s)')
+    parser.add_argument('--size', type=int, default=3000, help='Texture size (default: %(default)s)')
+    parser.add_argument('--workload', type=int, default=0, help='0 read-only, 1 write-only (default: %(default)s)')
+    parser.add_argument('--duration', type=float, default=20, help='Seconds of trace per run (default: %(default)s)')
+    parser.add_argument('--speed', type=float, default=1, help='Trace seconds written per wall-clock second (default: %(default)s)')
+    parser.add_argument('--imc-columns', type=int, default=2, choices=[2, 3],
+                        help='2 for combined read/write (exp1), 3 for separate read and write (exp2)')
+    parser.add_argument('--first-run', type=int, default=0, help='Index of the first run (default: %(default)s)')
+    parser.add_argument('--seed', type=int, default=0)
+    metadata_utils.add_arguments(parser)
+    args = parser.parse_args()
+    # The frequency the analysers will assume for these traces
+    args.cpu_freq = metadata_utils.resolve(args, args.out_dir, args.time_dir)['tsc_hz'] / 1e9
+
+    os.makedirs(args.out_dir, exist_ok=True)
+    os.makedirs(args.time_dir, exist_ok=True)
+    rng = np.random.default_rng(args.seed)
+    for offset, pattern in enumerate(float(p) for p in args.patterns.split(',')):
+        print("run %d: pattern %.1f" % (args.first_run + offset, pattern))
+        run(args.out_dir, args.time_dir, args.first_run + offset, pattern, args, rng)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,195 @@
+import os
+import sys
+import json
+import argparse
+import tempfile
+import subprocess
+
+import numpy as np
+
+import trace_gen
+
+# Benchmark of the analysis scripts on synthetic data (see trace_gen.py).
+#
+# For every size, generates (once, then reuses) a data directory of each
+# layout the scripts read with that many samples: IMC samples of driver runs
+# for exp1 and exp2, frames of stressor.sh runs for stressor.py, and LLC
+# walks of llc.sh for plot_llc_size.py. It runs each script on its data as
+# users do, in a fresh process with --profile (see profile_utils.py) and
+# without the cache. The stages are the ones the scripts mark themselves
+# (catalog, parse, group, their report and plot functions, ...), and the
+# stages nested one level down (e.g. plot_single/filter, plot_single/stats).
+# For each stage it records the wall and CPU time, the throughput (samples
+# per second) and the peak memory allocated during the stage (tracemalloc:
+# Python objects and NumPy arrays). The "run" row is the whole script, with
+# the peak RSS of its process. The results are compared to a stored baseline.
+#
+# The baseline depends on the machine, so it is not kept in the repository:
+# store one with --save-baseline before the change to measure, then run
+# again without it to compare.
+#
+# Usage: python trace_bench.py [--sizes 10k,100k] [--save-baseline]
+
+REPO_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+CPU_FREQ = 2.0  # GHz, TSC frequency of the generated traces
+# Script, where it writes its --profile report (relative to its working directory),
+# the layout of its data (see LAYOUTS), and its arguments besides the data directories
+SCRIPTS = {
+    'exp1': (os.path.join(REPO_DIR, "01-leakage-channel/scripts/exp1/exp1.py"), "profile.json", 'driver', ['--cpu-freq', str(CPU_FREQ)]),
+    'exp2': (os.path.join(REPO_DIR, "01-leakage-channel/scripts/exp2/exp2.py"), "plot/profile.json", 'driver', ['--cpu-freq', str(CPU_FREQ)]),
+    'stressor': (os.path.join(REPO_DIR, "02-memory-stressor/stressor.py"), "plot/profile.json", 'stressor', ['--cpu-freq', str(CPU_FREQ)]),
+    'llc': (os.path.join(REPO_DIR, "03-llc/scripts/plot_llc_size.py"), "plot/profile.json", 'llc', []),
+}
+# Data layout (see trace_gen.py) -> the directories the scripts take, relative to the data directory
+LAYOUTS = {'driver': ["out", "time"], 'stressor': ["."], 'llc': ["."]}
+# Bump when trace_gen.py changes its output (invalidates generated data)
+DATA_VERSION = 2
+DEFAULT_DATA_DIR = os.path.join(tempfile.gettempdir(), "gpu-zip-bench")
+DEFAULT_BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "trace_bench_baseline.json")
+MIN_WALL = 0.05  # seconds, shorter stages are too noisy to flag
+
+
+def parse_size(spec):
+    """Turn "10k" or "1M" into a number of samples (usable as an argparse type)"""
+    units = {'k': 1000, 'M': 1000000}
+    try:
+        if spec and spec[-1] in units:
+            return int(float(spec[:-1]) * units[spec[-1]])
+        return int(spec)
+    except ValueError:
+        raise argparse.ArgumentTypeError("bad size '%s' (expected e.g. 10000, 10k or 1M)" % spec)
+
+
+def format_size(samples):
+    for unit, factor in (('M', 1000000), ('k', 1000)):
+        if samples >= factor and samples % factor == 0:
+            return "%d%s" % (samples // factor, unit)
+    return str(samples)
+
+
+def data_dir(root, layout, samples):
+    """Data directory of a layout with samples samples, generated if missing"""
+    path = os.path.join(root, "v%d-%s-%s" % (DATA_VERSION, layout, format_size(samples)))
+    if not os.path.isdir(path):
+        os.makedirs(root, exist_ok=True)
+        tmp = tempfile.mkdtemp(dir=root, suffix=".tmp")
+        parser = argparse.ArgumentParser()
+        trace_gen.add_arguments(parser)
+        gen_args = parser.parse_args(['--samples', str(samples), '--cpu-freq', str(CPU_FREQ)])
+        print("Generating %s samples in %s" % (format_size(samples), path), file=sys.stderr)
+        if layout == 'stressor':
+            trace_gen.generate_stressor(tmp, gen_args)
+        elif layout == 'llc':
+            trace_gen.generate_llc(tmp, gen_args)
+        else:
+            trace_gen.generate(os.path.join(tmp, "out"), os.path.join(tmp, "time"), gen_args)
+        os.rename(tmp, path)
+    return path
+
+
+def stage_results(profile):
+    """Wall time, CPU time and peak memory (MB) of the stages of a profile_utils report, and of the run
+
+    Stages nested in a top-level stage are named "<top-level stage>/<stage>".
+    """
+    results = {}
+    parent = None
+    for record in profile['stages']:
+        # Records are listed as the stages start, a nested stage follows its top-level stage
+        if record['depth'] == 0:
+            parent = record['stage']
+        if record['depth'] > 1 or 'wall' not in record:
+            continue
+        name = record['stage'] if record['depth'] == 0 else "%s/%s" % (parent, record['stage'])
+        # Stages run more than once (e.g. a plot per workload, a filter per file) add up
+        result = results.setdefault(name, {'wall': 0.0, 'cpu': 0.0, 'peak_mb': 0.0})
+        result['wall'] += record['wall']
+        result['cpu'] += record['cpu']
+        result['peak_mb'] = max(result['peak_mb'], record['peak_kib'] / 1024)
+    results['run'] = {'wall': profile['wall'], 'cpu': profile['cpu'], 'peak_mb': profile['peak_rss_kib'] / 1024}
+    return results
+
+
+def run_script(script, path):
+    """Run one script on its data directory, return the results of its stages"""
+    script_path, profile_path, layout, arguments = SCRIPTS[script]
+    data = [os.path.join(path, name) for name in LAYOUTS[layout]]
+    with tempfile.TemporaryDirectory() as cwd:
+        # The plots go to the scratch directory, the reports to /dev/null
+        env = dict(os.environ, MPLBACKEND="Agg")
+        subprocess.run([sys.executable, script_path] + data + ['--no-cache', '--profile'] + arguments,
+                       cwd=cwd, env=env, stdout=subprocess.DEVNULL, check=True)
+        with open(os.path.join(cwd, profile_path)) as f:
+            return stage_results(json.load(f))
+
+
+def compare(results, baseline, tolerance):
+    """Print the results next to the baseline, return the number of regressions"""
+    regressions = 0
+    print("%-8s %6s %-26s %10s %10s %14s %10s  %s" % ("script", "size", "stage", "wall (s)", "cpu (s)", "samples/s", "peak (MB)", "vs baseline"))
+    for script, sizes in results.items():
+        for size, stages in sizes.items():
+            samples = parse_size(size)
+            for stage, result in stages.items():
+                note = ""
+                base = baseline.get(script, {}).get(size, {}).get(stage)
+                if base:
+                    ratio = result['wall'] / base['wall'] if base['wall'] else np.nan
+                    note = "%+.0f%% time, %+.1f MB" % (100 * (ratio - 1), result['peak_mb'] - base['peak_mb'])
+                    if ratio > tolerance and result['wall'] > MIN_WALL:
+                        note += "  SLOWER"
+                        regressions += 1
+                print("%-8s %6s %-26s %10.3f %10.3f %14.0f %10.1f  %s" % (
+                    script, size, stage, result['wall'], result['cpu'], samples / result['wall'] if result['wall'] else np.inf,
+                    result['peak_mb'], note))
+    print("\npeak: memory allocated during the stage (tracemalloc), peak RSS of the process for \"run\"")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the analysis scripts on synthetic traces')
+    parser.add_argument('--sizes', type=lambda spec: [parse_size(size) for size in spec.split(',')], default='10k,100k,1M,10M',
+                        help='Total samples of each benchmark: IMC samples, frames (stressor) or walks (llc) (default: %(default)s)')
+    parser.add_argument('--scripts', type=lambda spec: spec.split(','), default=','.join(SCRIPTS),
+                        help='Scripts to benchmark (default: %(default)s)')
+    parser.add_argument('--data-dir', default=DEFAULT_DATA_DIR, help='Where the generated data is kept (default: %(default)s)')
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE, help='Baseline results (default: %(default)s)')
+    parser.add_argument('--save-baseline', action='store_true', help='Store the results as the new baseline')
+    parser.add_argument('--output', help='Also write the results to this JSON file')
+    parser.add_argument('--tolerance', type=float, default=1.25,
+                        help='Flag stages slower than TOLERANCE times the baseline (default: %(default)s)')
+    args = parser.parse_args()
+
+    unknown = set(args.scripts) - set(SCRIPTS)
+    if unknown:
+        parser.error("unknown script(s) %s (choose from %s)" % (", ".join(sorted(unknown)), ", ".join(SCRIPTS)))
+
+    results = {}
+    for samples in args.sizes:
+        for script in args.scripts:
+            path = data_dir(args.data_dir, SCRIPTS[script][2], samples)
+            results.setdefault(script, {})[format_size(samples)] = run_script(script, path)
+
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+    regressions = compare(results, baseline, args.tolerance)
+    if not baseline:
+        print("\nNo baseline in %s, store one with --save-baseline" % args.baseline)
+    elif regressions:
+        print("\n%d stage(s) more than %.0f%% slower than the baseline" % (regressions, 100 * (args.tolerance - 1)))
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+    if args.save_baseline:
+        # Keep the baseline of sizes and scripts that were not run this time
+        for script, sizes in results.items():
+            baseline.setdefault(script, {}).update(sizes)
+        with open(args.baseline, 'w') as f:
+            json.dump(baseline, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
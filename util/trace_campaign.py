@@ -0,0 +1,267 @@
+import os
+import sys
+import json
+import time
+import shlex
+import shutil
+import signal
+import argparse
+import tempfile
+import subprocess
+
+import catalog_utils
+import metadata_utils
+
+# Resumable measurement campaigns.
+#
+# exp1.sh, exp2.sh, stressor.sh and llc.sh start from an empty directory and
+# run their whole sweep in one go, so a crash or a reboot hours into it loses
+# everything. This runner reads the sweep from a JSON spec (the *.json next to
+# those scripts) and runs it one configuration at a time:
+#   - a run is staged in CAMPAIGN/.staging and renamed to CAMPAIGN/runs/<id>
+#     once it completed, so every run directory is complete,
+#   - CAMPAIGN/manifest.json lists the completed runs (replaced atomically
+#     after each one), and a restart skips them,
+#   - at the end every repetition is linked into CAMPAIGN/rep<r> in the
+#     layout the shell script produces, for the analysers.
+#
+# Spec keys, by kind (lists may be written "1000..2700..50" as in bash):
+#   driver    exp1/exp2: driver, gpu, imc, samples, binary, texture, frames,
+#             workloads, sizes, layers, patterns
+#   stressor  02-memory-stressor: texture, stress (commands, {stressors} is
+#             replaced), warmup, stressors (up to the core count), workload,
+#             frames, sizes, layers, patterns
+#   llc       03-llc: texture, samples, pause, sizes, patterns
+# and repetitions (default 1). Commands and paths are relative to the spec;
+# util/trace_fake.py can stand in for the driver and texture binaries.
+#
+# Usage (as root, from scripts/exp2): python3 ../../../util/trace_campaign.py exp2.json ../../data/exp2-campaign
+
+MANIFEST_FILE = "manifest.json"
+KINDS = ("driver", "stressor", "llc")
+
+
+def parse_values(value):
+    """A spec list: a list, a bash-like range "first..last[..step]" or a single value"""
+    if isinstance(value, list):
+        return value
+    if isinstance(value, str) and ".." in value:
+        bounds = [int(bound) for bound in value.split("..")]
+        return list(range(bounds[0], bounds[1] + 1, bounds[2] if len(bounds) > 2 else 1))
+    return [value]
+
+
+def resolve_command(command, base):
+    """Split a command of the spec, with its relative paths made relative to base"""
+    return [os.path.normpath(os.path.join(base, arg)) if arg.startswith(".") or "/" in arg else arg
+            for arg in shlex.split(command)]
+
+
+def load_spec(fn):
+    with open(fn) as f:
+        spec = json.load(f)
+    if spec.get("kind") not in KINDS:
+        raise ValueError("%s: kind must be one of %s" % (fn, ", ".join(KINDS)))
+    return spec
+
+
+def configurations(spec):
+    """(id, parameters) of every run of the campaign, repetition by repetition"""
+    runs = []
+    kind = spec["kind"]
+    for rep in range(spec.get("repetitions", 1)):
+        if kind == "driver":
+            for workload in parse_values(spec["workloads"]):
+                for size in parse_values(spec["sizes"]):
+                    for layer in parse_values(spec["layers"]):
+                        for pattern in parse_values(spec["patterns"]):
+                            runs.append(("w%d-s%d-l%d-p%g-r%d" % (workload, size, layer, pattern, rep),
+                                         {'rep': rep, 'workload': workload, 'size': size, 'layer': layer, 'pattern': pattern}))
+        elif kind == "stressor":
+            # At most one stressor per core, as in stressor.sh
+            for stressors in [n for n in parse_values(spec["stressors"]) if n <= os.cpu_count()]:
+                runs.append(("n%d-r%d" % (stressors, rep), {'rep': rep, 'stressors': stressors}))
+        else:
+            for size in parse_values(spec["sizes"]):
+                for pattern in parse_values(spec["patterns"]):
+                    runs.append(("s%d-p%g-r%d" % (size, pattern, rep), {'rep': rep, 'size': size, 'pattern': pattern}))
+    return runs
+
+
+def run_driver(spec, params, stage, base):
+    """One driver run of one texture (exp1.sh/exp2.sh)"""
+    texture = resolve_command(spec["texture"], base)
+    with open(os.path.join(stage, "input.txt"), "w") as f:
+        f.write(" ".join(texture + ["%.1f" % params['pattern'], str(params['layer']), str(params['size']),
+                                    str(params['workload']), str(spec.get("frames", 10000000))]) + "\n")
+    os.makedirs(os.path.join(stage, "out"))
+    subprocess.run(resolve_command(spec["driver"], base) + [str(spec.get("gpu", 1)), str(spec.get("imc", 1)),
+                                                           str(spec["samples"]), "1", str(spec.get("binary", 0))],
+                   cwd=stage, check=True)
+    # What metadata_utils.py adds in the shell scripts
+    metadata_utils.complete(os.path.join(stage, "out"), metadata_utils.cached_probe())
+
+
+def run_stressor(spec, params, stage, base):
+    """The textures of stressor.sh under one number of memory stressors"""
+    stressors = [subprocess.Popen(resolve_command(command.format(stressors=params['stressors']), base), start_new_session=True)
+                 for command in spec.get("stress", [])]
+    try:
+        time.sleep(spec.get("warmup", 30))
+        for pattern in parse_values(spec["patterns"]):
+            for size in parse_values(spec["sizes"]):
+                for layer in parse_values(spec["layers"]):
+                    subprocess.run(resolve_command(spec["texture"], base) + ["%.1f" % pattern, str(layer), str(size),
+                                                                            str(spec.get("workload", 1)), str(spec.get("frames", 10000))],
+                                   cwd=stage, check=True)
+    finally:
+        # stress-ng and the NVIDIA stress script start workers of their own
+        for process in stressors:
+            os.killpg(process.pid, signal.SIGTERM)
+            process.wait()
+
+
+def run_llc(spec, params, stage, base):
+    """One LLC walk measurement of llc.sh"""
+    subprocess.run(resolve_command(spec["texture"], base) + ["%.1f" % params['pattern'], str(spec.get("samples", 2000)),
+                                                            str(params['size']), "w%d_%d.txt" % (params['pattern'], params['size'])],
+                   cwd=stage, check=True)
+    time.sleep(spec.get("pause", 20))
+
+
+RUNNERS = {"driver": run_driver, "stressor": run_stressor, "llc": run_llc}
+
+
+def _write(path, data):
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w") as f:
+            json.dump(data, f, indent=2)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+
+
+def load_manifest(campaign_dir, spec):
+    path = os.path.join(campaign_dir, MANIFEST_FILE)
+    if not os.path.exists(path):
+        return {'spec': spec, 'runs': {}}
+    with open(path) as f:
+        manifest = json.load(f)
+    if manifest['spec'] != spec:
+        print("Warning: The spec changed since the campaign started, runs that are still listed are kept", file=sys.stderr)
+        manifest['spec'] = spec
+    return manifest
+
+
+def run_campaign(spec, base, campaign_dir, dry_run=False):
+    """Run every configuration the manifest does not list yet, returns the number of runs done"""
+    runs_dir = os.path.join(campaign_dir, "runs")
+    stage = os.path.join(campaign_dir, ".staging")
+    os.makedirs(runs_dir, exist_ok=True)
+    manifest = load_manifest(campaign_dir, spec)
+    configs = configurations(spec)
+    done = 0
+    for index, (run_id, params) in enumerate(configs):
+        target = os.path.join(runs_dir, run_id)
+        if run_id in manifest['runs']:
+            continue
+        if os.path.isdir(target):
+            # Renamed, but the manifest was not updated before the interruption
+            manifest['runs'][run_id] = {'params': params, 'seconds': None}
+            _write(os.path.join(campaign_dir, MANIFEST_FILE), manifest)
+            continue
+        print("[%d/%d] %s" % (index + 1, len(configs), run_id))
+        if dry_run:
+            continue
+        # Leftovers of an interrupted run
+        shutil.rmtree(stage, ignore_errors=True)
+        os.makedirs(stage)
+        start = time.time()
+        RUNNERS[spec["kind"]](spec, params, stage, base)
+        os.rename(stage, target)
+        manifest['runs'][run_id] = {'params': params, 'seconds': round(time.time() - start, 3)}
+        _write(os.path.join(campaign_dir, MANIFEST_FILE), manifest)
+        done += 1
+    return done
+
+
+def _link(src, dst):
+    try:
+        os.link(src, dst)
+    except OSError:
+        shutil.copy2(src, dst)
+
+
+def collect(spec, campaign_dir):
+    """Link the completed runs of every repetition into CAMPAIGN/rep<r>, as the shell script lays them out"""
+    by_rep = {}
+    now = time.time_ns()
+    for run_id, params in configurations(spec):
+        if os.path.isdir(os.path.join(campaign_dir, "runs", run_id)):
+            by_rep.setdefault(params['rep'], []).append((run_id, params))
+    for rep, runs in sorted(by_rep.items()):
+        rep_dir = os.path.join(campaign_dir, "rep%d" % rep)
+        shutil.rmtree(rep_dir, ignore_errors=True)
+        for index, (run_id, params) in enumerate(runs):
+            run_dir = os.path.join(campaign_dir, "runs", run_id)
+            if spec["kind"] == "driver":
+                # One driver invocation over every texture: selector and run index both count the runs,
+                # and the time files follow the run order in modification time
+                for sub in ("out", "time"):
+                    os.makedirs(os.path.join(rep_dir, sub), exist_ok=True)
+                for name in sorted(os.listdir(os.path.join(run_dir, "out"))):
+                    match = catalog_utils.TRACE_RE.match(name)
+                    if match:
+                        kind, _, _, ext = match.groups()
+                        _link(os.path.join(run_dir, "out", name), os.path.join(rep_dir, "out", "%s_%d_%06d.%s" % (kind, index, index, ext)))
+                    elif name == metadata_utils.METADATA_FILE and index == 0:
+                        shutil.copy2(os.path.join(run_dir, "out", name), os.path.join(rep_dir, "out", name))
+                for name in os.listdir(run_dir):
+                    if catalog_utils.TIME_RE.match(name):
+                        dst = os.path.join(rep_dir, "time", name)
+                        _link(os.path.join(run_dir, name), dst)
+                        os.utime(dst, ns=(now + index * 1000000, now + index * 1000000))
+            elif spec["kind"] == "stressor":
+                out_dir = os.path.join(rep_dir, "time", "out-%d" % params['stressors'])
+                os.makedirs(out_dir)
+                for name in os.listdir(run_dir):
+                    if catalog_utils.TIME_RE.match(name):
+                        _link(os.path.join(run_dir, name), os.path.join(out_dir, name))
+            else:
+                os.makedirs(os.path.join(rep_dir, "data"), exist_ok=True)
+                for name in os.listdir(run_dir):
+                    _link(os.path.join(run_dir, name), os.path.join(rep_dir, "data", name))
+        if spec["kind"] == "stressor":
+            metadata_utils.complete(os.path.join(rep_dir, "time"), metadata_utils.cached_probe(), [
+                ('max_stressors', max(params['stressors'] for _, params in runs)), ('samples', spec.get("frames", 10000)),
+                ('layers', parse_values(spec["layers"])[0]), ('warmup_s', spec.get("warmup", 30))])
+        print("%s: %d runs" % (rep_dir, len(runs)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Run a measurement sweep resumably, one configuration at a time')
+    parser.add_argument('spec', help='Sweep spec (JSON)')
+    parser.add_argument('campaign_dir', help='Campaign directory, resumed if it exists')
+    parser.add_argument('--dry-run', action='store_true', help='List the runs still to do and stop')
+    parser.add_argument('--no-collect', action='store_true', help='Do not link the runs into the per-repetition layout')
+    args = parser.parse_args()
+
+    try:
+        spec = load_spec(args.spec)
+    except (OSError, ValueError, KeyError) as e:
+        parser.error(str(e))
+    base = os.path.dirname(os.path.abspath(args.spec))
+    done = run_campaign(spec, base, args.campaign_dir, args.dry_run)
+    if args.dry_run:
+        return
+    print("%d runs done, %d in total" % (done, len(configurations(spec))))
+    if not args.no_collect:
+        collect(spec, args.campaign_dir)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,266 @@
+import os
+import re
+import time
+import asyncio
+import argparse
+import collections
+
+import numpy as np
+
+import follow_utils
+import frame_utils
+import metadata_utils
+import stats_utils
+import trace_utils
+
+# Live statistics from the streaming sink of the driver.
+#
+# driver.c <gpu> <imc> <samples> <outer> <binary> <sink> sends every sample
+# to a Unix domain socket or a FIFO as it is taken (see the streaming sink in
+# util/trace-utils.h). This consumer decodes the messages and keeps, per run:
+#   - per-frame traffic and render time, using the time_* trace texture
+#     writes into --time-dir, with the same state machine as exp1/exp2,
+#   - the bandwidth over the last --window seconds,
+#   - the GPU frequency over the last --window seconds and since the start,
+# and prints them every --interval seconds. With --persist, the records are
+# also appended to binary traces that every analysis script can load.
+#
+# Usage: python trace_consumer.py --socket /tmp/gpuzip.sock --time-dir time
+#        ../01-leakage-channel/driver 1 2 100000 1 0 /tmp/gpuzip.sock
+
+TIME_RE = re.compile(r'^time_\d+_\d+_-?[\d.]+_\d+\.txt$')
+
+# File name prefix of the traces of each backend, as written by driver.c
+TRACE_KINDS = {'imc_legacy': 'imc', 'imc_alder': 'imc', 'imc_amd': 'imc', 'mem': 'mem',
+               'gpu_intel': 'gpu', 'gpu_amd': 'gpu', 'gpu_nvidia': 'nvidia_gpu'}
+
+
+class Trace:
+    """One stream of the sink: its header, its latest records and its statistics"""
+
+    def __init__(self, run, selector, header, args, cpu_freq):
+        self.run = run
+        self.selector = selector
+        self.backend, self.columns = trace_utils.parse_header(header, "stream of run %d" % run)
+        self.kind = TRACE_KINDS[self.backend]
+        self.dtype = np.dtype([(name, trace_utils.TRACE_TYPES[kind]) for name, kind in self.columns])
+        self.opened = time.time_ns()
+        self.cpu_freq = cpu_freq
+        self.window = int(args.window * cpu_freq * 1e9)
+        self.rest = b''
+        # Samples of the last window as (timestamps, values) chunks
+        self.recent = collections.deque()
+        self.overall = stats_utils.RunningStats()
+        self.follower = follow_utils.RunFollower(None, None, cpu_freq) if self.kind == 'imc' else None
+        self.traffic = stats_utils.RunningStats()
+        self.render_time = stats_utils.RunningStats()
+        self.file = None
+        if args.persist:
+            fn = os.path.join(args.persist, "%s_%d_%06d.bin" % (self.kind, selector, run))
+            self.file = open(fn, 'wb')
+            self.file.write(header)
+
+    def add(self, payload):
+        if self.file is not None:
+            self.file.write(payload)
+        data = self.rest + payload
+        cut = len(data) - len(data) % self.dtype.itemsize
+        self.rest = data[cut:]
+        records = np.frombuffer(data[:cut], dtype=self.dtype)
+        if len(records) == 0 or 'time' not in self.dtype.names:
+            return
+        timestamps = records['time']
+        if self.kind == 'imc':
+            values = np.column_stack([records[name] for name, _ in self.columns[:-1]])
+            self.follower.push(timestamps, values)
+            values = values.sum(axis=1)
+        else:
+            values = records['freq'].astype(np.float64)
+            self.overall.update(values)
+        self.recent.append((timestamps, values))
+        while self.recent and self.recent[0][0][-1] < timestamps[-1] - self.window:
+            self.recent.popleft()
+
+    def window_samples(self):
+        """(timestamps, values) of the samples of the last window"""
+        if not self.recent:
+            return np.zeros(0, dtype=np.int64), np.zeros(0)
+        timestamps = np.concatenate([t for t, _ in self.recent])
+        values = np.concatenate([v for _, v in self.recent])
+        start = int(np.searchsorted(timestamps, timestamps[-1] - self.window, side='left'))
+        return timestamps[start:], values[start:]
+
+    def poll(self, final=False):
+        if self.follower is None or self.follower.time is None:
+            return
+        new = self.follower.poll(final)
+        if new is not None:
+            traffic, render_time = new
+            self.traffic.update(traffic.sum(axis=1))
+            self.render_time.update(render_time)
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+
+class Consumer:
+    """Decode sink connections and report the statistics of their traces"""
+
+    def __init__(self, args):
+        self.args = args
+        self.cpu_freq = None
+        self.traces = {}
+        self.finished = []
+        self.claimed = set()
+
+    def claim_time(self, trace):
+        # The time_* trace texture is writing for this run: modified since the
+        # run started and not followed by another open run
+        try:
+            entries = [entry for entry in os.scandir(self.args.time_dir) if TIME_RE.match(entry.name)]
+        except FileNotFoundError:
+            return
+        candidates = [(entry.stat().st_mtime_ns, entry.path) for entry in entries
+                      if entry.path not in self.claimed and entry.stat().st_mtime_ns >= trace.opened]
+        if candidates:
+            fn = max(candidates)[1]
+            self.claimed.add(fn)
+            trace.time_fn = fn
+            trace.follower.time = trace_utils.TimeTail(fn)
+
+    def refresh(self, trace, final=False):
+        if trace.follower is not None and trace.follower.time is None and self.args.time_dir:
+            self.claim_time(trace)
+        trace.poll(final)
+        if trace.file is not None:
+            trace.file.flush()
+
+    def report(self):
+        for trace in self.traces.values():
+            self.refresh(trace)
+        lines = []
+        for trace in self.finished + list(self.traces.values()):
+            timestamps, values = trace.window_samples()
+            name = "run %d selector %d %s" % (trace.run, trace.selector, trace.kind)
+            if trace.kind == 'imc':
+                seconds = (timestamps[-1] - timestamps[0]) / (trace.cpu_freq * 1e9) if len(timestamps) > 1 else 0
+                bandwidth = values[1:].sum() * frame_utils.MIB_TO_MB / seconds if seconds else np.nan
+                line = "%s: %.1f MB/s over the last %.1f s" % (name, bandwidth, seconds)
+                if trace.follower.time is not None:
+                    line += ", %d frames (%s), traffic %.3f +- %.3f MB, render time %.3f +- %.3f ms" % (
+                        trace.traffic.count, os.path.basename(trace.time_fn),
+                        *trace.traffic.summary(), *trace.render_time.summary())
+                lines.append(line)
+            elif trace.kind in ('gpu', 'nvidia_gpu'):
+                lines.append("%s: %.0f +- %.0f MHz over the last %.1f s, %.0f +- %.0f MHz overall" % (
+                    name, np.mean(values) if len(values) else np.nan, np.std(values) if len(values) else np.nan,
+                    self.args.window, *trace.overall.summary()))
+        print("\n".join(lines) + "\n", flush=True)
+
+    def close(self, key):
+        trace = self.traces.pop(key)
+        self.refresh(trace, final=True)
+        trace.close()
+        if trace.follower is not None and trace.follower.time is not None:
+            self.claimed.discard(trace.time_fn)
+        self.finished.append(trace)
+
+    async def handle(self, reader, connection):
+        size = trace_utils.TRACE_MESSAGE_DTYPE.itemsize
+        while True:
+            try:
+                message = np.frombuffer(await reader.readexactly(size), dtype=trace_utils.TRACE_MESSAGE_DTYPE)[0]
+                payload = await reader.readexactly(int(message['length']))
+            except asyncio.IncompleteReadError:
+                break
+            key = (connection, int(message['stream']))
+            if message['type'] == trace_utils.TRACE_MSG_OPEN:
+                if self.cpu_freq is None:
+                    # metadata.json of the time directory (trace_replay.py writes it before it connects), else the probe
+                    self.cpu_freq = metadata_utils.resolve(self.args, self.args.time_dir)['tsc_hz'] / 1e9
+                self.traces[key] = Trace(int(message['run']), int(message['selector']), payload, self.args, self.cpu_freq)
+            elif message['type'] == trace_utils.TRACE_MSG_RECORD and key in self.traces:
+                self.traces[key].add(payload)
+            elif message['type'] == trace_utils.TRACE_MSG_CLOSE and key in self.traces:
+                self.close(key)
+        # A producer that went away leaves its open traces incomplete
+        for key in [key for key in self.traces if key[0] == connection]:
+            self.close(key)
+
+
+async def serve(args):
+    consumer = Consumer(args)
+    done = asyncio.Event()
+    connections = 0
+
+    async def on_connection(reader, writer):
+        nonlocal connections
+        connections += 1
+        await consumer.handle(reader, connections)
+        if writer is not None:
+            writer.close()
+        if args.once:
+            done.set()
+
+    async def read_fifo():
+        loop = asyncio.get_running_loop()
+        # Every driver that opens the FIFO is a new connection, ended by its EOF
+        while not done.is_set():
+            pipe = await loop.run_in_executor(None, open, args.fifo, 'rb', 0)
+            reader = asyncio.StreamReader()
+            transport, _ = await loop.connect_read_pipe(lambda: asyncio.StreamReaderProtocol(reader), pipe)
+            await on_connection(reader, None)
+            transport.close()
+
+    if args.socket:
+        if os.path.exists(args.socket):
+            os.unlink(args.socket)
+        server = await asyncio.start_unix_server(on_connection, path=args.socket)
+    else:
+        if not os.path.exists(args.fifo):
+            os.mkfifo(args.fifo)
+        task = asyncio.ensure_future(read_fifo())
+
+    try:
+        while not done.is_set():
+            try:
+                await asyncio.wait_for(done.wait(), args.interval)
+            except asyncio.TimeoutError:
+                pass
+            consumer.report()
+    finally:
+        if args.socket:
+            server.close()
+            os.unlink(args.socket)
+        elif not task.done():
+            # Unblock the pending open of the FIFO
+            done.set()
+            os.close(os.open(args.fifo, os.O_WRONLY | os.O_NONBLOCK))
+            await task
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Live statistics from the streaming sink of the driver')
+    sink = parser.add_mutually_exclusive_group(required=True)
+    sink.add_argument('--socket', help='Listen on this Unix domain socket')
+    sink.add_argument('--fifo', help='Read this FIFO, created if needed')
+    parser.add_argument('--time-dir', help='Directory where texture writes the time_* traces, to aggregate frames')
+    parser.add_argument('--persist', metavar='DIR', help='Also append the records to binary traces in DIR')
+    parser.add_argument('--window', type=float, default=1, help='Seconds of the rolling statistics (default: %(default)s)')
+    parser.add_argument('--interval', type=float, default=5, help='Seconds between reports (default: %(default)s)')
+    parser.add_argument('--once', action='store_true', help='Exit when the first producer disconnects')
+    metadata_utils.add_arguments(parser)
+    args = parser.parse_args()
+
+    if args.persist:
+        os.makedirs(args.persist, exist_ok=True)
+    try:
+        asyncio.run(serve(args))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+import os
+import glob
+import argparse
+
+import numpy as np
+
+import trace_utils
+
+# Convert driver traces (imc_*, mem_*, gpu_*, nvidia_gpu_*) between the text
+# format and the binary fixed-record format, so that old data directories can
+# be memory-mapped and binary ones can still be read by hand.
+#
+# Usage: python trace_convert.py {binary,text} <in_dir> <out_dir>
+
+TRACE_PREFIXES = ("imc_", "mem_", "gpu_", "nvidia_gpu_")
+
+# Text layout written by driver.c for every (backend, number of columns)
+TEXT_FORMATS = {
+    ('imc_legacy', 3): ("%.15f, %.15f, %d", "\n"),
+    ('imc_legacy', 2): ("%.15f, %d", "\n"),
+    ('imc_alder', 3): ("%.15f, %.15f, %d", "\n"),
+    ('imc_alder', 2): ("%.15f, %d", "\n"),
+    ('imc_amd', 2): ("%.15f, %d", " \n"),
+    ('mem', 4): ("%d, %d, %d, %d", "\n"),
+    ('gpu_intel', 3): ("%d, %d, %d", " \n"),
+    ('gpu_amd', 2): ("%d, %d", " \n"),
+    ('gpu_nvidia', 3): ("%d, %d, %d", " \n"),
+}
+
+
+def load_records(in_file, imc_backend):
+    """Backend, [(column, type), ...] and one array per column of a text driver trace"""
+    name = os.path.basename(in_file)
+    if name.startswith("imc_"):
+        timestamps, values = trace_utils.load_imc(in_file)
+        if values.shape[1] == 2:
+            columns = [("read", 'f'), ("write", 'f'), ("time", 'i')]
+        else:
+            columns = [("read_write", 'f'), ("time", 'i')]
+        data = [values[:, i] for i in range(values.shape[1])] + [timestamps]
+        backend = imc_backend
+    elif name.startswith("mem_"):
+        records = trace_utils.load_mem(in_file)
+        columns = [(field, 'i') for field in records.dtype.names]
+        data = [records[field] for field in records.dtype.names]
+        backend = 'mem'
+    else:
+        layout = trace_utils.gpu_layout(in_file)
+        records = trace_utils.load_gpu(in_file, layout)
+        columns = [(field, 'i') for field in records.dtype.names]
+        data = [records[field] for field in records.dtype.names]
+        backend = 'gpu_' + layout
+    return backend, columns, data
+
+
+def text_to_binary(in_file, out_file, imc_backend):
+    trace_utils.save_binary(out_file, *load_records(in_file, imc_backend))
+
+
+def binary_to_text(in_file, out_file):
+    backend, columns = trace_utils.read_header(in_file)
+    records = trace_utils.load_binary(in_file)
+    fmt, newline = TEXT_FORMATS[(backend, len(columns))]
+    np.savetxt(out_file, records, fmt=fmt, newline=newline)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Convert driver traces between text and binary formats')
+    parser.add_argument('format', choices=['binary', 'text'], help='Target format')
+    parser.add_argument('in_dir', help='Directory containing driver traces')
+    parser.add_argument('out_dir', help='Directory for the converted traces')
+    parser.add_argument('--imc-backend', default='imc_legacy', choices=['imc_legacy', 'imc_alder', 'imc_amd'],
+                        help='Backend recorded in converted IMC traces (text traces do not carry it)')
+    args = parser.parse_args()
+
+    os.makedirs(args.out_dir, exist_ok=True)
+    files = sorted(f for f in glob.glob(args.in_dir + "/*") if os.path.basename(f).startswith(TRACE_PREFIXES))
+    for in_file in files:
+        stem = os.path.splitext(os.path.basename(in_file))[0]
+        if args.format == 'binary':
+            if trace_utils.is_binary(in_file):
+                continue
+            out_file = os.path.join(args.out_dir, stem + ".bin")
+            text_to_binary(in_file, out_file, args.imc_backend)
+        else:
+            if not trace_utils.is_binary(in_file):
+                continue
+            out_file = os.path.join(args.out_dir, stem + ".out")
+            binary_to_text(in_file, out_file)
+        # Keep the modification time, the analysis scripts pair traces by it
+        stat = os.stat(in_file)
+        os.utime(out_file, (stat.st_atime, stat.st_mtime))
+        print("%s -> %s" % (in_file, out_file))
+
+
+if __name__ == "__main__":
+    main()
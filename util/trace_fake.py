@@ -0,0 +1,72 @@
+import os
+import sys
+import argparse
+
+import numpy as np
+
+import trace_gen
+
+# Stand-ins for the driver and texture binaries, writing synthetic traces.
+#
+# They take the arguments of the real binaries and write the files those
+# would write into the current directory, from the model of trace_gen.py, so
+# the shell-free tooling (trace_campaign.py, trace_sequential.py) can be
+# tried end to end without MSR access or a GPU:
+#   driver <gpu> <imc> <samples> <outer> [binary]   ./out/* for every line of ./input.txt, and its time_*
+#   texture <color> <iter> <size> <read_write> <frames>   ./time_* (01-leakage-channel, 02-memory-stressor)
+#   texture <color> <samples> <size> <filename>      one LLC walk time (ns) per line (03-llc)
+# The time_* traces of the driver runs go to the current directory, as
+# texture would write them. FAKE_SEED seeds the generator.
+#
+# Usage: python trace_fake.py driver 1 1 10000 1
+#        "driver": "python3 ../../../util/trace_fake.py driver" in a trace_campaign.py spec
+
+
+def generator_args(**overrides):
+    """trace_gen.py parameters with their defaults"""
+    parser = argparse.ArgumentParser()
+    trace_gen.add_arguments(parser)
+    args = parser.parse_args([])
+    vars(args).update(overrides)
+    return args
+
+
+def driver(argv, rng):
+    gpu, imc, samples, outer = (int(value) for value in argv[:4])
+    binary = len(argv) > 4 and int(argv[4])
+    args = generator_args(imc_columns=3 if imc == 1 else 2, binary=bool(binary))
+    os.makedirs("out", exist_ok=True)
+    with open("input.txt") as f:
+        commands = [line.split() for line in f if line.strip()]
+    index = 0
+    for _ in range(outer):
+        for command in commands:
+            # [wrapper ...] texture <pattern> <layer> <size> <workload> <print-time>: the texture
+            # arguments are always the last five fields, whatever runs the binary
+            pattern, layer, size, workload, _ = command[-5:]
+            args.size = int(size)
+            trace_gen.run("out", ".", index, int(workload), float(pattern), int(layer), samples, args, rng)
+            index += 1
+    trace_gen.write_metadata("out", samples, args)
+
+
+def texture(argv, rng):
+    if len(argv) == 4:
+        # 03-llc: LLC walks over the texture (see trace_gen.llc_walks)
+        color, samples, size, filename = float(argv[0]), int(argv[1]), int(argv[2]), argv[3]
+        np.savetxt(filename, trace_gen.llc_walks(rng, color, samples, size), fmt="%d")
+        return
+    color, layer, size, workload, n_frames = float(argv[0]), int(argv[1]), int(argv[2]), int(argv[3]), int(argv[4])
+    stamps = trace_gen.texture_frames(rng, color, layer, n_frames, generator_args(size=size))
+    np.savetxt("time_%d_%d_%.1f_%d.txt" % (workload, size, color, layer), stamps, fmt=" %d", newline=" \n")
+
+def main():
+    if len(sys.argv) < 2 or sys.argv[1] not in ("driver", "texture"):
+        sys.exit("usage: %s driver|texture ARGS..." % sys.argv[0])
+    seed = os.environ.get("FAKE_SEED")
+    rng = np.random.default_rng(int(seed) if seed else None)
+    {"driver": driver, "texture": texture}[sys.argv[1]](sys.argv[2:], rng)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,256 @@
+import os
+import json
+import time
+import argparse
+
+import numpy as np
+
+import trace_convert
+import trace_utils
+
+# Generate complete synthetic data directories, in the formats driver.c and
+# texture write, to benchmark and test the analysis scripts without the
+# hardware (trace_append.py instead appends to files at the pace of a live
+# experiment).
+#
+# Runs follow input.txt of exp2.sh: for every workload, layer and pattern one
+# driver run with its imc_*, mem_* and gpu_* traces in out_dir, and one
+# time_<workload>_<size>_<pattern>_<layer>.txt in time_dir. generate_stressor
+# and generate_llc write the layouts of stressor.sh (time_* traces in
+# out-<stressors> directories) and llc.sh (w<pattern>_<size>.txt walk times).
+# The model:
+#   - IMC samples every TIME_IMC with scheduling jitter, GPU samples every
+#     TIME_GPU, memory samples every MEM_PERIOD IMC samples,
+#   - frames at --frame-rate (at layer 1, slower as the layer grows) with a
+#     short gap between frames; compressible textures render faster,
+#   - DRAM traffic per sample is high within frames and low between them,
+#     reduced by --compressibility for compressible patterns (0 and 100),
+#     shifted from reads to writes for the write-only workload (1),
+#   - multiplicative Gaussian --noise on every value, plus rare outliers,
+#   - frames longer by STRESSOR_SLOWDOWN per memory stressor,
+#   - LLC walks proportional to the texture size, slower once the texture
+#     spills out of the LLC, more so for non-compressible textures.
+#
+# Usage: python trace_gen.py out time --samples 1000000
+#        python trace_gen.py data --layout stressor --samples 100000
+
+SAMPLE_PERIOD = 0.001   # seconds between IMC samples (TIME_IMC in driver.c)
+GPU_PERIOD = 0.005      # seconds between GPU samples (TIME_GPU in driver.c)
+MEM_PERIOD = 1000       # IMC samples between memory samples
+FRAME_GAP = 0.0005      # seconds between the end of a frame and the next one
+READ_RATE = 0.8         # MiB per IMC sample within a frame of a non-compressible texture at layer 1
+IDLE_RATE = 0.05        # MiB per IMC sample between frames
+OUTLIER_RATE = 0.001    # fraction of samples replaced by outliers
+STRESSOR_SLOWDOWN = 0.05  # longer frames per memory stressor (02-memory-stressor)
+STRESSOR_TEXTURE = (1, 10)  # workload and layer of the texture runs of stressor.sh
+LLC_BYTES = 12 << 20      # last-level cache size of the LLC model (03-llc)
+WALK_NS_PER_BYTE = 0.01   # walk time of a texture that fits in the LLC
+LLC_SIZES = range(1000, 2701, 50)  # texture sizes of llc.sh
+
+
+def compressible(pattern, size):
+    # Same classification as plot_single in exp2.py
+    return pattern != 1 and (pattern == 0 or size % pattern == 0)
+
+
+def noisy(rng, values, noise):
+    return values * np.abs(rng.normal(1, noise, np.shape(values)))
+
+
+def frames(rng, start, stop, pattern, layer, args):
+    """Interleaved begin and end TSC stamps of the frames rendered between start and stop"""
+    tsc_hz = args.cpu_freq * 1e9
+    duration = layer ** 0.5 / args.frame_rate
+    if compressible(pattern, args.size):
+        duration *= 1 - args.compressibility / 4
+    n_frames = int((stop - start) / tsc_hz / (duration + FRAME_GAP)) + 2
+    render = noisy(rng, np.full(n_frames, duration), args.noise)
+    begin = start + (np.concatenate(([0], np.cumsum(render + FRAME_GAP)[:-1])) * tsc_hz).astype(np.int64)
+    end = begin + (render * tsc_hz).astype(np.int64)
+    keep = end < stop
+    return np.column_stack((begin[keep], end[keep])).ravel()
+
+
+def texture_frames(rng, pattern, layer, n_frames, args):
+    """Interleaved begin and end TSC stamps of n_frames frames, as texture writes them"""
+    tsc_hz = args.cpu_freq * 1e9
+    period = layer ** 0.5 / args.frame_rate + FRAME_GAP
+    start = int(1e18)
+    return frames(rng, start, start + int(1.5 * n_frames * period * tsc_hz), pattern, layer, args)[:2 * n_frames]
+
+
+def llc_walks(rng, pattern, samples, size):
+    """samples LLC walk times (ns) over a size x size texture"""
+    nbytes = size * size * 4
+    walk = nbytes * WALK_NS_PER_BYTE * (1 if nbytes <= LLC_BYTES else 3 if pattern == 1 else 1.5)
+    return noisy(rng, np.full(samples, walk), 0.1)
+
+
+def run(out_dir, time_dir, index, workload, pattern, layer, n_samples, args, rng):
+    """Write the traces of one driver run and its time_* trace"""
+    tsc_hz = args.cpu_freq * 1e9
+    start = int(1e18) + index * int(2 * n_samples * SAMPLE_PERIOD * tsc_hz)
+    period = SAMPLE_PERIOD * tsc_hz
+    # Jitter, and now and then a sample delayed by the scheduler
+    steps = noisy(rng, np.full(n_samples, period), 0.01)
+    steps[rng.random(n_samples) < OUTLIER_RATE] *= 5
+    imc_time = start + np.cumsum(steps).astype(np.int64)
+
+    stamps = frames(rng, imc_time[0], imc_time[-1], pattern, layer, args)
+    begin, end = stamps[0::2], stamps[1::2]
+    frame = np.searchsorted(begin, imc_time, side='right') - 1
+    in_frame = (frame >= 0) & (imc_time < end[np.maximum(frame, 0)]) if len(begin) else np.zeros(n_samples, dtype=bool)
+
+    rate = READ_RATE * layer ** 0.5 * (1 - args.compressibility if compressible(pattern, args.size) else 1)
+    traffic = noisy(rng, np.where(in_frame, rate, IDLE_RATE), args.noise)
+    outliers = rng.random(n_samples) < OUTLIER_RATE
+    traffic[outliers] *= 10
+    read, write = (traffic, traffic / 4) if workload == 0 else (traffic / 4, traffic)
+
+    if args.imc_columns == 3:
+        imc = (args.imc_backend, [("read", 'f'), ("write", 'f'), ("time", 'i')], [read, write, imc_time])
+    else:
+        imc = (args.imc_backend, [("read_write", 'f'), ("time", 'i')], [read + write, imc_time])
+
+    gpu_time = imc_time[::int(GPU_PERIOD / SAMPLE_PERIOD)]
+    freq = np.round(noisy(rng, np.full(len(gpu_time), 1200.0), args.noise / 10)).astype(np.int64)
+    busy = np.clip(np.round(noisy(rng, np.full(len(gpu_time), 90.0), args.noise)), 0, 100).astype(np.int64)
+    if args.gpu == 'amd':
+        gpu = ('gpu_amd', [("freq", 'i'), ("time", 'i')], [freq, gpu_time])
+    elif args.gpu == 'nvidia':
+        gpu = ('gpu_nvidia', [("freq", 'i'), ("util", 'i'), ("time", 'i')], [freq, busy, gpu_time])
+    else:
+        gpu = ('gpu_intel', [("freq", 'i'), ("busy", 'i'), ("time", 'i')], [freq, busy, gpu_time])
+
+    n_mem = (n_samples + MEM_PERIOD - 1) // MEM_PERIOD
+    rss = 100000 + np.cumsum(rng.integers(0, 64, n_mem))
+    mem = ('mem', [(name, 'i') for name in ("rss", "peak_rss", "vm", "peak_vm")], [rss, rss + 20000, rss * 5, rss * 5 + 20000])
+
+    selector = index
+    gpu_kind = "nvidia_gpu" if args.gpu == 'nvidia' else "gpu"
+    for kind, (backend, columns, data) in (("imc", imc), ("mem", mem), (gpu_kind, gpu)):
+        fn = os.path.join(out_dir, "%s_%d_%06d" % (kind, selector, index))
+        if args.binary:
+            trace_utils.save_binary(fn + ".bin", backend, columns, data)
+        else:
+            records = np.empty(len(data[0]), dtype=[(name, trace_utils.TRACE_TYPES[t]) for name, t in columns])
+            for (name, _), values in zip(columns, data):
+                records[name] = values
+            fmt, newline = trace_convert.TEXT_FORMATS[(backend, len(columns))]
+            np.savetxt(fn + ".out", records, fmt=fmt, newline=newline)
+
+    time_fn = os.path.join(time_dir, "time_%d_%d_%.1f_%d.txt" % (workload, args.size, pattern, layer))
+    np.savetxt(time_fn, stamps, fmt=" %d", newline=" \n")
+    return time_fn
+
+
+def write_metadata(out_dir, n_samples, args):
+    """The metadata.json sidecar the driver would write (see metadata_utils.py)"""
+    metadata = {
+        'tsc_hz': args.cpu_freq * 1e9,
+        'tsc_source': "synthetic",
+        'cpu': None,
+        'gpu': {'intel': "Intel iGPU", 'amd': "AMD Radeon iGPU", 'nvidia': "NVIDIA dGPU"}[args.gpu],
+        'sampling': {'imc': 1 if args.imc_columns == 3 else 2, 'imc_backend': args.imc_backend, 'samples': n_samples,
+                     'binary': int(args.binary), 'seed': args.seed},
+    }
+    with open(os.path.join(out_dir, "metadata.json"), 'w') as f:
+        json.dump(metadata, f, indent=2)
+
+
+def generate(out_dir, time_dir, args):
+    """Write one run per (workload, layer, pattern), args.samples IMC samples in total"""
+    os.makedirs(out_dir, exist_ok=True)
+    os.makedirs(time_dir, exist_ok=True)
+    rng = np.random.default_rng(args.seed)
+    runs = [(workload, pattern, layer) for workload in args.workloads for layer in args.layers for pattern in args.patterns]
+    n_samples = max(args.samples // len(runs), 2 * MEM_PERIOD)
+    now = time.time_ns()
+    for index, (workload, pattern, layer) in enumerate(runs):
+        time_fn = run(out_dir, time_dir, index, workload, pattern, layer, n_samples, args, rng)
+        # The analysers pair time files with runs in modification order
+        os.utime(time_fn, ns=(now + index * 1000000, now + index * 1000000))
+    write_metadata(out_dir, n_samples, args)
+    return len(runs) * n_samples
+
+
+def generate_stressor(data_dir, args):
+    """Write the time_* traces of stressor.sh for every number of --stressors and pattern, args.samples frames in total"""
+    rng = np.random.default_rng(args.seed)
+    workload, layer = STRESSOR_TEXTURE
+    n_frames = max(args.samples // (len(args.stressors) * len(args.patterns)), 2)
+    for stressors in args.stressors:
+        run_dir = os.path.join(data_dir, "out-%d" % stressors)
+        os.makedirs(run_dir, exist_ok=True)
+        run_args = argparse.Namespace(**dict(vars(args), frame_rate=args.frame_rate / (1 + STRESSOR_SLOWDOWN * stressors)))
+        for pattern in args.patterns:
+            stamps = texture_frames(rng, pattern, layer, n_frames, run_args)
+            np.savetxt(os.path.join(run_dir, "time_%d_%d_%.1f_%d.txt" % (workload, args.size, pattern, layer)), stamps, fmt=" %d", newline=" \n")
+    return len(args.stressors) * len(args.patterns) * n_frames
+
+
+def generate_llc(data_dir, args):
+    """Write the walk times of llc.sh for every texture size and pattern, args.samples walks in total"""
+    os.makedirs(data_dir, exist_ok=True)
+    rng = np.random.default_rng(args.seed)
+    samples = max(args.samples // (2 * len(LLC_SIZES)), 2)
+    for size in LLC_SIZES:
+        for pattern in (0, 1):
+            np.savetxt(os.path.join(data_dir, "w%d_%d.txt" % (pattern, size)), llc_walks(rng, pattern, samples, size), fmt="%d")
+    return 2 * len(LLC_SIZES) * samples
+
+
+def parse_list(spec, kind=int):
+    return [kind(item) for item in spec.split(',')]
+
+
+def add_arguments(parser):
+    """Add the generator parameters to an argparse parser"""
+    parser.add_argument('--samples', type=int, default=1000000, help='Total IMC samples over all runs (default: %(default)s)')
+    parser.add_argument('--workloads', type=parse_list, default='0,1', help='Workloads, 0 read-only, 1 write-only (default: %(default)s)')
+    parser.add_argument('--layers', type=parse_list, default='1,20', help='Workload complexities (default: %(default)s)')
+    parser.add_argument('--patterns', type=lambda spec: parse_list(spec, float), default='0,1',
+                        help='Texture patterns, one run per workload and layer each (default: %(default)s)')
+    parser.add_argument('--size', type=int, default=3000, help='Texture size (default: %(default)s)')
+    parser.add_argument('--stressors', type=parse_list, default='1,2,4,8',
+                        help='Numbers of memory stressors of the stressor layout (default: %(default)s)')
+    parser.add_argument('--frame-rate', type=float, default=60, help='Frames per second at layer 1 (default: %(default)s)')
+    parser.add_argument('--compressibility', type=float, default=0.6,
+                        help='Fraction of the DRAM traffic saved by compressible patterns (default: %(default)s)')
+    parser.add_argument('--noise', type=float, default=0.1, help='Relative standard deviation of every value (default: %(default)s)')
+    parser.add_argument('--cpu-freq', type=float, default=2.0, help='TSC frequency in GHz (default: %(default)s)')
+    parser.add_argument('--imc-columns', type=int, default=3, choices=[2, 3],
+                        help='3 for separate read and write (exp2), 2 for combined read/write (exp1)')
+    parser.add_argument('--imc-backend', default='imc_legacy', choices=['imc_legacy', 'imc_alder', 'imc_amd'],
+                        help='IMC backend, selects the text layout and the binary header (default: %(default)s)')
+    parser.add_argument('--gpu', default='intel', choices=['intel', 'amd', 'nvidia'], help='GPU trace layout (default: %(default)s)')
+    parser.add_argument('--binary', action='store_true', help='Write binary traces (.bin) instead of text (.out)')
+    parser.add_argument('--seed', type=int, default=0)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Generate synthetic driver and texture traces')
+    parser.add_argument('out_dir', help='Directory for the driver traces (imc_*, mem_*, gpu_*), or the data directory of the other layouts')
+    parser.add_argument('time_dir', nargs='?', help='Directory for the time_* traces (driver layout)')
+    parser.add_argument('--layout', default='driver', choices=['driver', 'stressor', 'llc'],
+                        help='driver runs (exp1, exp2), stressor.sh or llc.sh data (default: %(default)s)')
+    add_arguments(parser)
+    args = parser.parse_args()
+    if args.imc_backend == 'imc_amd' and args.imc_columns == 3:
+        parser.error("the AMD data fabric only reports combined read/write traffic (--imc-columns 2)")
+    if args.layout == 'driver' and args.time_dir is None:
+        parser.error("the driver layout needs a time_dir")
+
+    if args.layout == 'stressor':
+        total = generate_stressor(args.out_dir, args)
+        print("%d frames in %d runs" % (total, len(args.stressors) * len(args.patterns)))
+    elif args.layout == 'llc':
+        total = generate_llc(args.out_dir, args)
+        print("%d LLC walks in %d files" % (total, 2 * len(LLC_SIZES)))
+    else:
+        total = generate(args.out_dir, args.time_dir, args)
+        print("%d IMC samples in %d runs" % (total, len(args.workloads) * len(args.layers) * len(args.patterns)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,142 @@
+import os
+import sys
+import stat
+import time
+import socket
+import argparse
+
+import numpy as np
+
+import catalog_utils
+import metadata_utils
+import trace_convert
+import trace_utils
+
+# Replay recorded runs into the streaming sink, at the pace they were sampled.
+#
+# Sends the driver traces of every run of a data directory to the socket or
+# FIFO a trace_consumer.py listens on, with the messages driver.c sends, and
+# rewrites the time_* trace of the run into --time-out as texture would. The
+# TSC stamps of the records set the pace (--speed scales it), so the streaming
+# analysis can be developed without MSR access or a GPU.
+#
+# Usage: python trace_replay.py out time /tmp/gpuzip.sock --time-out live
+
+# mem_* is sampled once every this many IMC samples (see monitor_imc in driver.c)
+MEM_PERIOD = 1000
+
+# Longest sleep between two sends, in seconds of wall-clock time
+TICK = 0.01
+
+
+def connect(path):
+    """Writable binary file on the Unix domain socket or FIFO at path"""
+    if stat.S_ISFIFO(os.stat(path).st_mode):
+        return open(path, 'wb', 0)
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    sock.connect(path)
+    return sock.makefile('wb', 0)
+
+
+def message(kind, stream, payload=b'', run=0, selector=0):
+    header = np.zeros(1, dtype=trace_utils.TRACE_MESSAGE_DTYPE)
+    header[0] = (kind, stream, len(payload), run, selector, 0)
+    return header.tobytes() + payload
+
+
+def load_trace(fn, imc_backend):
+    """(backend, columns, structured records, their TSC stamps or None) of a driver trace"""
+    if trace_utils.is_binary(fn):
+        backend, columns = trace_utils.read_header(fn)
+        records = np.asarray(trace_utils.load_binary(fn))
+    else:
+        backend, columns, data = trace_convert.load_records(fn, imc_backend)
+        records = np.empty(len(data[0]), dtype=[(name, trace_utils.TRACE_TYPES[kind]) for name, kind in columns])
+        for (name, _), values in zip(columns, data):
+            records[name] = values
+    timestamps = records['time'] if 'time' in records.dtype.names else None
+    return backend, columns, records, timestamps
+
+
+def replay_run(sink, run, streams, args):
+    """Send every trace of one run, interleaved by TSC stamp"""
+    tsc_hz = args.cpu_freq * 1e9
+    traces = []
+    for kind in ('imc', 'mem', 'gpu', 'nvidia_gpu'):
+        if run[kind] is not None:
+            traces.append(load_trace(run[kind], args.imc_backend))
+    imc_time = traces[0][3]
+
+    # One event per record (stream, index) and per frame stamp (-1, index)
+    keys = []
+    for stream, (backend, columns, records, timestamps) in enumerate(traces):
+        sink.write(message(trace_utils.TRACE_MSG_OPEN, streams + stream, trace_utils.encode_header(backend, columns),
+                           run['run'], run['selector']))
+        if timestamps is None:
+            # Stamp mem records with the IMC sample they were taken after
+            timestamps = imc_time[np.minimum(np.arange(len(records)) * MEM_PERIOD, len(imc_time) - 1)]
+        keys.append((timestamps, np.full(len(records), stream), np.arange(len(records))))
+    frames = np.column_stack(trace_utils.load_time(run['time'])).ravel()
+    keys.append((frames, np.full(len(frames), -1), np.arange(len(frames))))
+    stamps, sources, indices = (np.concatenate(column) for column in zip(*keys))
+    order = np.argsort(stamps, kind='stable')
+    stamps, sources, indices = stamps[order], sources[order], indices[order]
+
+    time_fn = os.path.join(args.time_out, os.path.basename(run['time']))
+    start = time.monotonic()
+    with open(time_fn, 'w') as time_file:
+        step = int(TICK * args.speed * tsc_hz)
+        first = 0
+        while first < len(stamps):
+            # Everything sampled within the next tick goes out at once
+            stop = int(np.searchsorted(stamps, stamps[first] + step, side='left'))
+            delay = (stamps[first] - stamps[0]) / tsc_hz / args.speed - (time.monotonic() - start)
+            if delay > 0:
+                time.sleep(delay)
+            batch_sources = sources[first:stop]
+            batch_indices = indices[first:stop]
+            for stream, (_, _, records, _) in enumerate(traces):
+                selected = batch_indices[batch_sources == stream]
+                if len(selected):
+                    sink.write(message(trace_utils.TRACE_MSG_RECORD, streams + stream, records[selected].tobytes()))
+            selected = batch_indices[batch_sources == -1]
+            if len(selected):
+                time_file.writelines(" %d \n" % stamp for stamp in frames[selected])
+                time_file.flush()
+            first = stop
+    for stream in range(len(traces)):
+        sink.write(message(trace_utils.TRACE_MSG_CLOSE, streams + stream))
+    return streams + len(traces)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Replay recorded runs into the streaming sink of trace_consumer.py')
+    parser.add_argument('trace_dir', help='Directory containing the driver traces')
+    parser.add_argument('time_dir', help='Directory containing the time_* traces')
+    parser.add_argument('sink', help='Unix domain socket or FIFO trace_consumer.py listens on')
+    parser.add_argument('--time-out', required=True, help='Directory to rewrite the time_* traces into, progressively')
+    parser.add_argument('--speed', type=float, default=1, help='Trace seconds sent per wall-clock second (default: %(default)s)')
+    parser.add_argument('--imc-backend', default='imc_legacy', choices=['imc_legacy', 'imc_alder', 'imc_amd'],
+                        help='Backend announced for text IMC traces (text traces do not carry it)')
+    catalog_utils.add_arguments(parser)
+    metadata_utils.add_arguments(parser)
+    args = parser.parse_args()
+    metadata = metadata_utils.resolve(args, args.trace_dir, args.time_dir)
+    args.cpu_freq = metadata['tsc_hz'] / 1e9
+
+    runs = [run for run in catalog_utils.query(args.trace_dir, args.time_dir, args.where, args.rebuild_catalog)
+            if run['imc'] is not None and run['time'] is not None]
+    if not runs:
+        sys.exit("No run to replay in %s and %s" % (args.trace_dir, args.time_dir))
+    os.makedirs(args.time_out, exist_ok=True)
+    # So that trace_consumer.py --time-dir converts the stamps with the frequency of the recording
+    metadata_utils.complete(args.time_out, metadata)
+    with connect(args.sink) as sink:
+        streams = 0
+        for run in runs:
+            print("run %d: %s" % (run['run'], os.path.basename(run['time'])))
+            streams = replay_run(sink, run, streams, args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,207 @@
+import os
+import sys
+import glob
+import shlex
+import shutil
+import argparse
+import subprocess
+
+import numpy as np
+
+import frame_utils
+import metadata_utils
+import report_utils
+import sequential_utils
+import trace_gen
+import trace_utils
+
+# Measure the textures of exp1/exp2 until their differences are known.
+#
+# exp1.sh and exp2.sh sample every texture of input.txt for a fixed 400 s,
+# although most compressible/non-compressible pairs separate within seconds.
+# This controller groups the lines of input.txt into configurations (the
+# textures of one workload, size and layer) and measures a configuration in
+# rounds: one driver run over its textures, --round-samples IMC samples each,
+# after which the frames of the round are folded into a SequentialComparison
+# of every compressible vs non-compressible pattern pair, on render time and
+# DRAM traffic. A configuration stops once every difference is resolved (see
+# sequential_utils.py), or after --max-samples per texture, the fixed budget
+# of the scripts.
+#
+# Round r of a configuration is kept in DATA/<configuration>/round-<r>/out and
+# /time, in the layout of exp*.sh, so the analysers read every round as is,
+# and DATA/sequential.json summarizes the stopping decisions. --simulate
+# writes the rounds with trace_gen.py instead of running the driver, to try
+# the stopping rule (and its options) without the hardware.
+#
+# Usage (as root, from scripts/exp2 after building input.txt):
+#   python3 ../../../util/trace_sequential.py input.txt ../../data/exp2-seq --driver ../../bin/driver
+#   python trace_sequential.py input.txt /tmp/seq --simulate "--compressibility 0.05 --noise 0.3"
+
+METRICS = ("Rendering time", "DRAM traffic")
+SUMMARY_FILE = "sequential.json"
+
+
+def read_textures(fn):
+    """(command, workload, size, pattern, layer) of every texture line of an input.txt"""
+    textures = []
+    with open(fn) as f:
+        for line in f:
+            command = line.strip()
+            if not command:
+                continue
+            # [wrapper ...] texture <pattern> <layer> <size> <workload> <print-time>: the texture
+            # arguments are always the last five fields, whatever runs the binary
+            pattern, layer, size, workload, _ = command.split()[-5:]
+            textures.append((command, int(workload), int(size), float(pattern), int(layer)))
+    return textures
+
+
+def configurations(textures):
+    """Textures grouped by (workload, size, layer), in the order of input.txt"""
+    groups = {}
+    for texture in textures:
+        groups.setdefault(texture[1:3] + texture[4:], []).append(texture)
+    return list(groups.items())
+
+
+def comparison_pairs(patterns, size):
+    """Compressible vs non-compressible pattern pairs, or every pair if all fall in one class"""
+    compressible = [p for p in patterns if trace_gen.compressible(p, size)]
+    other = [p for p in patterns if not trace_gen.compressible(p, size)]
+    if compressible and other:
+        return [(a, b) for a in compressible for b in other]
+    return [(a, b) for i, a in enumerate(patterns) for b in patterns[i + 1:]]
+
+
+def time_name(workload, size, pattern, layer):
+    # See texture.cpp
+    return "time_%d_%d_%.1f_%d.txt" % (workload, size, pattern, layer)
+
+
+def run_driver(textures, samples, round_dir, args):
+    """One driver run over textures, moved into round_dir/out and round_dir/time"""
+    shutil.rmtree("out", ignore_errors=True)
+    os.makedirs("out")
+    for fn in glob.glob("time_*"):
+        os.unlink(fn)
+    with open("input.txt", "w") as f:
+        f.writelines(command + "\n" for command, *_ in textures)
+    subprocess.run(shlex.split(args.driver) + [str(args.gpu), str(args.imc), str(samples), "1", str(int(args.binary))], check=True)
+    # What metadata_utils.py adds in exp*.sh
+    metadata_utils.complete("out", metadata_utils.cached_probe())
+    os.makedirs(os.path.join(round_dir, "time"))
+    shutil.move("out", os.path.join(round_dir, "out"))
+    for fn in glob.glob("time_*"):
+        shutil.move(fn, os.path.join(round_dir, "time"))
+
+
+def simulate(textures, samples, round_dir, sim, rng):
+    """The traces the driver run of run_driver would write, from trace_gen.py"""
+    out_dir, time_dir = os.path.join(round_dir, "out"), os.path.join(round_dir, "time")
+    os.makedirs(out_dir)
+    os.makedirs(time_dir)
+    for index, (_, workload, size, pattern, layer) in enumerate(textures):
+        sim.size = size
+        trace_gen.run(out_dir, time_dir, index, workload, pattern, layer, samples, sim, rng)
+    trace_gen.write_metadata(out_dir, samples, sim)
+
+
+def round_frames(round_dir, textures, args):
+    """Yield the pattern and per-frame metrics of every texture of a round"""
+    out_dir, time_dir = os.path.join(round_dir, "out"), os.path.join(round_dir, "time")
+    CPUFreq = metadata_utils.resolve(args, out_dir)['tsc_hz'] / 1e9
+    for index, (_, workload, size, pattern, layer) in enumerate(textures):
+        # The driver numbers the runs of each of its invocations from 0
+        imc = glob.glob(os.path.join(out_dir, "imc_%d_%06d.*" % (index, index)))
+        time = os.path.join(time_dir, time_name(workload, size, pattern, layer))
+        if not imc or not os.path.exists(time):
+            print("Warning: No traces of %s in %s" % (time_name(workload, size, pattern, layer), round_dir), file=sys.stderr)
+            continue
+        timestamps, values = trace_utils.load_imc(imc[0])
+        begin, end = trace_utils.load_time(time)
+        traffic, render_time, _, _ = frame_utils.aggregate_frames(timestamps, values, begin, end, CPUFreq)
+        yield pattern, {"Rendering time": render_time, "DRAM traffic": traffic.sum(axis=1)}
+
+
+def measure(key, textures, data_dir, args, sim, rng):
+    """Measure one configuration round by round until it is resolved or the budget is spent"""
+    workload, size, layer = key
+    label = "w%d-s%d-l%d" % key
+    patterns = [pattern for _, _, _, pattern, _ in textures]
+    comparison = sequential_utils.SequentialComparison(comparison_pairs(patterns, size), METRICS, args.confidence,
+                                                       args.precision, args.min_frames)
+    samples = 0
+    rounds = 0
+    while samples < args.max_samples and not comparison.resolved():
+        n = min(args.round_samples, args.max_samples - samples)
+        round_dir = os.path.join(data_dir, label, "round-%03d" % rounds)
+        if sim is None:
+            run_driver(textures, n, round_dir, args)
+        else:
+            simulate(textures, n, round_dir, sim, rng)
+        for pattern, frames in round_frames(round_dir, textures, args):
+            comparison.update(pattern, frames)
+        samples += n
+        rounds += 1
+        results = comparison.results()
+        print("%s, round %d: %d samples per texture, %d/%d resolved" % (
+            label, rounds, samples, sum(row['resolved'] for row in results), len(results)))
+
+    results = comparison.results()
+    stopped = "resolved" if comparison.resolved() else "cap"
+    print("%s: %s after %d rounds, %d of %d samples per texture" % (label, stopped, rounds, samples, args.max_samples))
+    for row in results:
+        print("\t%.1f vs %.1f, %s: %+f [%f, %f]%s" % (row['a'], row['b'], row['metric'], row['delta'],
+                                                    row['delta_cs'][0], row['delta_cs'][1], "" if row['resolved'] else " (unresolved)"))
+    return {'configuration': label, 'workload': workload, 'size': size, 'layer': layer, 'rounds': rounds,
+            'samples': samples, 'stopped': stopped, 'comparisons': results}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Measure the textures of an input.txt until their differences are resolved')
+    parser.add_argument('input', help='Texture list in the format of input.txt (built by exp1.sh or exp2.sh)')
+    parser.add_argument('data_dir', help='New directory for the rounds and the summary')
+    parser.add_argument('--driver', default='../../bin/driver', help='Driver command, e.g. "python3 trace_fake.py driver" (default: %(default)s)')
+    parser.add_argument('--gpu', type=int, default=1, help='Driver <gpu> argument (default: %(default)s)')
+    parser.add_argument('--imc', type=int, default=1, choices=[1, 2],
+                        help='Driver <imc> argument, 1 for read and write (exp2), 2 for combined (exp1) (default: %(default)s)')
+    parser.add_argument('--binary', action='store_true', help='Have the driver write binary traces')
+    parser.add_argument('--round-samples', type=int, default=10000,
+                        help='IMC samples per texture and round, 1 ms each (default: %(default)s)')
+    parser.add_argument('--max-samples', type=int, default=400000,
+                        help='IMC samples per texture after which a configuration stops regardless (default: %(default)s)')
+    parser.add_argument('--simulate', metavar='OPTIONS', nargs='?', const='', default=None,
+                        help='Generate the rounds with trace_gen.py, given its options, instead of running the driver')
+    sequential_utils.add_arguments(parser)
+    metadata_utils.add_arguments(parser)
+    args = parser.parse_args()
+
+    sim, rng = None, None
+    if args.simulate is not None:
+        gen_parser = argparse.ArgumentParser(prog='--simulate')
+        trace_gen.add_arguments(gen_parser)
+        sim = gen_parser.parse_args(shlex.split(args.simulate))
+        sim.imc_columns = 3 if args.imc == 1 else 2
+        sim.binary = args.binary
+        rng = np.random.default_rng(sim.seed)
+    try:
+        os.makedirs(args.data_dir)
+    except FileExistsError:
+        parser.error("%s already exists" % args.data_dir)
+
+    textures = read_textures(args.input)
+    rows = []
+    used = 0
+    for key, group in configurations(textures):
+        rows.append(measure(key, group, args.data_dir, args, sim, rng))
+        used += rows[-1]['samples'] * len(group)
+    report_utils.record("sequential", rows)
+    budget = args.max_samples * len(textures)
+    print("%d of %d texture samples (%.0f%% of the fixed budget)" % (used, budget, 100.0 * used / budget))
+    with open(os.path.join(args.data_dir, SUMMARY_FILE), "w") as f:
+        report_utils.dump(f, samples=used, budget=budget, confidence=args.confidence, precision=args.precision)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,514 @@
+import os
+import sys
+import itertools
+
+import numpy as np
+
+# Bulk loaders for every trace the measurement code emits.
+#
+#   time_*         texture: one TSC stamp per line, (begin, end) per frame
+#   imc_*          driver:  [value, ...,] TSC (1, 2 or 3 columns)
+#   mem_*          driver:  rss, peak rss, vm, peak vm (KiB)
+#   gpu_*          driver:  Intel "freq, rcs0-busy, TSC" or AMD "freq, TSC"
+#   nvidia_gpu_*   driver:  freq, utilization, TSC
+#   w<bw>_<size>   texture: one LLC walk time per line (03-llc)
+#
+# All loaders parse in C and return typed NumPy arrays, so every analysis
+# script picks up format changes from here.
+#
+# The driver prints its columns with printf formats, so a trace has a few
+# line layouts (width, separators and decimal points in the same places):
+# one per digit count of every column. parse_text() groups the lines by
+# width, then by the places of their separators (layout_keys), so every line
+# is parsed once however many layouts there are. The lines of a layout are
+# parsed as a matrix of characters: every byte is checked against the
+# layout, and the digits of every column are summed up in runs of RUN_DIGITS
+# by one matrix product per block of lines, exact in float32. Timestamps come
+# out as exact int64, and floats as mantissa / 10^decimals correctly rounded,
+# the value strtod would give. Lines that are not plain numbers (signs,
+# exponents) are parsed one by one.
+#
+# The driver traces can also be written as binary fixed records (driver
+# option <binary>, see util/trace-utils.h). Those are detected by their magic
+# and memory-mapped instead of parsed.
+
+MEM_DTYPE = np.dtype([('rss', np.int64), ('peak_rss', np.int64), ('vm', np.int64), ('peak_vm', np.int64)])
+
+GPU_DTYPES = {
+    'intel': np.dtype([('freq', np.int64), ('busy', np.int64), ('time', np.int64)]),
+    'amd': np.dtype([('freq', np.int64), ('time', np.int64)]),
+    'nvidia': np.dtype([('freq', np.int64), ('util', np.int64), ('time', np.int64)]),
+}
+
+
+# Binary trace format, must match util/trace-utils.h
+TRACE_MAGIC = b'GPUZTRC'
+TRACE_VERSION = 1
+TRACE_MAX_COLUMNS = 8
+TRACE_BACKENDS = ['imc_legacy', 'imc_alder', 'imc_amd', 'gpu_intel', 'gpu_amd', 'gpu_nvidia', 'mem']
+TRACE_HEADER_DTYPE = np.dtype([
+    ('magic', 'S8'), ('version', '<u4'), ('backend', '<u4'), ('n_columns', '<u4'), ('record_size', '<u4'),
+    ('columns', [('name', 'S15'), ('type', 'S1')], (TRACE_MAX_COLUMNS,)),
+])
+TRACE_TYPES = {'f': '<f8', 'i': '<i8'}
+
+# Digits of a run of parse_rows, their sum stays below 2^24 (exact in float32)
+RUN_DIGITS = 7
+# Lines parse_rows converts at once, small enough for the block to stay in cache
+PARSE_BLOCK = 2048
+# Odd multiplier (64-bit FNV prime) folding the separator masks of wide lines into one layout key
+LAYOUT_HASH = 0x100000001b3
+# x87 extended precision, which rounds the quotients of 64-bit mantissas to float64 (almost always) correctly
+EXTENDED = np.finfo(np.longdouble).nmant >= 63
+
+# Streaming sink messages (struct trace_message), each followed by length bytes of payload
+TRACE_MSG_OPEN = 1
+TRACE_MSG_RECORD = 2
+TRACE_MSG_CLOSE = 3
+TRACE_MESSAGE_DTYPE = np.dtype([
+    ('type', '<u4'), ('stream', '<u4'), ('length', '<u4'), ('run', '<i4'), ('selector', '<i4'), ('reserved', '<u4'),
+])
+
+
+def _count_columns(fn):
+    with open(fn) as f:
+        return f.readline().count(',') + 1
+
+
+def fixed_layout(line, kinds):
+    """Layout of a text trace line for parse_rows, None if a column is not a plain unsigned number.
+
+    Returns (lower, upper, weights, columns): a digit has lower 48 ('0') and
+    upper 9, every other byte lower itself and upper 0; weights maps the
+    digits onto runs of RUN_DIGITS; columns holds (kind, [(run, scale), ...],
+    digits, decimals, (start, stop) of the number in the line) per column.
+    """
+    fields = line[:-1].split(b',')
+    if not line.endswith(b'\n') or len(fields) != len(kinds):
+        return None
+    lower = np.frombuffer(line, dtype=np.uint8).copy()
+    upper = np.zeros(len(line), dtype=np.uint8)
+    runs = []
+    columns = []
+    start = 0
+    for field, kind in zip(fields, kinds):
+        number = field.strip(b' ')
+        offset = start + len(field) - len(field.lstrip(b' '))
+        parts = number.split(b'.')
+        if not all(part.isdigit() for part in parts) or len(parts) > (2 if kind == 'f' else 1):
+            return None
+        digits = [offset + i for i, c in enumerate(number) if c != ord('.')]
+        # The mantissa has to fit in 64 bits
+        if len(digits) > 19:
+            return None
+        lower[digits] = ord('0')
+        upper[digits] = 9
+        # Runs from the least significant digit on
+        scales = []
+        for stop in range(len(digits), 0, -RUN_DIGITS):
+            scales.append((len(runs), 10 ** (len(digits) - stop)))
+            runs.append(digits[max(stop - RUN_DIGITS, 0):stop])
+        columns.append((kind, scales, len(digits), len(parts[1]) if len(parts) == 2 else 0, (offset, offset + len(number))))
+        start += len(field) + 1
+    weights = np.zeros((len(line), len(runs)), dtype=np.float32)
+    for i, run in enumerate(runs):
+        weights[run, i] = 10.0 ** np.arange(len(run) - 1, -1, -1)
+    return lower, upper, weights, columns
+
+
+def layout_keys(lines):
+    """Key of the layout of every line (rows of bytes), the same for lines with their separators in the same places"""
+    marks = np.zeros((len(lines), -(-lines.shape[1] // 64) * 64), dtype=bool)
+    marks[:, :lines.shape[1]] = lines < ord('0')
+    words = np.packbits(marks.reshape(-1)).view(np.uint64).reshape(len(lines), -1)
+    keys = words[:, 0].copy()
+    for i in range(1, words.shape[1]):
+        keys = keys * np.uint64(LAYOUT_HASH) ^ words[:, i]
+    return keys
+
+
+def mantissa_to_float(mantissa, decimals, text):
+    """mantissa / 10^decimals correctly rounded for 64-bit mantissas, text holds the digits of every value (rows of bytes)"""
+    if not EXTENDED:
+        return np.array([float(digits.tobytes()) for digits in text])
+    # The quotient in extended precision only rounds the wrong way to float64
+    # within 2^-10 ulp of a midpoint between doubles: those, and powers of two
+    # (a smaller gap below them), are parsed one by one
+    exact = mantissa.astype(np.longdouble) / np.longdouble(10.0 ** decimals)
+    value = exact.astype(np.float64)
+    unsure = np.abs(exact - value) > np.spacing(value) * (0.5 - 2.0 ** -10)
+    unsure |= value.view(np.uint64) & np.uint64(2 ** 52 - 1) == 0
+    for i in np.flatnonzero(unsure):
+        value[i] = float(text[i].tobytes())
+    return value
+
+
+def parse_rows(lines, layout, kinds):
+    """Parse the lines (one per row of bytes, all as wide as the layout) with a layout of fixed_layout.
+
+    Returns one array per column, and the mask of the lines that have the
+    layout (the values of the others are garbage).
+    """
+    lower, upper, weights, columns = layout
+    runs = np.empty((len(lines), weights.shape[1]), dtype=np.float32)
+    fits = np.ones(len(lines), dtype=bool)
+    for start in range(0, len(lines), PARSE_BLOCK):
+        digits = lines[start:start + PARSE_BLOCK] - lower
+        # Separators out of place or a non-digit where a digit belongs
+        wrong = digits > upper
+        if wrong.any():
+            fits[start:start + PARSE_BLOCK] = ~wrong.any(axis=1)
+        np.matmul(digits.astype(np.float32), weights, out=runs[start:start + PARSE_BLOCK])
+
+    result = []
+    for kind, scales, n_digits, decimals, (begin, end) in columns:
+        if kind == 'i':
+            mantissa = runs[:, scales[0][0]].astype(np.uint64)
+            for run, scale in scales[1:]:
+                mantissa += runs[:, run].astype(np.uint64) * np.uint64(scale)
+            if n_digits == 19:
+                fits &= mantissa < np.uint64(2 ** 63)
+            result.append(mantissa.view(np.int64))
+            continue
+        # Exact in float64 below 2^53, and then the division rounds correctly
+        mantissa = runs[:, scales[0][0]].astype(np.float64)
+        for run, scale in scales[1:]:
+            mantissa += runs[:, run].astype(np.float64) * scale
+        value = mantissa / 10.0 ** decimals
+        if n_digits > 15:
+            big = np.flatnonzero((mantissa >= 2.0 ** 53) & fits)
+            if len(big):
+                exact = runs[big, scales[0][0]].astype(np.uint64)
+                for run, scale in scales[1:]:
+                    exact += runs[big, run].astype(np.uint64) * np.uint64(scale)
+                value[big] = mantissa_to_float(exact, decimals, lines[big, begin:end])
+        result.append(value)
+    return result, fits
+
+
+def parse_line(line, kinds):
+    """Parse one text trace line (bytes) the way np.loadtxt would, None for a blank line"""
+    if not line.strip():
+        return None
+    fields = line.split(b',')
+    if len(fields) != len(kinds):
+        raise ValueError("%r has %d columns instead of %d" % (line, len(fields), len(kinds)))
+    return [float(field) if kind == 'f' else int(field) for field, kind in zip(fields, kinds)]
+
+
+def _parse_layout(result, blank, index, lines, kinds):
+    # Lines of the layout of the first one into result[...][index], returns the others as (index, lines)
+    layout = fixed_layout(lines[0].tobytes(), kinds)
+    if layout is None:
+        # Not plain numbers
+        values = parse_line(lines[0].tobytes(), kinds)
+        if values is None:
+            blank.append(index[0])
+        else:
+            for column, value in zip(result, values):
+                column[index[0]] = value
+        return index[1:], lines[1:]
+    values, fits = parse_rows(lines, layout, kinds)
+    if fits.all():
+        for column, value in zip(result, values):
+            column[index] = value
+        return index[:0], lines[:0]
+    for column, value in zip(result, values):
+        column[index[fits]] = value[fits]
+    return index[~fits], lines[~fits]
+
+
+def parse_text(data, kinds):
+    """Parse comma-separated text lines (bytes), one array per column.
+
+    kinds holds 'f' (float64) or 'i' (int64) per column. The lines are
+    grouped by layout (see fixed_layout) and parsed in bulk, the ones that
+    are not plain numbers one by one.
+    """
+    dtypes = [np.float64 if kind == 'f' else np.int64 for kind in kinds]
+    size = data.rfind(b'\n') + 1
+    buf = np.frombuffer(data, dtype=np.uint8, count=size)
+    tail = parse_line(data[size:], kinds)
+    width = data.find(b'\n') + 1
+    result = None
+    if width and size % width == 0:
+        # Most traces have a single layout, all lines are then as wide as the first one
+        layout = fixed_layout(data[:width], kinds)
+        if layout is not None:
+            result, fits = parse_rows(buf.reshape(-1, width), layout, kinds)
+            if not fits.all():
+                result = None
+
+    if result is None:
+        ends = np.flatnonzero(buf == ord('\n'))
+        starts = np.concatenate(([0], ends[:-1] + 1))
+        widths = ends + 1 - starts
+        result = [np.empty(len(ends), dtype=dtype) for dtype in dtypes]
+        blank = []
+        # The lines of every width, by layout. A stable sort of 16-bit keys is a radix sort
+        order = np.argsort(widths.astype(np.int16) if widths.max() < 2 ** 15 else widths, kind='stable')
+        bounds = np.concatenate(([0], np.flatnonzero(np.diff(widths[order])) + 1, [len(order)]))
+        for first, last in zip(bounds[:-1], bounds[1:]):
+            index = order[first:last]
+            width = int(widths[index[0]])
+            lines = np.lib.stride_tricks.as_strided(buf, shape=(size - width + 1, width), strides=(1, 1))[starts[index]]
+            index, lines = _parse_layout(result, blank, index, lines, kinds)
+            if not len(index):
+                continue
+            # Several layouts of this width: one pass over the lines of each
+            keys = layout_keys(lines)
+            by_key = np.argsort(keys, kind='stable')
+            index, lines, keys = index[by_key], lines[by_key], keys[by_key]
+            groups = np.concatenate(([0], np.flatnonzero(np.diff(keys)) + 1, [len(keys)]))
+            for begin, end in zip(groups[:-1], groups[1:]):
+                group = index[begin:end], lines[begin:end]
+                while len(group[0]):
+                    group = _parse_layout(result, blank, *group, kinds)
+        if blank:
+            result = [np.delete(column, blank) for column in result]
+
+    if tail is not None:
+        result = [np.append(column, value).astype(dtype) for column, value, dtype in zip(result, tail, dtypes)]
+    return result
+
+
+def load_text(fn, dtype):
+    """Load a comma-separated text trace as a structured array of dtype (float64 and int64 fields)"""
+    dtype = np.dtype(dtype)
+    with open(fn, 'rb') as f:
+        columns = parse_text(f.read(), ''.join(dtype[name].kind for name in dtype.names))
+    records = np.empty(len(columns[0]), dtype=dtype)
+    for name, values in zip(dtype.names, columns):
+        records[name] = values
+    return records
+
+
+def parse_imc(data, n_cols):
+    """Parse the lines (bytes) of a text imc_* trace of n_cols >= 2 columns as (timestamps, values)"""
+    columns = parse_text(data, 'f' * (n_cols - 1) + 'i')
+    return columns[-1], np.column_stack(columns[:-1])
+
+
+def is_binary(fn):
+    """True if fn is a binary fixed-record trace"""
+    with open(fn, 'rb') as f:
+        return f.read(len(TRACE_MAGIC)) == TRACE_MAGIC
+
+
+def parse_header(data, name="header"):
+    """Decode the header bytes of a binary trace as (backend, [(column, type), ...])"""
+    header = np.frombuffer(data[:TRACE_HEADER_DTYPE.itemsize], dtype=TRACE_HEADER_DTYPE)
+    if len(header) == 0 or header[0]['magic'] != TRACE_MAGIC or header[0]['version'] != TRACE_VERSION:
+        raise ValueError("%s is not a version %d binary trace" % (name, TRACE_VERSION))
+    header = header[0]
+    columns = [(c['name'].decode(), c['type'].decode()) for c in header['columns'][:header['n_columns']]]
+    return TRACE_BACKENDS[header['backend']], columns
+
+
+def encode_header(backend, columns):
+    """Header bytes of a binary trace, the inverse of parse_header"""
+    header = np.zeros(1, dtype=TRACE_HEADER_DTYPE)
+    header['magic'] = TRACE_MAGIC
+    header['version'] = TRACE_VERSION
+    header['backend'] = TRACE_BACKENDS.index(backend)
+    header['n_columns'] = len(columns)
+    header['record_size'] = 8 * len(columns)
+    for i, (name, kind) in enumerate(columns):
+        header['columns'][0, i] = (name.encode(), kind.encode())
+    return header.tobytes()
+
+
+def read_header(fn):
+    """Read the header of a binary trace as (backend, [(column, type), ...])"""
+    with open(fn, 'rb') as f:
+        return parse_header(f.read(TRACE_HEADER_DTYPE.itemsize), fn)
+
+
+def load_binary(fn):
+    """Memory-map the records of a binary trace as a structured array.
+
+    A partial last record (the driver was stopped while writing it) is left
+    out with a warning.
+    """
+    _, columns = read_header(fn)
+    dtype = np.dtype([(name, TRACE_TYPES[kind]) for name, kind in columns])
+    n_records, rest = divmod(os.path.getsize(fn) - TRACE_HEADER_DTYPE.itemsize, dtype.itemsize)
+    if rest:
+        print("Warning: Dropping the %d trailing bytes of a partial record of %s" % (rest, fn), file=sys.stderr)
+    if n_records == 0:
+        return np.zeros(0, dtype=dtype)
+    return np.memmap(fn, dtype=dtype, mode='r', offset=TRACE_HEADER_DTYPE.itemsize, shape=(n_records,))
+
+
+def save_binary(fn, backend, columns, data):
+    """Write a binary trace, data holds one array per (column, type)"""
+    records = np.empty(len(data[0]) if columns else 0, dtype=[(name, TRACE_TYPES[kind]) for name, kind in columns])
+    for (name, _), values in zip(columns, data):
+        records[name] = values
+    with open(fn, 'wb') as f:
+        f.write(encode_header(backend, columns))
+        records.tofile(f)
+
+
+def load_time(fn):
+    """Load the (begin, end) TSC pairs of every frame in a time_* trace"""
+    with open(fn, 'rb') as f:
+        stamps = np.fromstring(f.read(), dtype=np.int64, sep=' ')
+    # An unterminated last frame is dropped
+    stamps = stamps[:len(stamps) - (len(stamps) % 2)]
+    return stamps[0::2], stamps[1::2]
+
+
+def load_frame_cycles(fn):
+    """Load the rendering time of every frame in a time_* trace, in CPU cycles"""
+    begin, end = load_time(fn)
+    return end - begin
+
+
+def load_imc(fn):
+    """Load an imc_* trace as (timestamps, values).
+
+    values has one column per counter (read and write, or combined). A
+    single-column trace carries no timestamp and returns None for it.
+    """
+    if is_binary(fn):
+        # All columns are 8 bytes wide: view the records as a 2D array
+        n_cols = len(read_header(fn)[1])
+        raw = load_binary(fn).view('<f8').reshape(-1, n_cols)
+        return raw.view('<i8')[:, -1], raw[:, :-1]
+    n_cols = _count_columns(fn)
+    with open(fn, 'rb') as f:
+        data = f.read()
+    if n_cols == 1:
+        return None, np.fromstring(data, dtype=np.float64, sep=' ').reshape(-1, 1)
+    return parse_imc(data, n_cols)
+
+
+def iter_imc(fn, chunk_size=100000):
+    """Yield an imc_* trace as (timestamps, values) chunks of at most chunk_size samples"""
+    if is_binary(fn):
+        n_cols = len(read_header(fn)[1])
+        raw = load_binary(fn).view('<f8').reshape(-1, n_cols)
+        for start in range(0, len(raw), chunk_size):
+            chunk = raw[start:start + chunk_size]
+            yield chunk.view('<i8')[:, -1], chunk[:, :-1]
+        return
+    n_cols = _count_columns(fn)
+    with open(fn, 'rb') as f:
+        while True:
+            lines = b''.join(itertools.islice(f, chunk_size))
+            if not lines:
+                break
+            yield parse_imc(lines, n_cols)
+
+
+class TraceTail:
+    """Follow a trace that is still being written.
+
+    Every call reads only the bytes appended since the previous one. An
+    incomplete last line (or binary record) is kept until the writer
+    completes it.
+    """
+
+    def __init__(self, fn):
+        self.fn = fn
+        self.offset = 0
+        self.rest = b''
+
+    def _append(self):
+        try:
+            with open(self.fn, 'rb') as f:
+                f.seek(self.offset)
+                data = f.read()
+        except FileNotFoundError:
+            return
+        self.offset += len(data)
+        self.rest += data
+
+    def read_lines(self):
+        """Complete lines appended since the last call, as bytes"""
+        self._append()
+        cut = self.rest.rfind(b'\n') + 1
+        lines, self.rest = self.rest[:cut], self.rest[cut:]
+        return lines
+
+
+class ImcTail(TraceTail):
+    """Follow an imc_* trace (text or binary), see read_samples"""
+
+    def __init__(self, fn):
+        super().__init__(fn)
+        self.binary = None
+        self.n_cols = None
+
+    def read_samples(self):
+        """Samples completed since the last call as (timestamps, values), like load_imc"""
+        self._append()
+        if self.binary is None and len(self.rest) >= len(TRACE_MAGIC):
+            self.binary = self.rest.startswith(TRACE_MAGIC)
+        if self.binary and self.n_cols is None and len(self.rest) >= TRACE_HEADER_DTYPE.itemsize:
+            header = np.frombuffer(self.rest[:TRACE_HEADER_DTYPE.itemsize], dtype=TRACE_HEADER_DTYPE)[0]
+            self.n_cols = int(header['n_columns'])
+            self.rest = self.rest[TRACE_HEADER_DTYPE.itemsize:]
+        if self.binary is None or (self.binary and self.n_cols is None):
+            return np.zeros(0, dtype=np.int64), None
+
+        if self.binary:
+            cut = len(self.rest) - len(self.rest) % (8 * self.n_cols)
+            records, self.rest = self.rest[:cut], self.rest[cut:]
+            raw = np.frombuffer(records, dtype='<f8').reshape(-1, self.n_cols)
+            return raw.view('<i8')[:, -1], raw[:, :-1]
+
+        cut = self.rest.rfind(b'\n') + 1
+        lines, self.rest = self.rest[:cut], self.rest[cut:]
+        if not lines:
+            return np.zeros(0, dtype=np.int64), None
+        if self.n_cols is None:
+            self.n_cols = lines[:lines.index(b'\n')].count(b',') + 1
+        return parse_imc(lines, self.n_cols)
+
+
+class TimeTail(TraceTail):
+    """Follow a time_* trace, see read_frames"""
+
+    def __init__(self, fn):
+        super().__init__(fn)
+        self.pending = np.zeros(0, dtype=np.int64)
+
+    def read_frames(self):
+        """(begin, end) TSC pairs of the frames completed since the last call"""
+        stamps = np.fromstring(self.read_lines(), dtype=np.int64, sep=' ')
+        stamps = np.concatenate((self.pending, stamps))
+        # A frame whose end is not written yet waits for the next call
+        n_frames = len(stamps) // 2
+        self.pending = stamps[2 * n_frames:]
+        return stamps[0:2 * n_frames:2], stamps[1:2 * n_frames:2]
+
+
+def load_mem(fn):
+    """Load a mem_* trace as a structured array (see MEM_DTYPE)"""
+    if is_binary(fn):
+        return load_binary(fn)
+    return load_text(fn, MEM_DTYPE)
+
+
+def gpu_layout(fn):
+    """Guess the layout of a GPU trace from its name and column count"""
+    if fn.split("/")[-1].startswith("nvidia_gpu"):
+        return 'nvidia'
+    return 'intel' if _count_columns(fn) == 3 else 'amd'
+
+
+def load_gpu(fn, layout=None):
+    """Load a gpu_* or nvidia_gpu_* trace as a structured array (see GPU_DTYPES)"""
+    if is_binary(fn):
+        return load_binary(fn)
+    if layout is None:
+        layout = gpu_layout(fn)
+    return load_text(fn, GPU_DTYPES[layout])
+
+
+def load_readings(fn):
+    """Load a single-column trace of readings (e.g. LLC walk times)"""
+    with open(fn, 'rb') as f:
+        return np.fromstring(f.read(), dtype=np.float64, sep=' ')
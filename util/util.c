@@ -1,5 +1,6 @@
 #include "util.h"
 #include <stdarg.h>
+#include <time.h>
 
 /*
  * Gets the value Time Stamp Counter
@@ -17,6 +18,25 @@ uint64_t get_time(void)
 	return cycles;
 }
 
+/*
+ * Measures the Time Stamp Counter frequency (Hz) against CLOCK_MONOTONIC_RAW
+ * over 100 ms, i.e. the frequency to convert the get_time() timestamps with
+ */
+double tsc_frequency(void)
+{
+	struct timespec start, end;
+	struct timespec interval = {0, 100000000L};
+
+	clock_gettime(CLOCK_MONOTONIC_RAW, &start);
+	uint64_t tsc_start = get_time();
+	nanosleep(&interval, NULL);
+	clock_gettime(CLOCK_MONOTONIC_RAW, &end);
+	uint64_t tsc_end = get_time();
+
+	double seconds = (end.tv_sec - start.tv_sec) + (end.tv_nsec - start.tv_nsec) / 1e9;
+	return (tsc_end - tsc_start) / seconds;
+}
+
 /*
  * Pin thread to CPU core_ID
  */
@@ -17,6 +17,8 @@
 
 uint64_t get_time(void);
 
+double tsc_frequency(void);
+
 void pin_cpu(size_t core_ID);
 
 void getMemory(int *currRealMem, int *peakRealMem, int *currVirtMem, int *peakVirtMem, int pid);